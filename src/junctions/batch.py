@@ -0,0 +1,413 @@
+from __future__ import annotations
+
+import math
+import uuid
+from typing import TYPE_CHECKING, Final, Mapping, Sequence
+
+import numpy as np
+
+from junctions.rng import counter_uniform_array
+from junctions.state.vehicle_positions import VehiclePositions
+from junctions.stepper import VEHICLE_SEPARATION_LIMIT
+from junctions.turning import TurningTables
+
+if TYPE_CHECKING:
+    from junctions.network import LaneRef, Network
+
+# Extra key for the arrivals random stream, so it doesn't coincide with the
+# lane choice stream
+_ARRIVALS_STREAM: Final = 1
+
+
+def _scatter_rows(
+    n_rows: int, rows: np.ndarray, values: np.ndarray, fill: float | int
+) -> np.ndarray:
+    """Lay out values (each belonging to one of the rows) as an array with
+    one row per replica, filling the unused slots with `fill`. Values keep
+    their order within each row."""
+    order = np.argsort(rows, kind="stable")
+    rows = rows[order]
+    row_start = np.searchsorted(rows, rows)
+    columns = np.arange(rows.shape[0]) - row_start
+    out = np.full(
+        (n_rows, int(columns.max()) + 1 if rows.shape[0] else 0),
+        fill,
+        dtype=values.dtype,
+    )
+    out[rows, columns] = values[order]
+    return out
+
+
+def _poisson(u: np.ndarray, mean: float) -> np.ndarray:
+    # Inverse transform sampling, one uniform per sample. The probabilities
+    # are worked out in log space, so they don't underflow for large means,
+    # and only up to well past the mean: any uniform beyond the last value of
+    # the CDF (which rounding can leave just short of 1) gets the largest
+    # count.
+    if mean <= 0:
+        return np.zeros(u.shape, dtype=np.int64)
+    k_max = int(mean + 10 * math.sqrt(mean) + 10)
+    k = np.arange(k_max + 1)
+    log_factorial = np.concatenate(([0.0], np.cumsum(np.log(k[1:]))))
+    cdf = np.cumsum(np.exp(k * math.log(mean) - mean - log_factorial))
+    return np.minimum(np.searchsorted(cdf, u), k_max).astype(np.int64)
+
+
+class BatchedVehiclePositions:
+    """Vehicle positions for K independent replicas of the same network.
+
+    For each lane there is a (K, n) array of positions, and a matching array
+    of vehicle IDs. Each row is one replica, sorted in ascending order of
+    position like `VehiclePositions`, but right aligned: empty slots at the
+    start of the row have position -inf (and ID -1), so the lead vehicle on
+    every replica is in the last column. Rows grow (and shrink) together as
+    vehicles are added and removed.
+
+    Vehicle IDs are integers, counting up from 1 separately in each replica.
+    """
+
+    def __init__(self, network: Network, replicas: int) -> None:
+        self._network = network
+        self._replicas = replicas
+        self._lane_refs = sorted(network.all_lanes(), key=network.lane_index)
+        self._positions = [
+            np.full((replicas, 0), -np.inf, dtype=np.float32) for _ in self._lane_refs
+        ]
+        self._ids = [
+            np.full((replicas, 0), -1, dtype=np.int64) for _ in self._lane_refs
+        ]
+        self._next_id = np.ones(replicas, dtype=np.int64)
+
+    @property
+    def replicas(self) -> int:
+        return self._replicas
+
+    @property
+    def lane_refs(self) -> Sequence[LaneRef]:
+        """The lanes of the network, in lane index order"""
+        return self._lane_refs
+
+    @property
+    def lane_positions(self) -> Sequence[np.ndarray]:
+        """The (K, n) positions array of each lane, by lane index. The arrays
+        can be changed in place, as long as the rows stay sorted."""
+        return self._positions
+
+    @property
+    def lane_ids(self) -> Sequence[np.ndarray]:
+        """The (K, n) vehicle IDs array of each lane, by lane index"""
+        return self._ids
+
+    def positions(self, lane_ref: LaneRef) -> np.ndarray:
+        return self._positions[self._network.lane_index(lane_ref)]
+
+    def ids(self, lane_ref: LaneRef) -> np.ndarray:
+        return self._ids[self._network.lane_index(lane_ref)]
+
+    def counts(self, lane_ref: LaneRef) -> np.ndarray:
+        """Number of vehicles on the lane in each replica"""
+        return np.count_nonzero(
+            self._ids[self._network.lane_index(lane_ref)] >= 0, axis=1
+        )
+
+    def vehicle_counts(self) -> np.ndarray:
+        """Number of vehicles in each replica"""
+        return sum(
+            (np.count_nonzero(ids >= 0, axis=1) for ids in self._ids),
+            np.zeros(self._replicas, dtype=np.int64),
+        )
+
+    def create_vehicle(self, replica: int, lane_ref: LaneRef, position: float) -> int:
+        new_id = int(self._next_id[replica])
+        self._next_id[replica] += 1
+        positions = np.full((self._replicas, 1), -np.inf, dtype=np.float32)
+        ids = np.full((self._replicas, 1), -1, dtype=np.int64)
+        positions[replica] = position
+        ids[replica] = new_id
+        self.insert(self._network.lane_index(lane_ref), positions, ids)
+        return new_id
+
+    def create_vehicles(self, lane_ref: LaneRef, positions: np.ndarray) -> np.ndarray:
+        """Add a vehicle to the lane in every replica where `positions` is
+        finite. Returns the new IDs (-1 where no vehicle was added)."""
+        positions = np.asarray(positions, dtype=np.float32)
+        added = np.isfinite(positions)
+        ids = np.where(added, self._next_id, -1)
+        self._next_id += added
+        self.insert(
+            self._network.lane_index(lane_ref),
+            np.where(added, positions, -np.inf)[:, None],
+            ids[:, None],
+        )
+        return ids
+
+    def insert(self, lane_index: int, positions: np.ndarray, ids: np.ndarray) -> None:
+        """Add (K, m) arrays of vehicles to the lane, with -inf positions and
+        -1 IDs in the slots of replicas that get fewer than m"""
+        # New vehicles go in front of the existing ones so that, after a
+        # stable sort, they end up before vehicles at the same position (as
+        # with the searchsorted() insert in VehiclePositions)
+        positions = np.hstack((positions, self._positions[lane_index]))
+        ids = np.hstack((ids, self._ids[lane_index]))
+        self._store_sorted(lane_index, positions, ids)
+
+    def remove(self, lane_index: int, removed: np.ndarray) -> None:
+        """Remove the vehicles where the (K, n) mask `removed` is set"""
+        positions = np.where(removed, -np.inf, self._positions[lane_index])
+        ids = np.where(removed, -1, self._ids[lane_index])
+        self._store_sorted(lane_index, positions, ids)
+
+    def _store_sorted(
+        self, lane_index: int, positions: np.ndarray, ids: np.ndarray
+    ) -> None:
+        order = np.argsort(positions, axis=1, kind="stable")
+        positions = np.take_along_axis(positions, order, axis=1)
+        ids = np.take_along_axis(ids, order, axis=1)
+        # drop columns that are empty in every replica
+        width = int(np.count_nonzero(ids >= 0, axis=1).max(initial=0))
+        self._positions[lane_index] = positions[:, positions.shape[1] - width :]
+        self._ids[lane_index] = ids[:, ids.shape[1] - width :]
+
+    def replica(self, replica: int) -> VehiclePositions:
+        """Copy of one replica as a VehiclePositions (with `UUID(int=id)` IDs)"""
+        lane_refs = []
+        positions = []
+        ids = []
+        for lane_ref, lane_positions, lane_ids in zip(
+            self._lane_refs, self._positions, self._ids
+        ):
+            present = lane_ids[replica] >= 0
+            lane_refs += [lane_ref] * int(np.count_nonzero(present))
+            positions += lane_positions[replica][present].tolist()
+            ids += [uuid.UUID(int=int(i)) for i in lane_ids[replica][present]]
+        vehicle_positions = VehiclePositions()
+        vehicle_positions.create_vehicles(lane_refs, positions, ids)
+        return vehicle_positions
+
+
+class BatchedStepper:
+    """Steps K replicas of a network together.
+
+    Follows the same rules as `Stepper`, but each stage (wait flags, moving
+    vehicles, vehicles leaving lanes) works on one lane at a time across all
+    the replicas at once, so small networks can be replicated many times for
+    little more than the cost of one.
+
+    Each replica has its own seed, derived from `seed`. Lane choices are made
+    as in `Stepper(seed=replica_seeds[r])`, so a replica gives the same result
+    as stepping it on its own. Optional `demand` gives a Poisson arrival rate
+    (vehicles per second) for entry lanes, sampled independently in each
+    replica, with vehicles admitted when there is room as in `Demand`.
+    """
+
+    def __init__(
+        self,
+        network: Network,
+        vehicle_positions: BatchedVehiclePositions,
+        seed: int,
+        demand: Mapping[LaneRef, float] | None = None,
+    ) -> None:
+        self._network = network
+        self._vehicle_positions = vehicle_positions
+        replicas = vehicle_positions.replicas
+        self._replica_seeds = np.random.SeedSequence(seed).generate_state(
+            replicas, dtype=np.uint64
+        )
+        self._steps = 0
+        self.exits = np.zeros(replicas, dtype=np.int64)
+
+        lane_refs = sorted(network.all_lanes(), key=network.lane_index)
+        self._lane_refs = lane_refs
+        self._turning = TurningTables(network)
+        self._lane_lengths = [
+            np.float32(network.lane(lane_ref).length) for lane_ref in lane_refs
+        ]
+        self._speed_limits = [
+            np.float32(network.speed_limit(lane_ref)) for lane_ref in lane_refs
+        ]
+        self._successors = [
+            np.array(
+                [
+                    network.lane_index(next_ref)
+                    for next_ref in network.connected_lanes(lane_ref)
+                ],
+                dtype=np.intp,
+            )
+            for lane_ref in lane_refs
+        ]
+
+        # For each lane with priority lanes: its clear time, and for each of
+        # its priority lanes, the priority lane and the lanes feeding it
+        self._priority_rules = []
+        for lane_ref in lane_refs:
+            priority_lanes = [
+                (
+                    network.lane_index(priority_lane_ref),
+                    [
+                        network.lane_index(feeder_lane_ref)
+                        for feeder_lane_ref in network.feeder_lanes(priority_lane_ref)
+                    ],
+                )
+                for priority_lane_ref in network.priority_lanes(lane_ref)
+            ]
+            if priority_lanes:
+                clear_time = network.lane(lane_ref).length / network.speed_limit(
+                    lane_ref
+                )
+                self._priority_rules.append(
+                    (network.lane_index(lane_ref), clear_time, priority_lanes)
+                )
+
+        demand = demand or {}
+        self._demand_lanes = [network.lane_index(lane_ref) for lane_ref in demand]
+        self._demand_rates = list(demand.values())
+        self._pending = np.zeros((replicas, len(demand)), dtype=np.int64)
+        self._wait_flags = np.zeros((replicas, len(lane_refs)), dtype=bool)
+
+    @property
+    def replica_seeds(self) -> np.ndarray:
+        return self._replica_seeds
+
+    @property
+    def wait_flags(self) -> np.ndarray:
+        """(K, lane count) wait flags from the last step"""
+        return self._wait_flags
+
+    @property
+    def pending(self) -> np.ndarray:
+        """(K, demand lanes) vehicles waiting to enter the network"""
+        return self._pending
+
+    def _priority_wait(self) -> np.ndarray:
+        positions = self._vehicle_positions.lane_positions
+        wait_flags = np.zeros_like(self._wait_flags)
+        for lane_index, clear_time, priority_lanes in self._priority_rules:
+            flag = wait_flags[:, lane_index]
+            for priority_lane_index, feeder_lane_indexes in priority_lanes:
+                lane_positions = positions[priority_lane_index]
+                if lane_positions.shape[1]:
+                    flag |= np.isfinite(lane_positions[:, -1])
+                for feeder_lane_index in feeder_lane_indexes:
+                    lane_positions = positions[feeder_lane_index]
+                    if lane_positions.shape[1]:
+                        time_left = (
+                            self._lane_lengths[feeder_lane_index]
+                            - lane_positions[:, -1]
+                        ) / self._speed_limits[feeder_lane_index]
+                        flag |= time_left < clear_time
+        return wait_flags
+
+    def _move_vehicles(self, dt: float) -> None:
+        for lane_index, position in enumerate(self._vehicle_positions.lane_positions):
+            if position.shape[1] == 0:
+                continue
+            movement = np.full_like(
+                position, np.float32(dt) * self._speed_limits[lane_index]
+            )
+            with np.errstate(invalid="ignore"):
+                # gaps between empty slots are nan, which never queue
+                queued = np.diff(position, axis=1) < VEHICLE_SEPARATION_LIMIT
+            movement[:, :-1][queued] = 0
+            position += movement
+
+    def _change_lanes(self) -> None:
+        vehicle_positions = self._vehicle_positions
+        arrivals: dict[int, list[tuple[np.ndarray, np.ndarray, np.ndarray]]] = {}
+
+        for lane_index, (position, ids) in enumerate(
+            zip(vehicle_positions.lane_positions, vehicle_positions.lane_ids)
+        ):
+            lane_length = self._lane_lengths[lane_index]
+            rows, columns = np.nonzero(position >= lane_length)
+            if rows.shape[0] == 0:
+                continue
+
+            removed = np.zeros(position.shape, dtype=bool)
+            successors = self._successors[lane_index]
+            if successors.shape[0] == 0:
+                # leaving the network
+                removed[rows, columns] = True
+                np.add.at(self.exits, rows, 1)
+                vehicle_positions.remove(lane_index, removed)
+                continue
+
+            vehicle_ids = ids[rows, columns]
+            u = counter_uniform_array(
+                self._replica_seeds[rows], vehicle_ids, lane_index
+            )
+            next_lanes = successors[
+                self._turning.table(self._lane_refs[lane_index]).sample(u)
+            ]
+
+            # stuck at the end of the lane on a wait flag
+            waiting = self._wait_flags[rows, next_lanes]
+            position[rows[waiting], columns[waiting]] = lane_length
+
+            moving = ~waiting
+            rows, columns = rows[moving], columns[moving]
+            next_lanes, vehicle_ids = next_lanes[moving], vehicle_ids[moving]
+            t_excess = (position[rows, columns] - lane_length) / self._speed_limits[
+                lane_index
+            ]
+            for next_lane_index in np.unique(next_lanes):
+                to_lane = next_lanes == next_lane_index
+                arrivals.setdefault(int(next_lane_index), []).append(
+                    (
+                        rows[to_lane],
+                        t_excess[to_lane] * self._speed_limits[next_lane_index],
+                        vehicle_ids[to_lane],
+                    )
+                )
+            removed[rows, columns] = True
+            vehicle_positions.remove(lane_index, removed)
+
+        replicas = vehicle_positions.replicas
+        for lane_index, lane_arrivals in arrivals.items():
+            rows = np.concatenate([rows for rows, _, _ in lane_arrivals])
+            new_positions = np.concatenate([p for _, p, _ in lane_arrivals])
+            new_ids = np.concatenate([i for _, _, i in lane_arrivals])
+            vehicle_positions.insert(
+                lane_index,
+                _scatter_rows(replicas, rows, new_positions, -np.inf),
+                _scatter_rows(replicas, rows, new_ids, -1),
+            )
+
+    def _admit(self, dt: float) -> None:
+        vehicle_positions = self._vehicle_positions
+        for source_index, (lane_index, rate) in enumerate(
+            zip(self._demand_lanes, self._demand_rates)
+        ):
+            u = counter_uniform_array(
+                self._replica_seeds, self._steps, source_index, _ARRIVALS_STREAM
+            )
+            pending = self._pending[:, source_index]
+            pending += _poisson(u, rate * dt)
+
+            # Room at the start of the lane if it is empty, or the last
+            # vehicle is past the separation limit
+            position = vehicle_positions.lane_positions[lane_index]
+            width = position.shape[1]
+            count = np.count_nonzero(
+                vehicle_positions.lane_ids[lane_index] >= 0, axis=1
+            )
+            room = count == 0
+            if width:
+                last = position[
+                    np.arange(position.shape[0]), np.minimum(width - count, width - 1)
+                ]
+                room |= last >= VEHICLE_SEPARATION_LIMIT
+            admit = (pending > 0) & room
+            if admit.any():
+                pending -= admit
+                vehicle_positions.create_vehicles(
+                    self._lane_refs[lane_index],
+                    np.where(admit, 0.0, np.inf),
+                )
+
+    def step(self, dt: float) -> None:
+        """Perform a step with time interval dt in every replica"""
+        self._wait_flags = self._priority_wait()
+        self._move_vehicles(dt)
+        self._change_lanes()
+        self._admit(dt)
+        self._steps += 1
@@ -0,0 +1,308 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, Hashable, Literal, Sequence, TypeVar
+
+import numpy as np
+
+from junctions.network import LaneRef
+from junctions.types import Junction, Lane, StraightLane
+
+if TYPE_CHECKING:
+    from junctions.network import Network
+
+K = TypeVar("K", bound=Hashable)
+
+ConflictKind = Literal["cross", "merge"]
+
+
+@dataclass(frozen=True)
+class Conflict:
+    """Two lanes that vehicles can't use at the same time.
+
+    Either the lanes cross, or they merge (end at the same point). The
+    positions are where along each lane the conflict is.
+    """
+
+    lane_1: LaneRef
+    lane_2: LaneRef
+    kind: ConflictKind
+    position_1: float
+    position_2: float
+
+
+Polyline = tuple[np.ndarray, np.ndarray]
+
+
+def _polyline(lane: Lane, segment_length: float) -> Polyline:
+    n_points = max(2, math.ceil(lane.length / segment_length) + 1)
+    positions = np.linspace(0, lane.length, n_points)
+    points = np.array([tuple(lane.interpolate(float(p)).point) for p in positions])
+    return positions, points
+
+
+def _at_origin(junction: Junction) -> Junction:
+    return replace(junction, origin=(0.0, 0.0))
+
+
+@lru_cache(maxsize=None)
+def _local_polylines(junction: Junction, segment_length: float) -> dict[str, Polyline]:
+    return {
+        label: _polyline(lane, segment_length) for label, lane in junction.lanes.items()
+    }
+
+
+def _junction_polylines(
+    junction: Junction, segment_length: float
+) -> dict[str, Polyline]:
+    """Polylines of every lane in the junction. They are worked out once for
+    each junction shape and moved to the junction's origin."""
+    origin = np.array(junction.origin)
+    return {
+        label: (positions, points + origin)
+        for label, (positions, points) in _local_polylines(
+            _at_origin(junction), segment_length
+        ).items()
+    }
+
+
+def _find_conflicts(
+    lanes: Sequence[tuple[K, Polyline]],
+    segment_length: float,
+    tolerance: float,
+    include: Callable[[K, K], bool],
+) -> list[tuple[K, K, ConflictKind, float, float]]:
+    """Conflicts between pairs of lanes for which include() is true.
+
+    Lanes are approximated by polylines, and each segment is hashed into a
+    uniform grid so only segments sharing a grid cell are tested against
+    each other. Lanes touching only at their ends are not conflicts if one
+    carries on from the other, or they start from the same point - but they
+    are if they end at the same point (merge).
+    """
+    lengths = np.array([positions[-1] for _, (positions, _) in lanes])
+    segment_lane = []
+    segment_position = []
+    segments = []
+    ends = []
+    for lane_index, (_, (positions, points)) in enumerate(lanes):
+        segment_lane.append(np.full(positions.shape[0] - 1, lane_index))
+        segment_position.append(positions[:-1])
+        segments.append(np.hstack((points[:-1], points[1:])))
+        ends.append(points[-1])
+    if not segments:
+        return []
+    segment_lane = np.concatenate(segment_lane)
+    segment_position = np.concatenate(segment_position)
+    segments = np.concatenate(segments)
+
+    # Grid cells a little larger than the segments, so each segment is only
+    # in a few cells
+    cell_size = 4 * segment_length
+    low = np.floor(np.minimum(segments[:, :2], segments[:, 2:]) / cell_size)
+    high = np.floor(np.maximum(segments[:, :2], segments[:, 2:]) / cell_size)
+    cells: dict[tuple[int, int], list[int]] = {}
+    for segment, (cx0, cy0), (cx1, cy1) in zip(
+        range(segments.shape[0]), low.astype(int), high.astype(int)
+    ):
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                cells.setdefault((cx, cy), []).append(segment)
+
+    pair_set: set[tuple[int, int]] = set()
+    lane_pairs_included: dict[tuple[int, int], bool] = {}
+    for cell_segments in cells.values():
+        for i, s1 in enumerate(cell_segments):
+            for s2 in cell_segments[i + 1 :]:
+                l1, l2 = segment_lane[s1], segment_lane[s2]
+                if l1 == l2:
+                    continue
+                key = (min(l1, l2), max(l1, l2))
+                if key not in lane_pairs_included:
+                    lane_pairs_included[key] = include(
+                        lanes[key[0]][0], lanes[key[1]][0]
+                    )
+                if lane_pairs_included[key]:
+                    pair_set.add((s1, s2) if l1 < l2 else (s2, s1))
+
+    found: dict[tuple[int, int], tuple[ConflictKind, float, float]] = {}
+
+    if pair_set:
+        pairs = np.array(sorted(pair_set))
+        a = segments[pairs[:, 0]]
+        b = segments[pairs[:, 1]]
+        r = a[:, 2:] - a[:, :2]
+        s = b[:, 2:] - b[:, :2]
+        offset = b[:, :2] - a[:, :2]
+        denominator = r[:, 0] * s[:, 1] - r[:, 1] * s[:, 0]
+        parallel = np.abs(denominator) < 1e-12
+        denominator = np.where(parallel, 1, denominator)
+        t = (offset[:, 0] * s[:, 1] - offset[:, 1] * s[:, 0]) / denominator
+        u = (offset[:, 0] * r[:, 1] - offset[:, 1] * r[:, 0]) / denominator
+        hit = ~parallel & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+
+        for (s1, s2), t1, u2 in zip(pairs[hit], t[hit], u[hit]):
+            l1, l2 = segment_lane[s1], segment_lane[s2]
+            p1 = segment_position[s1] + t1 * np.hypot(
+                *(segments[s1, 2:] - segments[s1, :2])
+            )
+            p2 = segment_position[s2] + u2 * np.hypot(
+                *(segments[s2, 2:] - segments[s2, :2])
+            )
+            at_end_1 = p1 >= lengths[l1] - tolerance
+            at_end_2 = p2 >= lengths[l2] - tolerance
+            at_start_1 = p1 <= tolerance
+            at_start_2 = p2 <= tolerance
+            if (at_start_1 or at_end_1) and (at_start_2 or at_end_2):
+                # touching at the ends - merges are picked up below
+                continue
+            key = (int(l1), int(l2))
+            if key not in found or p1 < found[key][1]:
+                found[key] = ("cross", float(p1), float(p2))
+
+    # Lanes ending at the same point
+    end_cells: dict[tuple[int, int], list[int]] = {}
+    for lane_index, end in enumerate(ends):
+        cell = (
+            int(math.floor(end[0] / cell_size)),
+            int(math.floor(end[1] / cell_size)),
+        )
+        end_cells.setdefault(cell, []).append(lane_index)
+    for (cx, cy), cell_lanes in end_cells.items():
+        for l1 in cell_lanes:
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for l2 in end_cells.get((cx + dx, cy + dy), []):
+                        if l2 <= l1 or (l1, l2) in found:
+                            continue
+                        if np.hypot(*(ends[l1] - ends[l2])) > tolerance:
+                            continue
+                        if include(lanes[l1][0], lanes[l2][0]):
+                            found[(l1, l2)] = (
+                                "merge",
+                                float(lengths[l1]),
+                                float(lengths[l2]),
+                            )
+
+    return [
+        (lanes[l1][0], lanes[l2][0], kind, p1, p2)
+        for (l1, l2), (kind, p1, p2) in sorted(found.items())
+    ]
+
+
+def junction_conflicts(
+    junction: Junction, segment_length: float = 0.5, tolerance: float = 0.05
+) -> tuple[tuple[str, str, ConflictKind, float, float], ...]:
+    """Conflicts between the lanes of one junction, by lane label.
+
+    Conflicts don't depend on where the junction is, so the result is cached
+    for every junction with the same shape.
+    """
+    return _local_conflicts(_at_origin(junction), segment_length, tolerance)
+
+
+@lru_cache(maxsize=None)
+def _local_conflicts(
+    junction: Junction, segment_length: float, tolerance: float
+) -> tuple[tuple[str, str, ConflictKind, float, float], ...]:
+    return tuple(
+        _find_conflicts(
+            list(_local_polylines(junction, segment_length).items()),
+            segment_length,
+            tolerance,
+            lambda a, b: True,
+        )
+    )
+
+
+def detect_conflicts(
+    network: Network, segment_length: float = 0.5, tolerance: float = 0.05
+) -> list[Conflict]:
+    """All the conflicts between lanes in a network - both between the lanes
+    of each junction, and between lanes of different junctions that overlap.
+    """
+    conflicts = []
+    for label, junction in network.all_junctions():
+        for lane_1, lane_2, kind, p1, p2 in junction_conflicts(
+            junction, segment_length, tolerance
+        ):
+            conflicts.append(
+                Conflict(LaneRef(label, lane_1), LaneRef(label, lane_2), kind, p1, p2)
+            )
+
+    polylines = []
+    for label, junction in network.all_junctions():
+        for lane, polyline in _junction_polylines(junction, segment_length).items():
+            polylines.append((LaneRef(label, lane), polyline))
+
+    for lane_1, lane_2, kind, p1, p2 in _find_conflicts(
+        polylines,
+        segment_length,
+        tolerance,
+        lambda a, b: a.junction != b.junction,
+    ):
+        conflicts.append(Conflict(lane_1, lane_2, kind, p1, p2))
+
+    return conflicts
+
+
+def suggest_priorities(
+    network: Network, conflicts: Sequence[Conflict]
+) -> dict[LaneRef, tuple[LaneRef, ...]]:
+    """Decide which lane of each conflict has to wait for the other.
+
+    In order, the lane with priority is:
+
+    * A straight lane over a curved one (through roads over turns)
+    * The lane where the conflict is further along, relative to the lane
+      length (the vehicle there is already committed)
+    * The lane with fewer conflicts in total
+    * The first lane by junction and lane label
+
+    For a `Tee` this gives the same table as `Tee.priority_over_lane()`.
+    Returns the lanes with priority over each lane that has any.
+    """
+    conflict_count: dict[LaneRef, int] = {}
+    for conflict in conflicts:
+        for lane_ref in (conflict.lane_1, conflict.lane_2):
+            conflict_count[lane_ref] = conflict_count.get(lane_ref, 0) + 1
+
+    def rank(lane_ref: LaneRef, position: float) -> tuple:
+        lane = network.lane(lane_ref)
+        return (
+            not isinstance(lane, StraightLane),
+            -round(position / lane.length, 6),
+            conflict_count[lane_ref],
+            (lane_ref.junction, lane_ref.lane),
+        )
+
+    priorities: dict[LaneRef, list[LaneRef]] = {}
+    for conflict in conflicts:
+        first = (conflict.lane_1, conflict.position_1)
+        second = (conflict.lane_2, conflict.position_2)
+        winner, loser = (
+            (first, second) if rank(*first) < rank(*second) else (second, first)
+        )
+        priorities.setdefault(loser[0], []).append(winner[0])
+
+    return {
+        lane_ref: tuple(
+            sorted(set(lanes), key=lambda lane_ref: (lane_ref.junction, lane_ref.lane))
+        )
+        for lane_ref, lanes in priorities.items()
+    }
+
+
+def use_detected_priorities(
+    network: Network, segment_length: float = 0.5, tolerance: float = 0.05
+) -> dict[LaneRef, tuple[LaneRef, ...]]:
+    """Replace the priority rules of every lane in the network with ones
+    suggested from the geometry. Returns the priority table."""
+    priorities = suggest_priorities(
+        network, detect_conflicts(network, segment_length, tolerance)
+    )
+    for lane_ref in network.all_lanes():
+        network.set_priority_lanes(lane_ref, priorities.get(lane_ref, ()))
+    return priorities
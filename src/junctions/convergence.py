@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from junctions.stepper import Stepper
+
+
+def mser_truncation(series: np.ndarray, batch_size: int = 5) -> int:
+    """Warm-up cutoff of a series by the MSER rule (MSER-5 by default).
+
+    The series is averaged in batches of `batch_size`, and the cutoff is the
+    number of leading observations to drop that minimises the standard error
+    of the mean of the rest (squared, and only looking at cutoffs in the
+    first half of the series)."""
+    n = series.shape[0] // batch_size
+    if n < 2:
+        return 0
+    batches = series[: n * batch_size].reshape(n, batch_size).mean(axis=1)
+    remaining = n - np.arange(n)
+    tail_sum = np.cumsum(batches[::-1])[::-1]
+    tail_squares = np.cumsum((batches**2)[::-1])[::-1]
+    mser = (tail_squares - tail_sum**2 / remaining) / remaining**2
+    return int(np.argmin(mser[: n // 2 + 1])) * batch_size
+
+
+def _t_quantile(p: float, dof: int) -> float:
+    # Cornish-Fisher expansion of Student's t about the normal quantile
+    z = NormalDist().inv_cdf(p)
+    return (
+        z
+        + (z**3 + z) / (4 * dof)
+        + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * dof**2)
+        + (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * dof**3)
+    )
+
+
+def batch_means_half_width(
+    series: np.ndarray, batches: int = 20, confidence: float = 0.95
+) -> float:
+    """Half width of the confidence interval of the mean of a (correlated)
+    series, from the means of `batches` equal batches. Leading observations
+    that don't fill a batch are dropped. Infinite if there are fewer
+    observations than batches."""
+    batch_size = series.shape[0] // batches
+    if batch_size == 0 or batches < 2:
+        return math.inf
+    means = series[series.shape[0] - batches * batch_size :]
+    means = means.reshape(batches, batch_size).mean(axis=1)
+    return (
+        _t_quantile(0.5 + confidence / 2, batches - 1)
+        * float(means.std(ddof=1))
+        / math.sqrt(batches)
+    )
+
+
+class SteadyStateDetector:
+    """Decides when a stream of observations (e.g. throughput over fixed
+    intervals) has reached steady state, and been measured precisely enough.
+
+    After each observation the warm-up is found with `mser_truncation()`,
+    and the confidence interval of the mean of the rest with
+    `batch_means_half_width()`. The run has converged once the half width is
+    no more than `precision` - relative to the mean, unless `relative` is
+    false - with at least `min_observations` after the warm-up.
+
+    A gridlocked network converges too, to a throughput of zero.
+    """
+
+    def __init__(
+        self,
+        precision: float = 0.05,
+        relative: bool = True,
+        confidence: float = 0.95,
+        batches: int = 20,
+        min_observations: int = 40,
+    ) -> None:
+        self.precision = precision
+        self.relative = relative
+        self.confidence = confidence
+        self.batches = batches
+        self.min_observations = max(min_observations, batches)
+        self._observations = np.zeros(64)
+        self._count = 0
+        self.warmup = 0
+        self.mean = math.nan
+        self.half_width = math.inf
+
+    @property
+    def observations(self) -> np.ndarray:
+        return self._observations[: self._count]
+
+    def add(self, value: float) -> bool:
+        """Add an observation, returning whether the run has converged"""
+        if self._count == self._observations.shape[0]:
+            self._observations = np.concatenate(
+                (self._observations, np.zeros(self._count))
+            )
+        self._observations[self._count] = value
+        self._count += 1
+        return self.converged()
+
+    def converged(self) -> bool:
+        observations = self.observations
+        self.warmup = mser_truncation(observations)
+        steady = observations[self.warmup :]
+        if steady.shape[0] < self.min_observations:
+            return False
+        self.mean = float(steady.mean())
+        self.half_width = batch_means_half_width(steady, self.batches, self.confidence)
+        target = self.precision * abs(self.mean) if self.relative else self.precision
+        return self.half_width <= target
+
+
+@dataclass(frozen=True)
+class SteadyState:
+    """Result of `run_until_steady()`"""
+
+    converged: bool
+    elapsed: float
+    warmup: float
+    mean: float
+    half_width: float
+
+
+def run_until_steady(
+    stepper: Stepper,
+    dt: float,
+    interval: float,
+    max_duration: float,
+    detector: SteadyStateDetector | None = None,
+) -> SteadyState:
+    """Step until the network throughput (vehicles per second leaving the
+    network, measured over each `interval`) has converged, or for
+    `max_duration` at most. The stepper must have `metrics`.
+
+    Returns the mean throughput after the warm-up, and the warm-up time to
+    drop from any other results."""
+    metrics = stepper.metrics
+    if metrics is None:
+        raise ValueError("The stepper needs metrics to detect steady state")
+    detector = detector if detector is not None else SteadyStateDetector()
+
+    steps_per_interval = max(1, int(round(interval / dt)))
+    interval = steps_per_interval * dt
+    intervals = int(max_duration // interval)
+    exits = int(metrics.network_exits.sum())
+    converged = False
+    elapsed = 0.0
+    for _ in range(intervals):
+        for _ in range(steps_per_interval):
+            stepper.step(dt)
+        elapsed += interval
+        previous_exits, exits = exits, int(metrics.network_exits.sum())
+        if detector.add((exits - previous_exits) / interval):
+            converged = True
+            break
+
+    return SteadyState(
+        converged,
+        elapsed,
+        detector.warmup * interval,
+        detector.mean,
+        detector.half_width,
+    )
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import math
+import uuid
+from typing import TYPE_CHECKING, Callable, Iterable
+
+import numpy as np
+
+from junctions.stepper import VEHICLE_SEPARATION_LIMIT
+
+if TYPE_CHECKING:
+    from junctions.network import LaneRef, Network
+    from junctions.rng import RandomStreams
+    from junctions.state.vehicle_positions import VehiclePositions
+
+RateProfile = Callable[[float], float]
+
+
+class DemandSource:
+    """Vehicles arriving at the start of an entry lane.
+
+    Arrivals are a Poisson process with `rate` vehicles per second. The rate
+    can either be a constant or a function of simulation time, to model demand
+    that changes over the course of a run.
+    """
+
+    def __init__(self, lane_ref: LaneRef, rate: float | RateProfile) -> None:
+        self.lane_ref = lane_ref
+        self.rate = rate
+
+    def rate_at(self, t: float) -> float:
+        if callable(self.rate):
+            return self.rate(t)
+        return self.rate
+
+
+class Demand:
+    """Generates vehicles from a set of demand sources.
+
+    Each step the arrivals for every source are sampled in a single draw. A
+    new vehicle can only be placed at the start of its entry lane if there is
+    room for it (no vehicle within the separation limit of the lane start).
+    Vehicles that can't be placed yet are held in a queue outside the network
+    until there is space - see `pending`.
+
+    With `streams`, each source draws its arrivals from its own stream and
+    gives its vehicles IDs from the stream (see `RandomStreams`), instead of
+    sharing `rng` and giving new vehicles random IDs.
+    """
+
+    def __init__(
+        self,
+        sources: Iterable[DemandSource] = (),
+        rng: np.random.Generator | None = None,
+        streams: RandomStreams | None = None,
+    ) -> None:
+        self._sources: list[DemandSource] = []
+        self._constant_rates = np.zeros(0)
+        self._pending = np.zeros(0, dtype=np.int64)
+        self._rng = rng if rng is not None else np.random.default_rng()
+        self._streams = streams
+        self._source_rngs: list[np.random.Generator] = []
+        self._admitted: dict[LaneRef, int] = {}
+        self.time = 0.0
+
+        for source in sources:
+            self.add_source(source)
+
+    def add_source(self, source: DemandSource) -> None:
+        self._sources.append(source)
+        self._constant_rates = np.append(
+            self._constant_rates, 0.0 if callable(source.rate) else source.rate
+        )
+        self._pending = np.append(self._pending, 0)
+        if self._streams is not None:
+            # Sources on the same lane have their own streams too
+            self._source_rngs.append(
+                self._streams.arrivals(
+                    source.lane_ref,
+                    sum(
+                        other.lane_ref == source.lane_ref
+                        for other in self._sources[:-1]
+                    ),
+                )
+            )
+
+    @property
+    def sources(self) -> tuple[DemandSource, ...]:
+        return tuple(self._sources)
+
+    @property
+    def pending(self) -> np.ndarray:
+        """Number of vehicles waiting outside the network, for each source"""
+        return self._pending
+
+    def _rates(self) -> np.ndarray:
+        rates = self._constant_rates.copy()
+        for i, source in enumerate(self._sources):
+            if callable(source.rate):
+                rates[i] = source.rate(self.time)
+        return rates
+
+    def time_to_admission(
+        self, network: Network, vehicle_positions: VehiclePositions
+    ) -> float:
+        """Time until the next queued vehicle has room to enter the network,
+        assuming the vehicles at the start of each entry lane keep moving.
+        Infinity if no vehicles are queued."""
+        time_to_admission = math.inf
+        for source_index in np.flatnonzero(self._pending):
+            lane_ref = self._sources[source_index].lane_ref
+            positions = vehicle_positions.positions_by_lane[lane_ref]
+            if positions.shape[0] == 0 or positions[0] >= VEHICLE_SEPARATION_LIMIT:
+                return 0.0
+            time_to_admission = min(
+                time_to_admission,
+                (VEHICLE_SEPARATION_LIMIT - positions[0])
+                / network.speed_limit(lane_ref),
+            )
+        return float(time_to_admission)
+
+    def step(self, dt: float, vehicle_positions: VehiclePositions) -> list[uuid.UUID]:
+        """Sample arrivals over the interval dt and admit as many queued
+        vehicles as there is room for. Returns the IDs of vehicles created."""
+        if self._streams is not None:
+            for source_index, rate in enumerate(self._rates()):
+                self._pending[source_index] += self._source_rngs[source_index].poisson(
+                    rate * dt
+                )
+        elif self._sources:
+            self._pending += self._rng.poisson(self._rates() * dt)
+        self.time += dt
+
+        admitted_lanes: list[LaneRef] = []
+        admitted_ids: list[uuid.UUID] = []
+        for source_index in np.flatnonzero(self._pending):
+            lane_ref = self._sources[source_index].lane_ref
+            if lane_ref in admitted_lanes:
+                # Another source has just used the start of this lane
+                continue
+
+            positions = vehicle_positions.positions_by_lane[lane_ref]
+            if positions.shape[0] and positions[0] < VEHICLE_SEPARATION_LIMIT:
+                # Lane entry blocked, vehicle stays queued
+                continue
+
+            admitted_lanes.append(lane_ref)
+            if self._streams is not None:
+                n = self._admitted.get(lane_ref, 0)
+                admitted_ids.append(self._streams.vehicle_id(lane_ref, n))
+                self._admitted[lane_ref] = n + 1
+            self._pending[source_index] -= 1
+
+        if not admitted_lanes:
+            return []
+        return vehicle_positions.create_vehicles(
+            admitted_lanes,
+            [0.0] * len(admitted_lanes),
+            admitted_ids if self._streams is not None else None,
+        )
@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import math
+import uuid
+from collections import defaultdict
+from typing import TYPE_CHECKING, Final
+
+import numpy as np
+
+from junctions.priority_wait import priority_wait, time_to_wait_change
+from junctions.state.wait_flags import WaitFlags
+from junctions.stepper import VEHICLE_SEPARATION_LIMIT
+from junctions.turning import LaneChooser
+
+if TYPE_CHECKING:
+    from junctions.network import LaneRef, Network
+    from junctions.rng import RandomStreams
+    from junctions.state.vehicle_positions import VehiclePositions
+
+# Vehicle positions are stored as float32, so positions are only compared to
+# within this tolerance when deciding if a vehicle has reached something.
+POSITION_TOLERANCE: Final = 1e-3
+
+# Wait flags are re-evaluated just after a vehicle crosses the threshold that
+# would set them, so the flag is definitely set when it is re-evaluated.
+WAIT_CHECK_DELAY: Final = 1e-6
+
+
+class EventEngine:
+    """Discrete event alternative to `Stepper`.
+
+    Uses the same rules as the stepper (see doc/03-vehicles.md) but, rather
+    than moving every vehicle every time step, it works out when the next
+    thing of interest will happen and jumps straight to it. On any lane every
+    vehicle is either moving at the speed limit or stopped, so vehicle
+    positions can be calculated analytically between events. The events are:
+
+    * The lead vehicle on a lane reaches the end of the lane, and has to move
+      to the next lane, leave the network or wait
+    * A moving vehicle catches up to a queue of stopped vehicles in front
+    * A vehicle on a feeder lane gets close enough to a priority lane that a
+      wait flag needs setting
+    * A wait flag is cleared, so a waiting vehicle can move on
+
+    Each lane has at most one pending event in a priority queue. Lanes are
+    only brought up to date (their vehicle positions moved forward) when an
+    event touches them, or at the end of `advance()`. When there are long
+    stretches of free flowing traffic this is much cheaper than stepping.
+
+    The main behavioural difference from `Stepper` is that the separation
+    rule is continuous: a vehicle stops when it comes to exactly
+    `VEHICLE_SEPARATION_LIMIT` behind a stopped vehicle, and moves off as soon
+    as the vehicle in front does.
+
+    Next lanes are chosen as by `Stepper` (see `LaneChooser`), so with the
+    same `seed` or `streams`, and the same vehicle IDs, it makes the same
+    choices as a stepper.
+    """
+
+    def __init__(
+        self,
+        network: Network,
+        vehicle_positions: VehiclePositions,
+        *,
+        seed: int | None = None,
+        streams: RandomStreams | None = None,
+        rng: np.random.Generator | None = None,
+    ) -> None:
+        self._network = network
+        self._vehicle_positions = vehicle_positions
+        self._wait_flags = WaitFlags(network)
+        self._next_lane_choice: dict[uuid.UUID, LaneRef] = {}
+        self._lane_chooser = LaneChooser(network, seed, streams, rng)
+        self.time = 0.0
+        self.events_processed = 0
+
+        # Pending events: (time, tie breaker, lane or None for a wait flag
+        # check, version). Events are invalidated by bumping the version
+        # rather than removing them from the queue.
+        self._queue: list[tuple[float, int, LaneRef | None, int]] = []
+        self._sequence = itertools.count()
+        self._lane_version: defaultdict[LaneRef, int] = defaultdict(int)
+        self._wait_version = 0
+
+        # Time each lane's vehicle positions were last brought up to date
+        self._lane_time: dict[LaneRef, float] = {}
+        # Lanes with a vehicle held at the end on a wait flag
+        self._waiting_lanes: set[LaneRef] = set()
+
+        # Lanes whose vehicles can affect wait flags: the priority lanes, and
+        # the lanes feeding into them
+        self._wait_inputs: set[LaneRef] = set()
+        for lane_ref in network.all_lanes():
+            for priority_lane_ref in network.priority_lanes(lane_ref):
+                self._wait_inputs.add(priority_lane_ref)
+                self._wait_inputs.update(network.feeder_lanes(priority_lane_ref))
+
+    @property
+    def wait_flags(self) -> WaitFlags:
+        return self._wait_flags
+
+    def advance(self, duration: float) -> None:
+        """Run the simulation forward by `duration` seconds.
+
+        The vehicle positions are all up to date when this returns, and can be
+        modified (e.g. adding new vehicles) before the next call.
+        """
+        end_time = self.time + duration
+        self._reset_schedule()
+
+        while self._queue and self._queue[0][0] <= end_time:
+            t, _, lane_ref, version = heapq.heappop(self._queue)
+            if lane_ref is None:
+                if version == self._wait_version:
+                    self._update_wait_flags(t)
+                    self.events_processed += 1
+            elif version == self._lane_version[lane_ref]:
+                self._process_lane(lane_ref, t)
+                self.events_processed += 1
+
+        for lane_ref in list(self._lane_time):
+            self._sync(lane_ref, end_time)
+        self.time = end_time
+
+    def _reset_schedule(self) -> None:
+        # The vehicle positions may have been changed since the last advance(),
+        # so schedule everything from scratch
+        self._queue.clear()
+        self._lane_time = {}
+        self._waiting_lanes = set()
+        for lane_ref, vehicle_data in self._vehicle_positions.group_by_lane():
+            if vehicle_data.shape[0] == 0:
+                continue
+            self._lane_time[lane_ref] = self.time
+            if vehicle_data["position"][-1] >= self._lane_end(lane_ref):
+                # vehicle at the end of the lane needs to decide what to do
+                self._push_lane_event(lane_ref, self.time)
+            else:
+                self._schedule(lane_ref)
+        self._update_wait_flags(self.time)
+
+    def _lane_end(self, lane_ref: LaneRef) -> float:
+        return self._network.lane(lane_ref).length - POSITION_TOLERANCE
+
+    def _stopped(self, lane_ref: LaneRef, position: np.ndarray) -> np.ndarray:
+        """Which of the vehicles on the lane are stopped.
+
+        The lead vehicle is stopped if it is held at the end of the lane. Any
+        other vehicle is stopped if the vehicle in front is stopped and within
+        the separation limit.
+        """
+        stopped = np.zeros(position.shape[0], dtype=bool)
+        if position.shape[0] == 0 or position[-1] < self._lane_end(lane_ref):
+            return stopped
+
+        close = np.diff(position) <= VEHICLE_SEPARATION_LIMIT + POSITION_TOLERANCE
+        stopped[-1] = True
+        # a follower is stopped only if every gap in front of it is closed
+        stopped[:-1] = np.flip(np.logical_and.accumulate(np.flip(close)))
+        return stopped
+
+    def _sync(self, lane_ref: LaneRef, t: float) -> None:
+        """Bring the positions of the vehicles on a lane up to time t"""
+        last_time = self._lane_time.get(lane_ref, t)
+        self._lane_time[lane_ref] = t
+        if t <= last_time:
+            return
+
+        position = self._vehicle_positions.positions_by_lane[lane_ref]
+        if position.shape[0] == 0:
+            return
+
+        stopped = self._stopped(lane_ref, position)
+        position[~stopped] += (t - last_time) * self._network.speed_limit(lane_ref)
+
+        # Don't let rounding carry vehicles past what they were heading for
+        if stopped[-1]:
+            queue_start = np.flatnonzero(~stopped)
+            if queue_start.shape[0]:
+                i = queue_start[-1]
+                position[i] = min(
+                    position[i], position[i + 1] - VEHICLE_SEPARATION_LIMIT
+                )
+        else:
+            position[-1] = min(position[-1], self._network.lane(lane_ref).length)
+
+    def _schedule(self, lane_ref: LaneRef) -> None:
+        """Queue the next event for a lane (replacing any pending event)"""
+        position = self._vehicle_positions.positions_by_lane[lane_ref]
+        if position.shape[0] == 0:
+            self._lane_version[lane_ref] += 1
+            return
+
+        stopped = self._stopped(lane_ref, position)
+        speed_limit = self._network.speed_limit(lane_ref)
+        if not stopped[-1]:
+            # lead vehicle reaches the end of the lane
+            distance = self._network.lane(lane_ref).length - position[-1]
+        else:
+            moving = np.flatnonzero(~stopped)
+            if moving.shape[0] == 0:
+                # whole lane is stopped, wait to be released
+                self._lane_version[lane_ref] += 1
+                return
+            # first moving vehicle catches up with the back of the queue
+            i = moving[-1]
+            distance = position[i + 1] - VEHICLE_SEPARATION_LIMIT - position[i]
+
+        self._push_lane_event(
+            lane_ref,
+            self._lane_time[lane_ref] + max(float(distance), 0.0) / speed_limit,
+        )
+
+    def _push_lane_event(self, lane_ref: LaneRef, t: float) -> None:
+        self._lane_version[lane_ref] += 1
+        heapq.heappush(
+            self._queue,
+            (t, next(self._sequence), lane_ref, self._lane_version[lane_ref]),
+        )
+
+    def _process_lane(self, lane_ref: LaneRef, t: float) -> None:
+        self._sync(lane_ref, t)
+        lane_length = self._network.lane(lane_ref).length
+        changed = {lane_ref}
+        vehicles_left = False
+        self._waiting_lanes.discard(lane_ref)
+
+        position = self._vehicle_positions.positions_by_lane[lane_ref]
+        while position.shape[0] and position[-1] >= self._lane_end(lane_ref):
+            vehicle_id = self._vehicle_positions.ids_by_lane[lane_ref][-1]
+            next_lane_ref = self._choose_new_lane(lane_ref, vehicle_id)
+
+            if next_lane_ref is None:
+                self._vehicle_positions.remove(vehicle_id)
+                vehicles_left = True
+            elif self._wait_flags[next_lane_ref]:
+                # held at the end of the lane until the flag clears
+                position[-1] = lane_length
+                self._waiting_lanes.add(lane_ref)
+                break
+            else:
+                del self._next_lane_choice[vehicle_id]
+                self._sync(next_lane_ref, t)
+                self._vehicle_positions.switch_lane(vehicle_id, next_lane_ref, 0.0)
+                changed.add(next_lane_ref)
+                vehicles_left = True
+
+            position = self._vehicle_positions.positions_by_lane[lane_ref]
+
+        for changed_lane_ref in changed:
+            self._schedule(changed_lane_ref)
+
+        if vehicles_left and not changed.isdisjoint(self._wait_inputs):
+            self._update_wait_flags(t)
+
+    def _update_wait_flags(self, t: float) -> None:
+        for lane_ref in self._wait_inputs:
+            self._sync(lane_ref, t)
+
+        self._wait_flags = priority_wait(self._network, self._vehicle_positions)
+
+        # Release any vehicles that were waiting for a flag that is now clear
+        for lane_ref in self._waiting_lanes:
+            vehicle_id = self._vehicle_positions.ids_by_lane[lane_ref][-1]
+            next_lane_ref = self._next_lane_choice.get(vehicle_id)
+            if next_lane_ref is not None and not self._wait_flags[next_lane_ref]:
+                self._push_lane_event(lane_ref, t)
+
+        # and check again when the next vehicle would set a flag
+        self._wait_version += 1
+        time_to_change = time_to_wait_change(self._network, self._vehicle_positions)
+        if math.isfinite(time_to_change):
+            heapq.heappush(
+                self._queue,
+                (
+                    t + time_to_change + WAIT_CHECK_DELAY,
+                    next(self._sequence),
+                    None,
+                    self._wait_version,
+                ),
+            )
+
+    def _choose_new_lane(
+        self, lane_ref: LaneRef, vehicle_id: uuid.UUID
+    ) -> LaneRef | None:
+        if vehicle_id in self._next_lane_choice:
+            return self._next_lane_choice[vehicle_id]
+        next_lane_ref = self._lane_chooser.choose(lane_ref, vehicle_id)
+        if next_lane_ref is not None:
+            self._next_lane_choice[vehicle_id] = next_lane_ref
+        return next_lane_ref
@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Iterable, Mapping, cast
+
+import numpy as np
+
+from junctions.meso import MesoStepper
+from junctions.priority_wait import BoundaryPositions, priority_wait
+from junctions.state.vehicle_positions import VehiclePositions
+from junctions.state.wait_flags import WaitFlags
+from junctions.stepper import (
+    VEHICLE_SEPARATION_LIMIT,
+    LaneChange,
+    RemoveVehicle,
+    Stepper,
+)
+
+if TYPE_CHECKING:
+    from junctions.network import LaneRef, Network
+
+# Fluid flow is turned into vehicles once this close to a whole vehicle
+_WHOLE_VEHICLE = 1e-9
+
+
+class _MicroStepper(Stepper):
+    """Steps the microscopic lanes, with the rest of the network in a queue
+    model"""
+
+    def __init__(
+        self,
+        network: Network,
+        vehicle_positions: VehiclePositions,
+        meso: MesoStepper,
+        micro_lanes: set[LaneRef],
+        seed: int | None,
+    ) -> None:
+        super().__init__(network, vehicle_positions, seed=seed)
+        self._meso = meso
+        self._micro_lanes = micro_lanes
+
+        # Micro lanes to calculate wait flags for, and the queue model lanes
+        # that priority_wait() reads for them - their priority lanes and the
+        # lanes feeding those (whose lead vehicles are estimated)
+        self._flag_lanes = [
+            lane_ref for lane_ref in micro_lanes if network.priority_lanes(lane_ref)
+        ]
+        self._flag_indexes = np.array(
+            [network.lane_index(lane_ref) for lane_ref in self._flag_lanes],
+            dtype=np.intp,
+        )
+        self._meso_lanes = np.array(
+            sorted(
+                {
+                    network.lane_index(read_lane_ref)
+                    for lane_ref in self._flag_lanes
+                    for priority_lane_ref in network.priority_lanes(lane_ref)
+                    for read_lane_ref in (
+                        priority_lane_ref,
+                        *network.feeder_lanes(priority_lane_ref),
+                    )
+                    if read_lane_ref not in micro_lanes
+                }
+            ),
+            dtype=np.intp,
+        )
+
+    def step(self, dt: float) -> None:
+        network = self._network
+        vehicle_positions = self._vehicle_positions
+        meso = self._meso
+
+        lead = np.full(network.lane_count(), np.nan)
+        lead[self._meso_lanes] = meso.lead_positions(self._meso_lanes)
+        micro_flags = priority_wait(
+            network,
+            cast(
+                VehiclePositions,
+                BoundaryPositions(network, vehicle_positions, self._micro_lanes, lead),
+            ),
+            self._flag_lanes,
+        )
+        flags = meso.wait_flags.flags.copy()
+        flags[self._flag_indexes] = micro_flags.gather(self._flag_indexes)
+        self._wait_flags = WaitFlags(network, flags)
+
+        self._move_vehicles(dt)
+
+        space = meso.space()
+        handed_off = []
+        for change in self._calculate_lane_changes():
+            match change:
+                case LaneChange(vehicle_id, lane_ref, position):
+                    if lane_ref in self._micro_lanes:
+                        vehicle_positions.switch_lane(vehicle_id, lane_ref, position)
+                        continue
+
+                    lane_index = network.lane_index(lane_ref)
+                    if space[lane_index] >= 1:
+                        space[lane_index] -= 1
+                        vehicle_positions.remove(vehicle_id)
+                        handed_off.append(lane_ref)
+                    else:
+                        # No room on the queue model lane, so wait at the end
+                        # of the current lane
+                        current_lane_ref = vehicle_positions[vehicle_id]["lane_ref"]
+                        vehicle_positions.switch_lane(
+                            vehicle_id,
+                            current_lane_ref,
+                            network.lane(current_lane_ref).length,
+                        )
+                        self._next_lane_choice[vehicle_id] = lane_ref
+
+                case RemoveVehicle(vehicle_id):
+                    vehicle_positions.remove(vehicle_id)
+
+        if handed_off:
+            meso.add_vehicles(handed_off, np.ones(len(handed_off)))
+
+
+class HybridStepper:
+    """Simulates some junctions in detail, and the rest of the network with a
+    queue model.
+
+    The lanes of `micro_junctions` are stepped as by `Stepper`, with their
+    vehicles in `vehicle_positions`. Every other lane is part of a
+    `MesoStepper`, which also admits the `demand`. Each step:
+
+    * The lead vehicles on the detailed lanes are passed to the queue model
+      for its wait flags, and flow onto the start of a detailed lane is
+      limited to one vehicle, if there is room for it.
+    * The queue model is stepped. Once a whole vehicle has flowed onto a
+      detailed lane, it is created at the start of the lane (all at once,
+      with new IDs).
+    * The detailed lanes are stepped. Wait flags use lead vehicles on the
+      queue model lanes estimated from their queues. Vehicles moving onto
+      queue model lanes are added to their counts if there is room, and
+      otherwise wait at the end of their lane.
+    """
+
+    def __init__(
+        self,
+        network: Network,
+        vehicle_positions: VehiclePositions,
+        micro_junctions: Iterable[str],
+        dt: float,
+        demand: Mapping[LaneRef, float] | None = None,
+        seed: int | None = None,
+    ) -> None:
+        self._network = network
+        self._vehicle_positions = vehicle_positions
+
+        micro_junctions = set(micro_junctions)
+        self._meso = MesoStepper(
+            network,
+            dt,
+            demand,
+            [
+                label
+                for label in network.junction_labels()
+                if label not in micro_junctions
+            ],
+        )
+        micro_lanes = sorted(
+            (
+                lane_ref
+                for lane_ref in network.all_lanes()
+                if lane_ref.junction in micro_junctions
+            ),
+            key=network.lane_index,
+        )
+        self._micro_lanes = micro_lanes
+        self._micro_indexes = np.array(
+            [network.lane_index(lane_ref) for lane_ref in micro_lanes], dtype=np.intp
+        )
+        self._micro_lengths = np.array(
+            [network.lane(lane_ref).length for lane_ref in micro_lanes]
+        )
+        self._micro_speed_limits = np.array(
+            [network.speed_limit(lane_ref) for lane_ref in micro_lanes]
+        )
+        self._micro = _MicroStepper(
+            network, vehicle_positions, self._meso, set(micro_lanes), seed
+        )
+
+    @property
+    def meso(self) -> MesoStepper:
+        return self._meso
+
+    @property
+    def micro(self) -> Stepper:
+        return self._micro
+
+    @property
+    def time(self) -> float:
+        return self._meso.time
+
+    def step(self) -> None:
+        """Advance by one time step (of the queue model)"""
+        meso = self._meso
+        vehicle_positions = self._vehicle_positions
+
+        lead = np.full(len(self._micro_lanes), np.nan)
+        tail = np.full(len(self._micro_lanes), np.inf)
+        for i, lane_ref in enumerate(self._micro_lanes):
+            positions = vehicle_positions.positions_by_lane[lane_ref]
+            if positions.shape[0]:
+                lead[i] = positions[-1]
+                tail[i] = positions[0]
+
+        meso.boundary_lead_time[self._micro_indexes] = np.where(
+            np.isnan(lead),
+            np.inf,
+            (self._micro_lengths - lead) / self._micro_speed_limits,
+        )
+        meso.boundary_capacity[self._micro_indexes] = np.maximum(
+            (tail >= VEHICLE_SEPARATION_LIMIT)
+            - meso.boundary_outflow[self._micro_indexes],
+            0,
+        )
+
+        meso.step()
+
+        arrived = np.floor(
+            meso.boundary_outflow[self._micro_indexes] + _WHOLE_VEHICLE
+        ).astype(np.int64)
+        if arrived.any():
+            meso.boundary_outflow[self._micro_indexes] = np.maximum(
+                meso.boundary_outflow[self._micro_indexes] - arrived, 0
+            )
+            lane_refs = [
+                self._micro_lanes[i]
+                for i in np.repeat(np.arange(arrived.shape[0]), arrived)
+            ]
+            vehicle_positions.create_vehicles(lane_refs, [0.0] * len(lane_refs))
+
+        self._micro.step(meso.dt)
+
+    def run(self, duration: float) -> int:
+        """Step for `duration` seconds, returning the number of steps"""
+        steps = int(round(duration / self._meso.dt))
+        for _ in range(steps):
+            self.step()
+        return steps
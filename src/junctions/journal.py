@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import uuid
+from typing import TYPE_CHECKING, Iterable
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from junctions.state.wait_flags import WaitFlags
+
+
+class _Column:
+    """Growable array, reused from step to step"""
+
+    def __init__(self, dtype: np.typing.DTypeLike) -> None:
+        self._data = np.empty(16, dtype=dtype)
+        self.size = 0
+
+    def _reserve(self, size: int) -> None:
+        if size > self._data.shape[0]:
+            data = np.empty(max(size, 2 * self._data.shape[0]), dtype=self._data.dtype)
+            data[: self.size] = self._data[: self.size]
+            self._data = data
+
+    def append(self, value: object) -> None:
+        self._reserve(self.size + 1)
+        self._data[self.size] = value
+        self.size += 1
+
+    def extend(self, values: np.ndarray) -> None:
+        self._reserve(self.size + values.shape[0])
+        self._data[self.size : self.size + values.shape[0]] = values
+        self.size += values.shape[0]
+
+    def view(self) -> np.ndarray:
+        view = self._data[: self.size]
+        view.flags.writeable = False
+        return view
+
+
+class StepJournal:
+    """What changed in the last step of a `Stepper`, as columns of arrays.
+
+    * `spawned` - IDs of vehicles created by the demand
+    * `removed` - IDs of vehicles that left the network
+    * `transition_ids`, `transition_from`, `transition_to` - vehicles that
+      moved onto another lane, and the lane indexes they moved between
+    * `flipped_lanes`, `flipped_to` - lanes whose wait flag changed, and
+      the new value of the flag
+
+    Consumers can apply these to their own state after each step instead of
+    scanning all the vehicles. The arrays are read only views that are
+    reused, so they are only valid until the next step.
+    """
+
+    def __init__(self) -> None:
+        self.steps = 0
+        self._spawned = _Column(object)
+        self._removed = _Column(object)
+        self._transition_ids = _Column(object)
+        self._transition_from = _Column(np.int32)
+        self._transition_to = _Column(np.int32)
+        self._flipped_lanes = _Column(np.int32)
+        self._flipped_to = _Column(bool)
+
+    def begin_step(self) -> None:
+        self.steps += 1
+        for column in (
+            self._spawned,
+            self._removed,
+            self._transition_ids,
+            self._transition_from,
+            self._transition_to,
+            self._flipped_lanes,
+            self._flipped_to,
+        ):
+            column.size = 0
+
+    def record_spawned(self, vehicle_ids: Iterable[uuid.UUID]) -> None:
+        for vehicle_id in vehicle_ids:
+            self._spawned.append(vehicle_id)
+
+    def record_removed(self, vehicle_id: uuid.UUID) -> None:
+        self._removed.append(vehicle_id)
+
+    def record_transition(
+        self, vehicle_id: uuid.UUID, from_lane: int, to_lane: int
+    ) -> None:
+        self._transition_ids.append(vehicle_id)
+        self._transition_from.append(from_lane)
+        self._transition_to.append(to_lane)
+
+    def record_wait_flags(self, wait_flags: WaitFlags, previous: WaitFlags) -> None:
+        flipped = wait_flags.diff(previous)
+        self._flipped_lanes.extend(flipped)
+        self._flipped_to.extend(wait_flags.gather(flipped))
+
+    @property
+    def spawned(self) -> np.ndarray:
+        return self._spawned.view()
+
+    @property
+    def removed(self) -> np.ndarray:
+        return self._removed.view()
+
+    @property
+    def transition_ids(self) -> np.ndarray:
+        return self._transition_ids.view()
+
+    @property
+    def transition_from(self) -> np.ndarray:
+        return self._transition_from.view()
+
+    @property
+    def transition_to(self) -> np.ndarray:
+        return self._transition_to.view()
+
+    @property
+    def flipped_lanes(self) -> np.ndarray:
+        return self._flipped_lanes.view()
+
+    @property
+    def flipped_to(self) -> np.ndarray:
+        return self._flipped_to.view()
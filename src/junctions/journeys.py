@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import uuid
+from typing import TYPE_CHECKING, Iterable, Iterator
+
+import numpy as np
+
+from junctions.sketch import QuantileSketch
+
+if TYPE_CHECKING:
+    from junctions.network import LaneRef, Network
+
+
+class JourneyTimes:
+    """Distribution of the time vehicles take to get through the network, for
+    each origin and destination.
+
+    Pass an instance to the `Stepper` and the time and lane of every vehicle
+    created by its demand is kept, until the vehicle leaves the network. Its
+    journey time is then added to a `QuantileSketch` for the pair of (entry
+    lane, exit lane) indexes. Spawn times are kept in a numeric column with a
+    slot for each vehicle in the network, reused once the vehicle leaves, so
+    memory depends on the number of vehicles in the network at once and the
+    number of origin and destination pairs, not the number of vehicles that
+    have passed through.
+
+    Journey times from separate runs (e.g. the workers of an ensemble) can
+    be combined with `merge()`.
+    """
+
+    def __init__(self, network: Network, relative_accuracy: float = 0.01) -> None:
+        self._network = network
+        self._relative_accuracy = relative_accuracy
+        self.time = 0.0
+        self._slots: dict[uuid.UUID, int] = {}
+        self._free_slots: list[int] = []
+        self._spawn_time = np.zeros(16)
+        self._origin = np.zeros(16, dtype=np.int32)
+        self._sketches: dict[tuple[int, int], QuantileSketch] = {}
+
+    def begin_step(self, dt: float) -> None:
+        self.time += dt
+
+    def record_spawn(self, vehicle_id: uuid.UUID, lane_index: int) -> None:
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            slot = len(self._slots)
+            if slot == self._spawn_time.shape[0]:
+                self._spawn_time = np.concatenate((self._spawn_time, np.zeros(slot)))
+                self._origin = np.concatenate(
+                    (self._origin, np.zeros(slot, dtype=np.int32))
+                )
+        self._slots[vehicle_id] = slot
+        self._spawn_time[slot] = self.time
+        self._origin[slot] = lane_index
+
+    def record_removal(self, vehicle_id: uuid.UUID, lane_index: int) -> None:
+        """A vehicle left the network from the end of the lane. Vehicles that
+        weren't spawned by the demand are ignored."""
+        slot = self._slots.pop(vehicle_id, None)
+        if slot is None:
+            return
+        self._free_slots.append(slot)
+        self._sketch(int(self._origin[slot]), lane_index).add(
+            self.time - self._spawn_time[slot]
+        )
+
+    def _sketch(self, origin: int, destination: int) -> QuantileSketch:
+        sketch = self._sketches.get((origin, destination))
+        if sketch is None:
+            sketch = self._sketches[(origin, destination)] = QuantileSketch(
+                self._relative_accuracy
+            )
+        return sketch
+
+    @property
+    def in_progress(self) -> int:
+        """Number of vehicles in the network with a recorded spawn time"""
+        return len(self._slots)
+
+    def pairs(self) -> Iterator[tuple[LaneRef, LaneRef]]:
+        """Origin and destination lanes with completed journeys"""
+        lane_refs = sorted(self._network.all_lanes(), key=self._network.lane_index)
+        for origin, destination in self._sketches:
+            yield lane_refs[origin], lane_refs[destination]
+
+    def sketch(self, origin: LaneRef, destination: LaneRef) -> QuantileSketch:
+        """Journey times from the start of `origin` to the end of
+        `destination` (an empty sketch if there are none)"""
+        return self._sketches.get(
+            (self._network.lane_index(origin), self._network.lane_index(destination)),
+            QuantileSketch(self._relative_accuracy),
+        )
+
+    def quantiles(
+        self, origin: LaneRef, destination: LaneRef, qs: Iterable[float]
+    ) -> list[float]:
+        sketch = self.sketch(origin, destination)
+        return [sketch.quantile(q) for q in qs]
+
+    def merge(self, other: JourneyTimes) -> None:
+        """Add the completed journeys of `other`, which must be for the same
+        network"""
+        for (origin, destination), sketch in other._sketches.items():
+            self._sketch(origin, destination).merge(sketch)
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import os
+import uuid
+from typing import TYPE_CHECKING, Final
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from junctions.network import Network
+
+ENTRY: Final = 1
+EXIT: Final = 0
+
+# Vehicle IDs are stored as two 64 bit words (high, low) of `UUID.int`
+EVENT_DTYPE: Final = np.dtype(
+    [
+        ("time", np.float64),
+        ("id", np.uint64, (2,)),
+        ("lane", np.int32),
+        ("kind", np.int8),
+    ]
+)
+
+TRAVERSAL_DTYPE: Final = np.dtype(
+    [
+        ("id", np.uint64, (2,)),
+        ("lane", np.int32),
+        ("entry_time", np.float64),
+        ("exit_time", np.float64),
+    ]
+)
+
+TRAJECTORY_DTYPE: Final = np.dtype(
+    [
+        ("time", np.float64),
+        ("id", np.uint64, (2,)),
+        ("lane", np.int32),
+        ("position", np.float64),
+    ]
+)
+
+_MASK_64: Final = (1 << 64) - 1
+
+
+def vehicle_id_words(vehicle_id: uuid.UUID) -> tuple[int, int]:
+    """A vehicle ID as it is stored in the event arrays"""
+    return vehicle_id.int >> 64, vehicle_id.int & _MASK_64
+
+
+class LaneEventLog:
+    """Append-only log of vehicles entering and leaving lanes.
+
+    Pass an instance to the `Stepper` and an `ENTRY` event is recorded when a
+    vehicle is created by the demand or moves onto a lane, and an `EXIT`
+    event when it moves off a lane or out of the network. Events have the
+    time at the end of the step, the vehicle ID and the lane index (see
+    `EVENT_DTYPE`).
+
+    Events are written into a preallocated chunk of `chunk_size` rows, which
+    is appended to the file at `path` when it is full, so memory use doesn't
+    grow with the length of the run. Call `close()` at the end of the run to
+    write out the last chunk, then `read_lane_events()` to load the log.
+
+    That is two small rows per vehicle per lane, instead of a row per vehicle
+    per step for a full recording, and still gives travel times and flows
+    (see `lane_traversals()`, `mean_travel_times()` and `lane_flows()`), or
+    approximate trajectories (`reconstruct_trajectories()`).
+    """
+
+    def __init__(self, path: str | os.PathLike, chunk_size: int = 65536) -> None:
+        self._path = path
+        self._chunk = np.empty(chunk_size, dtype=EVENT_DTYPE)
+        self._size = 0
+        self.time = 0.0
+        self.events = 0
+        # Start a new log, rather than appending to an old one
+        open(path, "wb").close()
+
+    def begin_step(self, dt: float) -> None:
+        self.time += dt
+
+    def record(self, vehicle_id: uuid.UUID, lane_index: int, kind: int) -> None:
+        if self._size == self._chunk.shape[0]:
+            self.flush()
+        self._chunk[self._size] = (
+            self.time,
+            vehicle_id_words(vehicle_id),
+            lane_index,
+            kind,
+        )
+        self._size += 1
+        self.events += 1
+
+    def flush(self) -> None:
+        """Append the events recorded so far to the file"""
+        if self._size:
+            with open(self._path, "ab") as f:
+                self._chunk[: self._size].tofile(f)
+            self._size = 0
+
+    def close(self) -> None:
+        self.flush()
+
+
+def read_lane_events(path: str | os.PathLike) -> np.ndarray:
+    """Load a log written by `LaneEventLog`, as an array of `EVENT_DTYPE`"""
+    return np.fromfile(path, dtype=EVENT_DTYPE)
+
+
+def lane_traversals(events: np.ndarray) -> np.ndarray:
+    """Pair up the events of each vehicle into one row per lane it drove
+    along (see `TRAVERSAL_DTYPE`). The exit time is NaN for vehicles still on
+    the lane at the end of the log. Exits without an entry (vehicles that
+    were already on the lane when the log started) are left out."""
+    # Each vehicle's events in the order they were recorded
+    order = np.lexsort((events["id"][:, 1], events["id"][:, 0]))
+    events = events[order]
+
+    entries = np.flatnonzero(events["kind"] == ENTRY)
+    following = np.minimum(entries + 1, max(events.shape[0] - 1, 0))
+    exited = (
+        (entries + 1 < events.shape[0])
+        & (events["kind"][following] == EXIT)
+        & (events["lane"][following] == events["lane"][entries])
+        & (events["id"][following] == events["id"][entries]).all(axis=1)
+    )
+
+    traversals = np.empty(entries.shape[0], dtype=TRAVERSAL_DTYPE)
+    traversals["id"] = events["id"][entries]
+    traversals["lane"] = events["lane"][entries]
+    traversals["entry_time"] = events["time"][entries]
+    traversals["exit_time"] = np.where(exited, events["time"][following], np.nan)
+    return traversals
+
+
+def mean_travel_times(traversals: np.ndarray, lane_count: int) -> np.ndarray:
+    """Mean time to drive along each lane (by lane index), from the vehicles
+    that have left it. NaN for lanes no vehicle has driven all the way
+    along."""
+    done = ~np.isnan(traversals["exit_time"])
+    lanes = traversals["lane"][done]
+    total = np.bincount(
+        lanes,
+        traversals["exit_time"][done] - traversals["entry_time"][done],
+        minlength=lane_count,
+    )
+    count = np.bincount(lanes, minlength=lane_count)
+    return np.divide(total, count, out=np.full(lane_count, np.nan), where=count > 0)
+
+
+def lane_flows(
+    events: np.ndarray, lane_count: int, start: float, end: float
+) -> np.ndarray:
+    """Vehicles per second leaving each lane (by lane index) between `start`
+    and `end`"""
+    exits = (
+        (events["kind"] == EXIT) & (events["time"] > start) & (events["time"] <= end)
+    )
+    return np.bincount(events["lane"][exits], minlength=lane_count) / (end - start)
+
+
+def reconstruct_trajectories(
+    traversals: np.ndarray, network: Network, times: np.ndarray
+) -> np.ndarray:
+    """Approximate positions of the vehicles at each of the given times (see
+    `TRAJECTORY_DTYPE`).
+
+    Each vehicle is assumed to drive along a lane at its speed limit from
+    when it entered, then wait at the end of the lane until it left. Rows
+    are in the order of the traversals, then by time.
+    """
+    lane_refs = sorted(network.all_lanes(), key=network.lane_index)
+    lengths = np.array([network.lane(lane_ref).length for lane_ref in lane_refs])
+    speed_limits = np.array([network.speed_limit(lane_ref) for lane_ref in lane_refs])
+
+    times = np.sort(times)
+    exit_times = np.where(
+        np.isnan(traversals["exit_time"]), np.inf, traversals["exit_time"]
+    )
+    first = np.searchsorted(times, traversals["entry_time"], side="left")
+    last = np.searchsorted(times, exit_times, side="left")
+    counts = np.maximum(last - first, 0)
+
+    rows = np.repeat(np.arange(traversals.shape[0]), counts)
+    starts = np.repeat(first, counts)
+    offsets = np.arange(rows.shape[0]) - np.repeat(np.cumsum(counts) - counts, counts)
+    sample_times = times[starts + offsets]
+
+    lanes = traversals["lane"][rows]
+    trajectories = np.empty(rows.shape[0], dtype=TRAJECTORY_DTYPE)
+    trajectories["time"] = sample_times
+    trajectories["id"] = traversals["id"][rows]
+    trajectories["lane"] = lanes
+    trajectories["position"] = np.minimum(
+        (sample_times - traversals["entry_time"][rows]) * speed_limits[lanes],
+        lengths[lanes],
+    )
+    return trajectories
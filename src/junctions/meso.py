@@ -0,0 +1,324 @@
+from __future__ import annotations
+
+import math
+from typing import TYPE_CHECKING, Final, Iterable, Mapping
+
+import numpy as np
+
+from junctions.state.wait_flags import WaitFlags
+from junctions.stepper import VEHICLE_SEPARATION_LIMIT
+
+if TYPE_CHECKING:
+    from junctions.network import LaneRef, Network
+
+# Vehicle counts are continuous - anything less than this is no vehicles
+_EMPTY: Final = 1e-9
+
+
+def _sum_by(indexes: np.ndarray, values: np.ndarray, size: int) -> np.ndarray:
+    # np.bincount gives integers when there is nothing to add up
+    return np.bincount(indexes, values, minlength=size).astype(float, copy=False)
+
+
+class MesoStepper:
+    """Queue based (mesoscopic) model of the traffic on lanes.
+
+    Instead of individual vehicles, each lane has a number of vehicles
+    driving along it and a number queued at its end (a link queue model):
+
+    * Vehicles entering a lane take its free flow travel time (at the speed
+      limit, rounded to whole steps) to reach the end, where they queue.
+    * Each step a lane can send at most its capacity from its queue - one
+      vehicle per separation limit at the speed limit. It can receive at most
+      the same, limited by the room left on it (one vehicle per separation
+      limit of its length).
+    * Flow leaving a lane is split between its connected lanes by the
+      connection weights. If any of them can't take its share, the lane's
+      whole outflow is scaled down, so vehicles leave in order.
+    * Lanes with a wait flag receive nothing. The flags follow
+      `priority_wait()`: a lane waits if one of its priority lanes has
+      vehicles on it, or vehicles on a lane feeding a priority lane will
+      reach its end sooner than the lane can be cleared.
+
+    Counts are continuous (fractions of vehicles), and every lane is updated
+    at once with array operations, so the cost of a step does not depend on
+    the number of vehicles, and is small for each lane.
+
+    Only the lanes of the given `junctions` are simulated (all of them by
+    default). Flow onto any other lane is limited by `boundary_capacity`
+    (unlimited by default), and collected in `boundary_outflow` for whatever
+    is simulating those lanes to take. For wait flags, the vehicles on those
+    lanes are given by `boundary_lead_time` - the time until the lead
+    vehicle reaches the end of the lane (infinite if there are none).
+
+    `demand` is the arrival rate (vehicles per second) onto entry lanes.
+    The time step `dt` is fixed, since travel times are counted in steps.
+    """
+
+    def __init__(
+        self,
+        network: Network,
+        dt: float,
+        demand: Mapping[LaneRef, float] | None = None,
+        junctions: Iterable[str] | None = None,
+    ) -> None:
+        self._network = network
+        self._dt = dt
+        self.time = 0.0
+
+        lane_refs = sorted(network.all_lanes(), key=network.lane_index)
+        self._lane_refs = lane_refs
+        n_lanes = len(lane_refs)
+
+        self._active = np.ones(n_lanes, dtype=bool)
+        if junctions is not None:
+            junction_set = set(junctions)
+            self._active[:] = [
+                lane_ref.junction in junction_set for lane_ref in lane_refs
+            ]
+
+        lengths = np.array([network.lane(lane_ref).length for lane_ref in lane_refs])
+        speed_limits = np.array(
+            [network.speed_limit(lane_ref) for lane_ref in lane_refs]
+        )
+        self._travel_steps = np.maximum(
+            1, np.round(lengths / speed_limits / dt).astype(np.int64)
+        )
+        self._lengths = lengths
+        self._speed_limits = speed_limits
+        self._capacity = speed_limits / VEHICLE_SEPARATION_LIMIT * dt
+        self._storage = np.maximum(1.0, lengths / VEHICLE_SEPARATION_LIMIT)
+
+        # Vehicles driving along each lane, by the step they reach the end -
+        # slot (head + k) % slots is k steps from now
+        slots = int(self._travel_steps.max(initial=1)) + 1
+        self._ring = np.zeros((n_lanes, slots))
+        self._head = 0
+        self._running = np.zeros(n_lanes)
+        self._queued = np.zeros(n_lanes)
+
+        # Connections as a list of edges, with the share of each lane's
+        # outflow going along each one
+        edge_from = []
+        edge_to = []
+        edge_share = []
+        for lane_index, lane_ref in enumerate(lane_refs):
+            next_lanes = network.connected_lanes(lane_ref)
+            weights = np.array(network.connection_weights(lane_ref), dtype=float)
+            if not next_lanes:
+                continue
+            total = weights.sum()
+            shares = (
+                weights / total
+                if total > 0
+                else np.full_like(weights, 1 / len(weights))
+            )
+            for next_lane_ref, share in zip(next_lanes, shares):
+                edge_from.append(lane_index)
+                edge_to.append(network.lane_index(next_lane_ref))
+                edge_share.append(share)
+        self._edge_from = np.array(edge_from, dtype=np.intp)
+        self._edge_to = np.array(edge_to, dtype=np.intp)
+        self._edge_share = np.array(edge_share, dtype=float)
+        self._exit_lanes = np.bincount(self._edge_from, minlength=n_lanes) == 0
+
+        # Wait flag rules: (lane, priority lane) pairs, and (lane, feeder
+        # lane, steps) for the lanes feeding each priority lane, where steps
+        # is how far ahead arriving vehicles set the flag (the feeder lanes
+        # are looked up from the edges, by lane index)
+        feeders: dict[int, list[int]] = {}
+        for from_index, to_index in zip(edge_from, edge_to):
+            feeders.setdefault(to_index, []).append(from_index)
+        priority_rules = []
+        feeder_rules = []
+        feeder_clear_times = []
+        for lane_index, lane_ref in enumerate(lane_refs):
+            clear_time = lengths[lane_index] / speed_limits[lane_index]
+            clear_steps = math.ceil(clear_time / dt)
+            for priority_lane_ref in network.priority_lanes(lane_ref):
+                priority_index = network.lane_index(priority_lane_ref)
+                priority_rules.append((lane_index, priority_index))
+                for feeder_index in feeders.get(priority_index, []):
+                    feeder_rules.append(
+                        (lane_index, feeder_index, min(slots - 1, clear_steps - 1))
+                    )
+                    feeder_clear_times.append(clear_time)
+        self._priority_rules = np.array(priority_rules, dtype=np.intp).reshape(-1, 2)
+        self._feeder_rules = np.array(feeder_rules, dtype=np.intp).reshape(-1, 3)
+        self._feeder_clear_times = np.array(feeder_clear_times, dtype=float)
+        self._wait = np.zeros(n_lanes, dtype=bool)
+
+        demand = demand or {}
+        self._demand_lanes = np.array(
+            [network.lane_index(lane_ref) for lane_ref in demand], dtype=np.intp
+        )
+        self._demand_rates = np.array(list(demand.values()), dtype=float)
+        self._pending = np.zeros(len(demand))
+
+        self.boundary_capacity = np.full(n_lanes, np.inf)
+        self.boundary_outflow = np.zeros(n_lanes)
+        self.boundary_lead_time = np.full(n_lanes, np.inf)
+        self.lane_exits = np.zeros(n_lanes)
+        self.network_exits = 0.0
+
+    @property
+    def dt(self) -> float:
+        return self._dt
+
+    @property
+    def active(self) -> np.ndarray:
+        """Which lanes (by lane index) are simulated"""
+        return self._active
+
+    @property
+    def counts(self) -> np.ndarray:
+        """Vehicles on each lane, by lane index"""
+        return self._running + self._queued
+
+    @property
+    def queued(self) -> np.ndarray:
+        """Vehicles queued at the end of each lane, by lane index"""
+        return self._queued
+
+    @property
+    def pending(self) -> np.ndarray:
+        """Vehicles waiting to enter the network, for each demand lane"""
+        return self._pending
+
+    @property
+    def wait_flags(self) -> WaitFlags:
+        """Wait flags from the last step, read only"""
+        wait = self._wait.view()
+        wait.flags.writeable = False
+        return WaitFlags(self._network, wait)
+
+    def add_vehicles(
+        self, lane_refs: Iterable[LaneRef], counts: Iterable[float]
+    ) -> None:
+        """Put vehicles at the start of lanes"""
+        lane_indexes = np.array(
+            [self._network.lane_index(lane_ref) for lane_ref in lane_refs],
+            dtype=np.intp,
+        )
+        self._enter(
+            _sum_by(
+                lane_indexes,
+                np.fromiter(counts, dtype=float),
+                self._queued.shape[0],
+            )
+        )
+
+    def space(self) -> np.ndarray:
+        """Room left for vehicles on each lane"""
+        return self._storage - self.counts
+
+    def lead_positions(self, lane_indexes: np.ndarray) -> np.ndarray:
+        """Estimated position of the lead vehicle on each of the given lanes
+        (NaN if there are none). Queued vehicles are at the end of the lane,
+        otherwise the lead is placed by when it will reach the end."""
+        slots = self._ring.shape[1]
+        ahead = np.arange(1, slots)
+        arriving = (
+            self._ring[lane_indexes[:, None], (self._head + ahead[None, :]) % slots]
+            > _EMPTY
+        )
+        steps = np.where(arriving.any(axis=1), ahead[arriving.argmax(axis=1)], 0)
+        steps[self._queued[lane_indexes] > _EMPTY] = 0
+        lead = np.maximum(
+            self._lengths[lane_indexes]
+            - steps * self._dt * self._speed_limits[lane_indexes],
+            0,
+        )
+        lead[self.counts[lane_indexes] <= _EMPTY] = np.nan
+        return lead
+
+    def _enter(self, inflow: np.ndarray) -> None:
+        lanes = np.arange(inflow.shape[0])
+        slot = (self._head + self._travel_steps) % self._ring.shape[1]
+        self._ring[lanes, slot] += inflow
+        self._running += inflow
+
+    def _update_wait_flags(self) -> None:
+        wait = np.zeros_like(self._wait)
+        occupied = (self.counts > _EMPTY) | np.isfinite(self.boundary_lead_time)
+
+        lane, priority_lane = self._priority_rules.T
+        wait[lane[occupied[priority_lane]]] = True
+
+        if self._feeder_rules.shape[0]:
+            lane, feeder_lane, steps = self._feeder_rules.T
+            slots = self._ring.shape[1]
+            ahead = np.arange(1, int(steps.max(initial=0)) + 1)
+            arriving = self._ring[
+                feeder_lane[:, None], (self._head + ahead[None, :]) % slots
+            ]
+            arriving[ahead[None, :] > steps[:, None]] = 0
+            close = (
+                (self._queued[feeder_lane] > _EMPTY)
+                | (arriving.sum(axis=1) > _EMPTY)
+                | (self.boundary_lead_time[feeder_lane] < self._feeder_clear_times)
+            )
+            wait[lane[close]] = True
+
+        self._wait = wait
+
+    def step(self) -> None:
+        """Advance by one time step"""
+        n_lanes = self._queued.shape[0]
+
+        # Vehicles reaching the end of their lane join its queue
+        arrivals = self._ring[:, self._head].copy()
+        self._ring[:, self._head] = 0
+        self._running -= arrivals
+        self._queued += arrivals
+
+        self._update_wait_flags()
+
+        # Lanes can take vehicles into the room left by the ones leaving (if
+        # they don't get to leave, the lane is briefly over full)
+        send = np.minimum(self._queued, self._capacity)
+        room = np.where(
+            self._active,
+            np.minimum(self._storage - self.counts + send, self._capacity),
+            self.boundary_capacity,
+        )
+        room = np.maximum(room, 0)
+        room[self._wait] = 0
+
+        # Scale down each lane's outflow by the most oversubscribed of the
+        # lanes it sends to
+        wanted = send[self._edge_from] * self._edge_share
+        into = _sum_by(self._edge_to, wanted, n_lanes)
+        accepted = np.ones(n_lanes)
+        np.divide(room, into, out=accepted, where=into > room)
+        scale = np.ones(n_lanes)
+        np.minimum.at(scale, self._edge_from, accepted[self._edge_to])
+
+        out = send * scale
+        self._queued -= out
+        inflow = _sum_by(self._edge_to, wanted * scale[self._edge_from], n_lanes)
+
+        self.lane_exits += out
+        self.network_exits += float(out[self._exit_lanes].sum())
+
+        # New vehicles enter once there is room left
+        if self._demand_lanes.shape[0]:
+            self._pending += self._demand_rates * self._dt
+            free = np.maximum(room - inflow, 0)[self._demand_lanes]
+            admitted = np.minimum(self._pending, free)
+            self._pending -= admitted
+            np.add.at(inflow, self._demand_lanes, admitted)
+
+        self.boundary_outflow += np.where(self._active, 0, inflow)
+        inflow[~self._active] = 0
+        self._enter(inflow)
+
+        self._head = (self._head + 1) % self._ring.shape[1]
+        self.time += self._dt
+
+    def run(self, duration: float) -> int:
+        """Step for `duration` seconds, returning the number of steps"""
+        steps = int(round(duration / self._dt))
+        for _ in range(steps):
+            self.step()
+        return steps
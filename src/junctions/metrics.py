@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from junctions.network import LaneRef, Network
+
+
+class TrafficMetrics:
+    """Running traffic statistics for a network.
+
+    Pass an instance to the `Stepper` and it is updated as a side effect of
+    each step. All the statistics are kept in fixed size arrays indexed by
+    `Network.lane_index()` (or by junction, in the order of
+    `Network.junction_labels()`), so the cost of collecting them does not grow
+    with the number of vehicles that have passed through the network.
+
+    Per lane:
+
+    * `lane_exits` - vehicles that have left the end of the lane, either onto
+      a connected lane or out of the network
+    * `network_exits` - vehicles that were removed from the simulation at the
+      end of the lane because there was no connected lane to move on to
+    * `wait_time` - total vehicle-seconds spent stopped at the end of the lane
+      because the next lane had a wait flag set
+    * `queue_time` - total vehicle-seconds spent stopped behind another vehicle
+      because of the vehicle separation rule
+    * `queue_length` - the number of vehicles queued on the last step
+    * `max_queue_length` - the longest queue seen
+
+    Per junction:
+
+    * `junction_exits` - vehicles that have left the junction, either into a
+      different junction or out of the network
+    """
+
+    def __init__(self, network: Network) -> None:
+        self._network = network
+        lane_count = network.lane_count()
+
+        self._junction_labels = tuple(network.junction_labels())
+        lane_junction = np.zeros(lane_count, dtype=np.intp)
+        for lane_ref in network.all_lanes():
+            lane_junction[network.lane_index(lane_ref)] = self._junction_labels.index(
+                lane_ref.junction
+            )
+        self._lane_junction = lane_junction
+
+        self.elapsed = 0.0
+        self.steps = 0
+        self.lane_exits = np.zeros(lane_count, dtype=np.int64)
+        self.network_exits = np.zeros(lane_count, dtype=np.int64)
+        self.junction_exits = np.zeros(len(self._junction_labels), dtype=np.int64)
+        self.wait_time = np.zeros(lane_count)
+        self.queue_time = np.zeros(lane_count)
+        self.queue_length = np.zeros(lane_count, dtype=np.int64)
+        self.max_queue_length = np.zeros(lane_count, dtype=np.int64)
+
+        # Only a few lanes have a queue or a waiting vehicle on any step, so
+        # they are added up as they are recorded, rather than with whole
+        # array operations every step
+        self._dt = 0.0
+        self._queued_lanes: list[int] = []
+
+    def begin_step(self, dt: float) -> None:
+        self._dt = dt
+        queue_length = self.queue_length
+        for lane_index in self._queued_lanes:
+            queue_length[lane_index] = 0
+        self._queued_lanes.clear()
+
+    def record_queue(self, lane_index: int, queued: int) -> None:
+        self.queue_length[lane_index] = queued
+        self.queue_time[lane_index] += queued * self._dt
+        if queued > self.max_queue_length[lane_index]:
+            self.max_queue_length[lane_index] = queued
+        self._queued_lanes.append(lane_index)
+
+    def record_waiting(self, lane_index: int) -> None:
+        """A vehicle was held at the end of the lane by a wait flag"""
+        self.wait_time[lane_index] += self._dt
+
+    def record_exit(self, lane_index: int, next_lane_index: int | None) -> None:
+        """A vehicle left the lane, onto the next lane or out of the network"""
+        self.lane_exits[lane_index] += 1
+        if next_lane_index is None:
+            self.network_exits[lane_index] += 1
+            self.junction_exits[self._lane_junction[lane_index]] += 1
+        elif self._lane_junction[lane_index] != self._lane_junction[next_lane_index]:
+            self.junction_exits[self._lane_junction[lane_index]] += 1
+
+    def end_step(self, dt: float) -> None:
+        self.elapsed += dt
+        self.steps += 1
+
+    def lane_throughput(self, lane_ref: LaneRef) -> float:
+        """Vehicles per second leaving the lane"""
+        if self.elapsed == 0:
+            return 0.0
+        return self.lane_exits[self._network.lane_index(lane_ref)] / self.elapsed
+
+    def junction_throughput(self, junction_label: str) -> float:
+        """Vehicles per second leaving the junction"""
+        if self.elapsed == 0:
+            return 0.0
+        junction_index = self._junction_labels.index(junction_label)
+        return self.junction_exits[junction_index] / self.elapsed
+
+    def mean_queue_length(self) -> np.ndarray:
+        """Time-averaged queue length of each lane"""
+        if self.elapsed == 0:
+            return np.zeros_like(self.queue_time)
+        return self.queue_time / self.elapsed
+
+    def mean_delay(self) -> np.ndarray:
+        """Mean time spent stopped (waiting or queueing) per vehicle leaving
+        each lane. Lanes no vehicle has left yet report zero."""
+        delay = self.wait_time + self.queue_time
+        return np.divide(
+            delay,
+            self.lane_exits,
+            out=np.zeros_like(delay),
+            where=self.lane_exits > 0,
+        )
@@ -17,7 +17,22 @@ class Network:
         self._default_speed_limit = default_speed_limit
         self._junctions: dict[str, Junction] = {}
         self._connected_lanes: dict[LaneRef, list[LaneRef]] = {}
+        # Relative weights of choosing each connected lane, and a version
+        # per lane that changes whenever its connections or weights do
+        self._connection_weights: dict[LaneRef, list[float]] = {}
+        self._connection_versions: dict[LaneRef, int] = {}
+        # Priority lanes that replace the junction's own rules (see
+        # junctions.conflicts for generating them from the geometry)
+        self._priority_overrides: dict[LaneRef, tuple[LaneRef, ...]] = {}
         self._lane_speed_limits: dict[LaneRef, float] = {}
+        # Every lane is given a dense integer index (in the order lanes are
+        # added) so lane data can be stored in flat numpy arrays
+        self._lane_indexes: dict[LaneRef, int] = {}
+        self._lane_refs: list[LaneRef] = []
+        # Lookups derived from the connections and priority lanes, built when
+        # first needed and dropped whenever either changes
+        self._feeders: dict[LaneRef, tuple[LaneRef, ...]] | None = None
+        self._wait_dependents: dict[LaneRef, tuple[LaneRef, ...]] | None = None
 
     def _make_junction_label(self, junction: Junction, label: str | None = None) -> str:
         if label is None:
@@ -49,9 +64,13 @@ class Network:
         self._junctions[label] = junction
 
         for lane_label in junction.LANE_LABELS:
-            self._lane_speed_limits[LaneRef(label, lane_label)] = (
+            lane_ref = LaneRef(label, lane_label)
+            self._lane_speed_limits[lane_ref] = (
                 self._default_speed_limit if speed_limit is None else speed_limit
             )
+            self._lane_indexes[lane_ref] = len(self._lane_indexes)
+            self._lane_refs.append(lane_ref)
+        self._clear_derived()
 
         return label
 
@@ -70,29 +89,112 @@ class Network:
         junction = self.junction(lane_ref.junction)
         return junction.lanes[lane_ref.lane]
 
-    def connect_lanes(self, lane_ref_1: LaneRef, lane_ref_2: LaneRef) -> None:
+    def lane_index(self, lane_ref: LaneRef) -> int:
+        """Dense integer index of a lane, from 0 to lane_count() - 1"""
+        return self._lane_indexes[lane_ref]
+
+    def lane_ref(self, lane_index: int) -> LaneRef:
+        """The lane with the given index (see lane_index())"""
+        return self._lane_refs[lane_index]
+
+    def lane_count(self) -> int:
+        return len(self._lane_indexes)
+
+    def connect_lanes(
+        self, lane_ref_1: LaneRef, lane_ref_2: LaneRef, weight: float = 1.0
+    ) -> None:
+        """Connect the end of lane 1 to the start of lane 2. Vehicles leaving
+        lane 1 pick one of its connected lanes in proportion to the weights."""
+        if weight < 0:
+            raise ValueError("connection weight must not be negative")
         self._connected_lanes.setdefault(lane_ref_1, []).append(lane_ref_2)
+        self._connection_weights.setdefault(lane_ref_1, []).append(weight)
+        self._bump_connection_version(lane_ref_1)
+        self._clear_derived()
+
+    def set_connection_weight(
+        self, lane_ref_1: LaneRef, lane_ref_2: LaneRef, weight: float
+    ) -> None:
+        if weight < 0:
+            raise ValueError("connection weight must not be negative")
+        try:
+            i = self._connected_lanes.get(lane_ref_1, []).index(lane_ref_2)
+        except ValueError:
+            raise ValueError(f"{lane_ref_1} is not connected to {lane_ref_2}")
+        self._connection_weights[lane_ref_1][i] = weight
+        self._bump_connection_version(lane_ref_1)
+
+    def _bump_connection_version(self, lane_ref: LaneRef) -> None:
+        self._connection_versions[lane_ref] = (
+            self._connection_versions.get(lane_ref, 0) + 1
+        )
 
     def connected_lanes(self, lane_ref: LaneRef) -> Sequence[LaneRef]:
         return tuple(self._connected_lanes.get(lane_ref, []))
 
-    def feeder_lanes(self, lane_ref: LaneRef) -> Iterable[LaneRef]:
-        for junction_label, junction in self._junctions.items():
-            for lane_label in junction.LANE_LABELS:
-                ref = LaneRef(junction_label, lane_label)
-                if lane_ref in self._connected_lanes.get(ref, []):
-                    yield ref
+    def connection_weights(self, lane_ref: LaneRef) -> Sequence[float]:
+        """Weights of the connected lanes, in the same order"""
+        return tuple(self._connection_weights.get(lane_ref, []))
+
+    def connection_version(self, lane_ref: LaneRef) -> int:
+        """Changes whenever the lane's connections or their weights change"""
+        return self._connection_versions.get(lane_ref, 0)
+
+    def _clear_derived(self) -> None:
+        self._feeders = None
+        self._wait_dependents = None
+
+    def feeder_lanes(self, lane_ref: LaneRef) -> Sequence[LaneRef]:
+        """Lanes connected to the start of this lane"""
+        if self._feeders is None:
+            feeders: dict[LaneRef, list[LaneRef]] = {}
+            for junction_label, junction in self._junctions.items():
+                for lane_label in junction.LANE_LABELS:
+                    ref = LaneRef(junction_label, lane_label)
+                    for next_ref in dict.fromkeys(self._connected_lanes.get(ref, [])):
+                        feeders.setdefault(next_ref, []).append(ref)
+            self._feeders = {
+                next_ref: tuple(refs) for next_ref, refs in feeders.items()
+            }
+        return self._feeders.get(lane_ref, ())
+
+    def wait_dependents(self, lane_ref: LaneRef) -> Sequence[LaneRef]:
+        """Lanes whose wait flag can depend on the vehicles on this lane: the
+        lanes it is a priority lane of, and of the lanes it feeds into"""
+        if self._wait_dependents is None:
+            dependents: dict[LaneRef, dict[LaneRef, None]] = {}
+            for ref in self.all_lanes():
+                for priority_lane_ref in self.priority_lanes(ref):
+                    for read_ref in (
+                        priority_lane_ref,
+                        *self.feeder_lanes(priority_lane_ref),
+                    ):
+                        dependents.setdefault(read_ref, {})[ref] = None
+            self._wait_dependents = {
+                read_ref: tuple(refs) for read_ref, refs in dependents.items()
+            }
+        return self._wait_dependents.get(lane_ref, ())
 
     def speed_limit(self, lane_ref: LaneRef) -> float:
         return self._lane_speed_limits[lane_ref]
 
     def priority_lanes(self, lane_ref: LaneRef) -> Sequence[LaneRef]:
+        """Lanes that vehicles have to wait to be clear before entering this
+        lane. Given by the junction, unless set with set_priority_lanes()."""
+        if lane_ref in self._priority_overrides:
+            return self._priority_overrides[lane_ref]
         junc = self.junction(lane_ref.junction)
         return tuple(
             LaneRef(lane_ref.junction, lane)
             for lane in junc.priority_over_lane(lane_ref.lane)
         )
 
+    def set_priority_lanes(
+        self, lane_ref: LaneRef, priority_lanes: Iterable[LaneRef]
+    ) -> None:
+        self._priority_overrides[lane_ref] = tuple(priority_lanes)
+        self._clear_derived()
+
     def all_junctions(self) -> Iterable[tuple[str, Junction]]:
         return self._junctions.items()
 
@@ -0,0 +1,396 @@
+from __future__ import annotations
+
+import math
+import multiprocessing
+import uuid
+from collections import deque
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+from multiprocessing.synchronize import Barrier
+from typing import TYPE_CHECKING, Sequence, cast
+
+import numpy as np
+
+from junctions.priority_wait import BoundaryPositions, priority_wait
+from junctions.state.vehicle_positions import VehiclePositions
+from junctions.state.wait_flags import WaitFlags
+from junctions.stepper import LaneChange, RemoveVehicle, Stepper
+
+if TYPE_CHECKING:
+    from junctions.network import LaneRef, Network
+
+HANDOFF_DTYPE = np.dtype([("lane", "i4"), ("position", "f4"), ("id", "u8", (2,))])
+
+
+def partition_network(network: Network, parts: int) -> list[list[str]]:
+    """Split the junctions of a network into (at most) `parts` regions.
+
+    Junctions are ordered breadth first over their connections, so connected
+    junctions tend to be next to each other, and the ordering is then cut into
+    regions with roughly equal numbers of lanes.
+    """
+    labels = list(network.junction_labels())
+    neighbours: dict[str, list[str]] = {label: [] for label in labels}
+    for lane_ref in network.all_lanes():
+        for next_lane_ref in network.connected_lanes(lane_ref):
+            if next_lane_ref.junction != lane_ref.junction:
+                neighbours[lane_ref.junction].append(next_lane_ref.junction)
+                neighbours[next_lane_ref.junction].append(lane_ref.junction)
+
+    ordering: list[str] = []
+    visited: set[str] = set()
+    for start in labels:
+        if start in visited:
+            continue
+        visited.add(start)
+        queue = deque([start])
+        while queue:
+            label = queue.popleft()
+            ordering.append(label)
+            for neighbour in neighbours[label]:
+                if neighbour not in visited:
+                    visited.add(neighbour)
+                    queue.append(neighbour)
+
+    parts = max(1, min(parts, len(labels)))
+    total_lanes = network.lane_count()
+    regions: list[list[str]] = [[] for _ in range(parts)]
+    lanes_so_far = 0
+    for label in ordering:
+        # assign each junction by the middle of its lanes in the ordering
+        n_lanes = len(network.lane_labels(label))
+        middle = lanes_so_far + n_lanes / 2
+        region = min(parts - 1, int(middle * parts / max(total_lanes, 1)))
+        regions[region].append(label)
+        lanes_so_far += n_lanes
+    return [region for region in regions if region]
+
+
+def _shared_array(
+    shape: tuple[int, ...], dtype: np.dtype | type
+) -> tuple[SharedMemory, np.ndarray]:
+    dtype = np.dtype(dtype)
+    size = max(1, math.prod(shape) * dtype.itemsize)
+    shm = SharedMemory(create=True, size=size)
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    array.fill(0)
+    return shm, array
+
+
+class _Exchange:
+    """The shared memory used to exchange boundary data between regions"""
+
+    def __init__(
+        self,
+        memory: Sequence[SharedMemory],
+        lane_count: int,
+        n_workers: int,
+        capacity: int,
+    ) -> None:
+        self.memory = memory
+        lead, flags, counts, handoffs = memory
+        # Lead vehicle position on each lane (NaN if empty)
+        self.lead = np.ndarray((lane_count,), dtype=np.float64, buffer=lead.buf)
+        # Wait flag for each lane
+        self.flags = np.ndarray((lane_count,), dtype=np.bool_, buffer=flags.buf)
+        # Number of vehicles handed over by each worker this step
+        self.counts = np.ndarray((n_workers,), dtype=np.int64, buffer=counts.buf)
+        # Vehicles handed over by each worker
+        self.handoffs = np.ndarray(
+            (n_workers, capacity), dtype=HANDOFF_DTYPE, buffer=handoffs.buf
+        )
+
+    def close(self) -> None:
+        del self.lead, self.flags, self.counts, self.handoffs
+        for shm in self.memory:
+            shm.close()
+
+
+class _RegionStepper(Stepper):
+    """Steps the lanes of one region, exchanging boundary data with the others"""
+
+    def __init__(
+        self,
+        network: Network,
+        vehicle_positions: VehiclePositions,
+        seed: int,
+        owned_lanes: Sequence[LaneRef],
+        exchange: _Exchange,
+        barrier: Barrier,
+        worker_index: int,
+    ) -> None:
+        super().__init__(network, vehicle_positions, seed=seed)
+        self._owned_lanes = set(owned_lanes)
+        self._exchange = exchange
+        self._barrier = barrier
+        self._worker_index = worker_index
+
+        self._lane_refs = list(network.all_lanes())
+        # Lanes this region calculates wait flags for
+        self._flag_lanes = [
+            lane_ref for lane_ref in owned_lanes if network.priority_lanes(lane_ref)
+        ]
+        self._flag_indexes = np.array(
+            [network.lane_index(lane_ref) for lane_ref in self._flag_lanes],
+            dtype=np.int64,
+        )
+        # Lanes this region publishes the lead vehicle position of - every
+        # priority lane and feeder lane that priority_wait() reads, as the
+        # priority lanes of a junction can be in another region
+        self._published_lanes = {
+            read_lane_ref
+            for lane_ref in self._lane_refs
+            for priority_lane_ref in network.priority_lanes(lane_ref)
+            for read_lane_ref in (
+                priority_lane_ref,
+                *network.feeder_lanes(priority_lane_ref),
+            )
+            if read_lane_ref in self._owned_lanes
+        }
+
+    def step(self, dt: float) -> None:
+        network = self._network
+        vehicle_positions = self._vehicle_positions
+        exchange = self._exchange
+
+        for lane_ref in self._published_lanes:
+            positions = vehicle_positions.positions_by_lane[lane_ref]
+            exchange.lead[network.lane_index(lane_ref)] = (
+                positions[-1] if positions.shape[0] else np.nan
+            )
+        self._barrier.wait()
+
+        wait_flags = priority_wait(
+            network,
+            cast(
+                VehiclePositions,
+                BoundaryPositions(
+                    network, vehicle_positions, self._owned_lanes, exchange.lead
+                ),
+            ),
+            self._flag_lanes,
+        )
+        exchange.flags[self._flag_indexes] = wait_flags.gather(self._flag_indexes)
+        self._barrier.wait()
+        self._wait_flags = WaitFlags(network, exchange.flags)
+
+        self._move_vehicles(dt)
+
+        outbox = exchange.handoffs[self._worker_index]
+        handed_off = 0
+        for change in self._calculate_lane_changes():
+            match change:
+                case LaneChange(vehicle_id, lane_ref, position):
+                    if lane_ref in self._owned_lanes:
+                        vehicle_positions.switch_lane(vehicle_id, lane_ref, position)
+                    else:
+                        if handed_off == outbox.shape[0]:
+                            raise RuntimeError("too many vehicles handed off in step")
+                        vehicle_positions.remove(vehicle_id)
+                        outbox[handed_off] = (
+                            network.lane_index(lane_ref),
+                            position,
+                            (vehicle_id.int >> 64, vehicle_id.int & (2**64 - 1)),
+                        )
+                        handed_off += 1
+
+                case RemoveVehicle(vehicle_id):
+                    vehicle_positions.remove(vehicle_id)
+
+        exchange.counts[self._worker_index] = handed_off
+        self._barrier.wait()
+
+        for worker_index, count in enumerate(exchange.counts):
+            for lane_index, position, (high, low) in exchange.handoffs[
+                worker_index, :count
+            ]:
+                lane_ref = self._lane_refs[lane_index]
+                if lane_ref in self._owned_lanes:
+                    vehicle_positions.create_vehicle(
+                        lane_ref,
+                        float(position),
+                        uuid.UUID(int=(int(high) << 64) | int(low)),
+                    )
+
+
+def _worker(
+    network: Network,
+    owned_lanes: Sequence[LaneRef],
+    vehicles: Sequence[tuple[LaneRef, np.ndarray, np.ndarray]],
+    seed: int,
+    worker_index: int,
+    n_workers: int,
+    memory: Sequence[SharedMemory],
+    capacity: int,
+    barrier: Barrier,
+    connection: Connection,
+) -> None:
+    exchange = _Exchange(memory, network.lane_count(), n_workers, capacity)
+    vehicle_positions = VehiclePositions()
+    for lane_ref, ids, positions in vehicles:
+        vehicle_positions.create_vehicles(
+            [lane_ref] * len(ids), positions.tolist(), ids.tolist()
+        )
+
+    stepper = _RegionStepper(
+        network, vehicle_positions, seed, owned_lanes, exchange, barrier, worker_index
+    )
+
+    try:
+        while True:
+            command, argument = connection.recv()
+            try:
+                if command == "step":
+                    stepper.step(argument)
+                    connection.send(None)
+                elif command == "collect":
+                    connection.send(
+                        [
+                            (lane_ref, data["id"].copy(), data["position"].copy())
+                            for lane_ref, data in vehicle_positions.group_by_lane()
+                            if data.shape[0]
+                        ]
+                    )
+                else:
+                    break
+            except Exception as e:
+                # Don't leave the other workers stuck waiting for this one
+                barrier.abort()
+                connection.send(e)
+    finally:
+        exchange.close()
+
+
+class PartitionedStepper:
+    """Steps a network split over several worker processes.
+
+    The network is split into regions of whole junctions (see
+    `partition_network()`), each of which is stepped by a `Stepper` in its
+    own process with its own `VehiclePositions`. The regions only depend on
+    each other at their boundaries:
+
+    * A wait flag can depend on vehicles on priority lanes and feeder lanes
+      in another region, so each region publishes the lead vehicle position
+      of those lanes
+    * A vehicle may want to move onto a lane in another region, so the wait
+      flags of every lane are published
+    * A vehicle moving onto a lane in another region is handed over
+
+    These are exchanged each step through shared memory, with a barrier
+    between each stage. Lane choices are made as with `Stepper(seed=...)`, so
+    given the same seed the results match a single process `Stepper` (other
+    than the order of vehicles at exactly the same position).
+
+    The initial vehicles are taken from `vehicle_positions`. Once created, the
+    vehicle state lives in the workers - use `collect()` to get a copy of it.
+    Call `close()` (or use as a context manager) to stop the workers.
+    """
+
+    def __init__(
+        self,
+        network: Network,
+        vehicle_positions: VehiclePositions,
+        partitions: int | Sequence[Sequence[str]],
+        seed: int,
+        handoff_capacity: int = 1024,
+    ) -> None:
+        if isinstance(partitions, int):
+            partitions = partition_network(network, partitions)
+        self._network = network
+        self._partitions = [list(labels) for labels in partitions]
+        n_workers = len(self._partitions)
+
+        self._memory: list[SharedMemory] = []
+        for shape, dtype in (
+            ((network.lane_count(),), np.float64),
+            ((network.lane_count(),), np.bool_),
+            ((n_workers,), np.int64),
+            ((n_workers, handoff_capacity), HANDOFF_DTYPE),
+        ):
+            shm, array = _shared_array(shape, dtype)
+            if not self._memory:
+                # No lead vehicles until they are published
+                array.fill(np.nan)
+            self._memory.append(shm)
+
+        context = multiprocessing.get_context()
+        barrier = context.Barrier(n_workers)
+        self._connections: list[Connection] = []
+        self._processes = []
+
+        for worker_index, labels in enumerate(self._partitions):
+            owned_lanes = [
+                lane_ref
+                for lane_ref in network.all_lanes()
+                if lane_ref.junction in labels
+            ]
+            vehicles = [
+                (lane_ref, data["id"].copy(), data["position"].copy())
+                for lane_ref, data in vehicle_positions.group_by_lane()
+                if lane_ref.junction in labels and data.shape[0]
+            ]
+            connection, worker_connection = context.Pipe()
+            process = context.Process(
+                target=_worker,
+                args=(
+                    network,
+                    owned_lanes,
+                    vehicles,
+                    seed,
+                    worker_index,
+                    n_workers,
+                    self._memory,
+                    handoff_capacity,
+                    barrier,
+                    worker_connection,
+                ),
+                daemon=True,
+            )
+            process.start()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+    @property
+    def partitions(self) -> list[list[str]]:
+        return self._partitions
+
+    def _command(self, command: str, argument: object = None) -> list:
+        for connection in self._connections:
+            connection.send((command, argument))
+        results = [connection.recv() for connection in self._connections]
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    def step(self, dt: float) -> None:
+        """Perform a step with time interval dt in all the regions"""
+        self._command("step", dt)
+
+    def collect(self) -> VehiclePositions:
+        """Gather the vehicles from all the regions into one VehiclePositions"""
+        vehicle_positions = VehiclePositions()
+        for vehicles in self._command("collect"):
+            for lane_ref, ids, positions in vehicles:
+                vehicle_positions.create_vehicles(
+                    [lane_ref] * len(ids), positions.tolist(), ids.tolist()
+                )
+        return vehicle_positions
+
+    def close(self) -> None:
+        for connection in self._connections:
+            connection.send(("close", None))
+        for process in self._processes:
+            process.join()
+        for shm in self._memory:
+            shm.close()
+            shm.unlink()
+        self._connections = []
+        self._processes = []
+        self._memory = []
+
+    def __enter__(self) -> PartitionedStepper:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
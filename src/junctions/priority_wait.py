@@ -1,19 +1,86 @@
+from __future__ import annotations
+
+import math
+from typing import Iterable
+
+import numpy as np
+
 from junctions.network import LaneRef, Network
 from junctions.state.vehicle_positions import VehiclePositions
 from junctions.state.wait_flags import WaitFlags
 
 
-def priority_wait(network: Network, vehicle_positions: VehiclePositions) -> WaitFlags:
-    """Calculate wait flags across network"""
-    wait_flags = WaitFlags()
+class BoundaryPositions:
+    """Looks enough like VehiclePositions for priority_wait(), when only some
+    of the lanes are simulated here (e.g. one region of a partitioned
+    network). Owned lanes come from `vehicle_positions`, any other lane only
+    has its lead vehicle, from `lead` (by lane index, NaN if the lane is
+    empty)."""
+
+    def __init__(
+        self,
+        network: Network,
+        vehicle_positions: VehiclePositions,
+        owned_lanes: set[LaneRef],
+        lead: np.ndarray,
+    ) -> None:
+        self._network = network
+        self._vehicle_positions = vehicle_positions
+        self._owned_lanes = owned_lanes
+        self._lead = lead
+
+    @property
+    def positions_by_lane(self) -> BoundaryPositions:
+        return self
+
+    def __getitem__(self, lane_ref: LaneRef) -> np.ndarray:
+        if lane_ref in self._owned_lanes:
+            return self._vehicle_positions.positions_by_lane[lane_ref]
+        lead = self._lead[self._network.lane_index(lane_ref)]
+        return np.array([] if np.isnan(lead) else [lead], dtype=np.float32)
+
+    def occupied_lanes(self) -> Iterable[LaneRef]:
+        for lane_ref in self._vehicle_positions.occupied_lanes():
+            if lane_ref in self._owned_lanes:
+                yield lane_ref
+        for lane_index in np.flatnonzero(~np.isnan(self._lead)).tolist():
+            lane_ref = self._network.lane_ref(lane_index)
+            if lane_ref not in self._owned_lanes:
+                yield lane_ref
 
-    for lane_ref in network.all_lanes():
-        junction = network.junction(lane_ref.junction)
-        lane = junction.lanes[lane_ref.lane]
+
+def _affected_lanes(
+    network: Network, vehicle_positions: VehiclePositions
+) -> set[LaneRef]:
+    # Only lanes with a vehicle on one of their priority lanes, or on a lane
+    # feeding one, can have to wait
+    return {
+        lane_ref
+        for occupied_lane_ref in vehicle_positions.occupied_lanes()
+        for lane_ref in network.wait_dependents(occupied_lane_ref)
+    }
+
+
+def priority_wait(
+    network: Network,
+    vehicle_positions: VehiclePositions,
+    lanes: Iterable[LaneRef] | None = None,
+) -> WaitFlags:
+    """Calculate wait flags across network, or only for the given lanes.
+
+    Only the lanes that vehicles can make wait are looked at (see
+    `Network.wait_dependents()`), so the cost depends on the occupied lanes
+    rather than the size of the network."""
+    wait_flags = WaitFlags(network)
+    affected = _affected_lanes(network, vehicle_positions)
+    if lanes is not None:
+        affected.intersection_update(lanes)
+
+    for lane_ref in affected:
+        lane = network.lane(lane_ref)
         lane_clear_time = lane.length / network.speed_limit(lane_ref)
 
-        for priority_lane in junction.priority_over_lane(lane_ref.lane):
-            priority_lane_ref = LaneRef(lane_ref.junction, priority_lane)
+        for priority_lane_ref in network.priority_lanes(lane_ref):
 
             if len(vehicle_positions.positions_by_lane[priority_lane_ref]):
                 wait_flags[lane_ref] = True
@@ -44,3 +111,38 @@ def priority_wait(network: Network, vehicle_positions: VehiclePositions) -> Wait
                 break
 
     return wait_flags
+
+
+def time_to_wait_change(network: Network, vehicle_positions: VehiclePositions) -> float:
+    """Time until the next wait flag would be set by a vehicle approaching a
+    priority lane.
+
+    Assumes the vehicles on the feeder lanes keep moving at the speed limit.
+    This only covers the flags set by vehicles getting close on feeder lanes -
+    flags also change when vehicles move between lanes, which callers need to
+    handle separately. Returns infinity if no flags are due to change.
+    """
+    time_to_change = math.inf
+
+    for lane_ref in _affected_lanes(network, vehicle_positions):
+        lane = network.lane(lane_ref)
+        lane_clear_time = lane.length / network.speed_limit(lane_ref)
+
+        for priority_lane_ref in network.priority_lanes(lane_ref):
+
+            for feeder_lane_ref in network.feeder_lanes(priority_lane_ref):
+                vehicles_on_feeder_lane = vehicle_positions.positions_by_lane[
+                    feeder_lane_ref
+                ]
+                if vehicles_on_feeder_lane.shape[0] == 0:
+                    continue
+
+                feeder_lane_vehicle_time_left = (
+                    network.lane(feeder_lane_ref).length - vehicles_on_feeder_lane[-1]
+                ) / network.speed_limit(feeder_lane_ref)
+                if feeder_lane_vehicle_time_left >= lane_clear_time:
+                    time_to_change = min(
+                        time_to_change, feeder_lane_vehicle_time_left - lane_clear_time
+                    )
+
+    return float(time_to_change)
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import math
+from time import perf_counter
+from typing import Callable, Final, Iterable
+
+import numpy as np
+
+# Histogram bins are spaced logarithmically, HISTOGRAM_BINS_PER_DECADE bins
+# for every factor of 10, starting at HISTOGRAM_MIN_DURATION seconds. Anything
+# shorter falls in the first bin, anything longer falls in the last bin.
+HISTOGRAM_MIN_DURATION: Final = 1e-6
+HISTOGRAM_BINS_PER_DECADE: Final = 4
+HISTOGRAM_BINS: Final = 7 * HISTOGRAM_BINS_PER_DECADE
+
+PhaseHook = Callable[[str, float, float], None]
+
+
+class PhaseStats:
+    """Timing statistics accumulated for a single phase of the stepper"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.histogram = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.calls if self.calls else 0.0
+
+    def record(self, duration: float) -> None:
+        self.calls += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+
+        if duration > HISTOGRAM_MIN_DURATION:
+            bin_index = int(
+                math.log10(duration / HISTOGRAM_MIN_DURATION)
+                * HISTOGRAM_BINS_PER_DECADE
+            )
+            self.histogram[min(bin_index, HISTOGRAM_BINS - 1)] += 1
+        else:
+            self.histogram[0] += 1
+
+    @staticmethod
+    def histogram_bin_edges() -> np.ndarray:
+        """Lower edge (in seconds) of each of the histogram bins"""
+        return HISTOGRAM_MIN_DURATION * 10 ** (
+            np.arange(HISTOGRAM_BINS) / HISTOGRAM_BINS_PER_DECADE
+        )
+
+    def reset(self) -> None:
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.histogram[:] = 0
+
+
+class StepperStats:
+    """Per-phase timing of `Stepper.step()`.
+
+    Pass an instance to the `Stepper` to enable timing, the stepper then
+    records the duration of each of its phases every step:
+
+        >>> stats = StepperStats()
+        >>> stepper = Stepper(network, vehicle_positions, stats=stats)
+        >>> stepper.step(0.1)
+        >>> stats["priority_wait"].total_time
+
+    Hooks can be added to forward each measurement on to an external profiler
+    or tracer. A hook is called with the phase name, the `perf_counter()` time
+    the phase started and its duration in seconds.
+    """
+
+    PHASES: Final = (
+        "priority_wait",
+        "move_vehicles",
+        "calculate_lane_changes",
+        "apply_lane_changes",
+    )
+
+    def __init__(self) -> None:
+        self._phases = {name: PhaseStats(name) for name in StepperStats.PHASES}
+        self._hooks: list[PhaseHook] = []
+
+    def __getitem__(self, phase: str) -> PhaseStats:
+        return self._phases[phase]
+
+    def phases(self) -> Iterable[PhaseStats]:
+        return self._phases.values()
+
+    @property
+    def total_time(self) -> float:
+        return sum(phase.total_time for phase in self._phases.values())
+
+    def add_hook(self, hook: PhaseHook) -> None:
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook: PhaseHook) -> None:
+        self._hooks.remove(hook)
+
+    def lap(self, phase: str, start: float) -> float:
+        """Record that `phase` ran from `start` until now.
+
+        Returns the `perf_counter()` time after the hooks have run, so that
+        calls can be chained to time consecutive phases without the time
+        spent in the hooks counting towards the next phase.
+        """
+        duration = perf_counter() - start
+        self._phases[phase].record(duration)
+        for hook in self._hooks:
+            hook(phase, start, duration)
+        return perf_counter()
+
+    def reset(self) -> None:
+        for phase in self._phases.values():
+            phase.reset()
+
+    def summary(self) -> str:
+        """Human readable table of the accumulated timings"""
+        lines = [f"{'phase':<24}{'calls':>8}{'total (s)':>12}{'mean (us)':>12}"]
+        for phase in self._phases.values():
+            lines.append(
+                f"{phase.name:<24}{phase.calls:>8}{phase.total_time:>12.4f}"
+                f"{phase.mean_time * 1e6:>12.1f}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import uuid
+import zlib
+from typing import TYPE_CHECKING, Final
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from junctions.network import LaneRef
+
+_MASK_64: Final = (1 << 64) - 1
+
+
+def _mix(z: int) -> int:
+    """The splitmix64 finaliser - scrambles a 64 bit integer"""
+    z = (z + 0x9E3779B97F4A7C15) & _MASK_64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK_64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK_64
+    return z ^ (z >> 31)
+
+
+def counter_hash(seed: int, *keys: int) -> int:
+    """A random 64 bit integer that depends only on its arguments (see
+    `counter_uniform()`)"""
+    h = _mix(seed & _MASK_64)
+    for key in keys:
+        while True:
+            h = _mix(h ^ (key & _MASK_64))
+            key >>= 64
+            if not key:
+                break
+    return h
+
+
+def counter_uniform(seed: int, *keys: int) -> float:
+    """A uniform random number in [0, 1) that depends only on its arguments.
+
+    Unlike drawing from a random number generator, the result doesn't depend
+    on what else has been drawn before, so e.g. a vehicle's lane choice comes
+    out the same whichever process (or in whichever order) it is made in.
+    Keys can be any size of (non-negative) integer, such as `UUID.int`.
+    """
+    return (counter_hash(seed, *keys) >> 11) * 2.0**-53
+
+
+def _mix_array(z: np.ndarray) -> np.ndarray:
+    # uint64 array arithmetic wraps around, as the masking does in _mix()
+    z = z + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def counter_uniform_array(
+    seeds: np.ndarray | int, *keys: np.ndarray | int
+) -> np.ndarray:
+    """Vectorised `counter_uniform()`, broadcasting over the seeds and keys.
+
+    Keys must fit in 64 bits. For those the results are identical to
+    `counter_uniform()`.
+    """
+    h = _mix_array(np.atleast_1d(np.asarray(seeds, dtype=np.uint64)))
+    for key in keys:
+        h = _mix_array(h ^ np.asarray(key, dtype=np.uint64))
+    return (h >> np.uint64(11)) * 2.0**-53
+
+
+def name_key(name: str) -> int:
+    """A key for `counter_uniform()` from a name, the same in every process
+    (unlike `hash()`)"""
+    return zlib.crc32(name.encode())
+
+
+def lane_key(lane_ref: LaneRef) -> int:
+    """A key for the lane that depends only on its labels, so it is the same
+    in any network with a lane of that name"""
+    return name_key(f"{lane_ref.junction}/{lane_ref.lane}")
+
+
+class RandomStreams:
+    """Separate, named random streams derived from one seed, for common
+    random numbers between variants of a scenario.
+
+    Pass the same instance (or one with the same seed) to the `Demand` and
+    `Stepper` of each variant. Then:
+
+    * Arrivals at each demand source come from a stream of their own, named
+      by the source's lane, so they don't change when sources on other lanes
+      are added or removed.
+    * The n-th vehicle admitted onto each lane has the same ID in every
+      variant.
+    * Each vehicle's lane choice at the end of a lane depends only on the
+      vehicle's ID and the lane's labels.
+
+    So two variants of a junction see the same vehicles, arriving at the
+    same times and wanting to go the same way, and differences between them
+    come from the design rather than from the random numbers.
+    """
+
+    ARRIVALS: Final = name_key("arrivals")
+    VEHICLE_IDS: Final = name_key("vehicle_ids")
+    LANE_CHOICES: Final = name_key("lane_choices")
+
+    def __init__(self, seed: int) -> None:
+        self.seed = seed
+
+    def arrivals(self, lane_ref: LaneRef, index: int = 0) -> np.random.Generator:
+        """Generator for the arrivals at the `index`-th demand source on the
+        lane"""
+        return np.random.default_rng(
+            [self.seed & _MASK_64, self.ARRIVALS, lane_key(lane_ref), index]
+        )
+
+    def vehicle_id(self, lane_ref: LaneRef, n: int) -> uuid.UUID:
+        """ID of the n-th vehicle admitted onto the lane by a demand source"""
+        key = lane_key(lane_ref)
+        high = counter_hash(self.seed, self.VEHICLE_IDS, key, n, 0)
+        low = counter_hash(self.seed, self.VEHICLE_IDS, key, n, 1)
+        return uuid.UUID(int=(high << 64) | low, version=4)
+
+    def lane_choice(self, vehicle_id: uuid.UUID, lane_ref: LaneRef) -> float:
+        """Uniform random number for the vehicle's choice of lane to move on
+        to from the end of `lane_ref`"""
+        return counter_uniform(
+            self.seed, self.LANE_CHOICES, vehicle_id.int, lane_key(lane_ref)
+        )
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import heapq
+import math
+import uuid
+from typing import TYPE_CHECKING, Final, Iterable, Sequence
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from junctions.network import LaneRef, Network
+
+# Next hop table entries that aren't lane indexes
+ARRIVED: Final = -1
+NO_ROUTE: Final = -2
+
+
+class RoutingTable:
+    """Next hop tables for reaching a set of destination lanes.
+
+    For each destination there is a row giving, for every lane in the
+    network, the index (see `Network.lane_index()`) of the next lane on the
+    quickest route to the end of the destination lane. Lanes are weighted by
+    the time to drive them at the speed limit. The entry is `ARRIVED` on the
+    destination lane itself, and `NO_ROUTE` if it can't be reached.
+
+    The table is built with one Dijkstra search per destination, backwards
+    over the lane graph, and stored in the smallest integer type that can
+    hold the lane indexes. Looking up next hops for any number of vehicles
+    is then a single array gather.
+
+    By default the destinations are the lanes that leave the network (lanes
+    with no connected lanes).
+    """
+
+    def __init__(
+        self, network: Network, destinations: Iterable[LaneRef] | None = None
+    ) -> None:
+        lane_refs = sorted(network.all_lanes(), key=network.lane_index)
+        self._lane_refs = lane_refs
+        if destinations is None:
+            destinations = [
+                lane_ref
+                for lane_ref in lane_refs
+                if not network.connected_lanes(lane_ref)
+            ]
+        self._destinations = list(destinations)
+        self._destination_indexes = {
+            lane_ref: i for i, lane_ref in enumerate(self._destinations)
+        }
+
+        lane_times = [
+            network.lane(lane_ref).length / network.speed_limit(lane_ref)
+            for lane_ref in lane_refs
+        ]
+        predecessors: list[list[int]] = [[] for _ in lane_refs]
+        for lane_index, lane_ref in enumerate(lane_refs):
+            for next_lane_ref in network.connected_lanes(lane_ref):
+                predecessors[network.lane_index(next_lane_ref)].append(lane_index)
+
+        dtype = np.promote_types(np.min_scalar_type(-len(lane_refs)), np.int8)
+        self._next_hops = np.full(
+            (len(self._destinations), len(lane_refs)), NO_ROUTE, dtype=dtype
+        )
+        for row, destination in enumerate(self._destinations):
+            self._search(
+                self._next_hops[row],
+                network.lane_index(destination),
+                lane_times,
+                predecessors,
+            )
+
+    @staticmethod
+    def _search(
+        next_hops: np.ndarray,
+        destination: int,
+        lane_times: Sequence[float],
+        predecessors: Sequence[Sequence[int]],
+    ) -> None:
+        # Time from the start of each lane to the end of the destination
+        time = [math.inf] * len(lane_times)
+        time[destination] = lane_times[destination]
+        next_hops[destination] = ARRIVED
+        queue = [(time[destination], destination)]
+        while queue:
+            t, lane_index = heapq.heappop(queue)
+            if t > time[lane_index]:
+                continue
+            for previous in predecessors[lane_index]:
+                previous_time = t + lane_times[previous]
+                if previous_time < time[previous]:
+                    time[previous] = previous_time
+                    next_hops[previous] = lane_index
+                    heapq.heappush(queue, (previous_time, previous))
+
+    @property
+    def destinations(self) -> Sequence[LaneRef]:
+        return tuple(self._destinations)
+
+    @property
+    def next_hops(self) -> np.ndarray:
+        """(destinations, lanes) array of next lane indexes"""
+        return self._next_hops
+
+    def destination_index(self, lane_ref: LaneRef) -> int:
+        return self._destination_indexes[lane_ref]
+
+    def lane_ref(self, lane_index: int) -> LaneRef:
+        return self._lane_refs[lane_index]
+
+    def next_lanes(
+        self, lane_indexes: np.ndarray, destination_indexes: np.ndarray
+    ) -> np.ndarray:
+        """Next hop for each (lane, destination) pair"""
+        return self._next_hops[destination_indexes, lane_indexes]
+
+
+class Routes:
+    """Destinations of individual vehicles, routed with a `RoutingTable`.
+
+    Vehicles without a destination (or that can't reach theirs) are left to
+    choose their next lane at random.
+    """
+
+    def __init__(self, table: RoutingTable) -> None:
+        self._table = table
+        self._destinations: dict[uuid.UUID, int] = {}
+
+    @property
+    def table(self) -> RoutingTable:
+        return self._table
+
+    def set_destination(self, vehicle_id: uuid.UUID, lane_ref: LaneRef) -> None:
+        self._destinations[vehicle_id] = self._table.destination_index(lane_ref)
+
+    def destination(self, vehicle_id: uuid.UUID) -> LaneRef | None:
+        if vehicle_id not in self._destinations:
+            return None
+        return self._table.destinations[self._destinations[vehicle_id]]
+
+    def remove(self, vehicle_id: uuid.UUID) -> None:
+        self._destinations.pop(vehicle_id, None)
+
+    def choose(
+        self, lane_indexes: Sequence[int], vehicle_ids: Sequence[uuid.UUID]
+    ) -> dict[uuid.UUID, LaneRef | None]:
+        """Next lane for each vehicle leaving the given lanes that has a
+        route to its destination. None means the vehicle has arrived and
+        leaves the network."""
+        routed = [
+            (lane_index, vehicle_id, self._destinations[vehicle_id])
+            for lane_index, vehicle_id in zip(lane_indexes, vehicle_ids)
+            if vehicle_id in self._destinations
+        ]
+        if not routed:
+            return {}
+        lanes, ids, destinations = zip(*routed)
+        next_lanes = self._table.next_lanes(np.array(lanes), np.array(destinations))
+
+        choices: dict[uuid.UUID, LaneRef | None] = {}
+        for vehicle_id, next_lane in zip(ids, next_lanes.tolist()):
+            if next_lane == ARRIVED:
+                choices[vehicle_id] = None
+            elif next_lane != NO_ROUTE:
+                choices[vehicle_id] = self._table.lane_ref(next_lane)
+        return choices
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import math
+from typing import Final
+
+import numpy as np
+
+# Values this small or less are counted together, as zero
+_MIN_VALUE: Final = 1e-9
+
+
+class QuantileSketch:
+    """Streaming estimate of the quantiles of a set of positive values.
+
+    Values are counted in buckets whose bounds grow geometrically (as in
+    DDSketch), so every quantile is estimated to within `relative_accuracy`
+    of the true value, whatever the distribution. Memory doesn't depend on
+    how many values are added: there is one bucket for every factor of
+    (1 + relative_accuracy) / (1 - relative_accuracy) between the smallest
+    and largest value, and once there are more than `max_buckets` the
+    lowest ones are combined (losing accuracy only at the low end).
+
+    Sketches with the same accuracy can be merged, e.g. to combine the
+    results of several runs, and merging gives the same sketch as adding all
+    the values to one.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_buckets: int = 2048):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._max_buckets = max_buckets
+        # Bucket k counts values in (gamma^(k-1), gamma^k], and counts[i] is
+        # bucket offset + i
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._offset = 0
+        self._zero_count = 0
+        self.count = 0
+
+    def add(self, values: np.ndarray | float) -> None:
+        values = np.atleast_1d(np.asarray(values, dtype=float))
+        positive = values > _MIN_VALUE
+        self._zero_count += int(values.shape[0] - np.count_nonzero(positive))
+        self.count += int(values.shape[0])
+        keys = np.ceil(np.log(values[positive]) / self._log_gamma).astype(np.int64)
+        self._add_buckets(keys, np.ones(keys.shape[0], dtype=np.int64))
+
+    def _add_buckets(self, keys: np.ndarray, counts: np.ndarray) -> None:
+        if not keys.shape[0]:
+            return
+        low = int(keys.min())
+        high = int(keys.max())
+        if self._counts.shape[0]:
+            low = min(low, self._offset)
+            high = max(high, self._offset + self._counts.shape[0] - 1)
+        if low != self._offset or high - low + 1 != self._counts.shape[0]:
+            grown = np.zeros(high - low + 1, dtype=np.int64)
+            start = self._offset - low
+            grown[start : start + self._counts.shape[0]] = self._counts
+            self._counts = grown
+            self._offset = low
+        self._counts += np.bincount(
+            keys - low, counts, minlength=self._counts.shape[0]
+        ).astype(np.int64)
+
+        excess = self._counts.shape[0] - self._max_buckets
+        if excess > 0:
+            self._counts[excess] += self._counts[:excess].sum()
+            self._counts = self._counts[excess:]
+            self._offset += excess
+
+    def merge(self, other: QuantileSketch) -> None:
+        """Add all the values counted by `other`"""
+        if other._gamma != self._gamma:
+            raise ValueError("Can only merge sketches with the same accuracy")
+        self._zero_count += other._zero_count
+        self.count += other.count
+        self._add_buckets(
+            other._offset + np.arange(other._counts.shape[0]), other._counts
+        )
+
+    def quantile(self, q: float) -> float:
+        """Estimate of the q-th quantile (0 <= q <= 1). NaN if there are no
+        values."""
+        if not self.count:
+            return math.nan
+        rank = q * (self.count - 1)
+        if rank < self._zero_count:
+            return 0.0
+        bucket = int(
+            np.searchsorted(
+                np.cumsum(self._counts), rank - self._zero_count, side="right"
+            )
+        )
+        bucket = min(bucket, self._counts.shape[0] - 1)
+        return 2 * self._gamma ** (self._offset + bucket) / (self._gamma + 1)
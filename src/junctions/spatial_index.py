@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import math
+import uuid
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterator
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from junctions.network import LaneRef, Network
+    from junctions.state.vehicle_positions import VehiclePositions
+
+# Axis aligned rectangle (x0, y0, x1, y1) with x0 <= x1 and y0 <= y1
+Rect = tuple[float, float, float, float]
+
+
+@dataclass(frozen=True)
+class LanePoint:
+    """A point on a lane, with its distance from some query point"""
+
+    lane_ref: LaneRef
+    position: float
+    distance: float
+
+
+class LaneSpatialIndex:
+    """Uniform grid index over the geometry of every lane in a network.
+
+    Each lane is approximated by a polyline with segments no longer than
+    `segment_length`, and each segment is registered in every grid cell
+    (of size `cell_size`) that its bounding box overlaps. Queries then only
+    have to look at the segments in the cells they cover.
+
+    Vehicles are not stored in the index - their coordinates are found from
+    the lane they are on and their position along it, by interpolating along
+    the lane polyline. This means the index never needs updating as the
+    simulation is stepped.
+
+    The index is built once for a network. If junctions are added to the
+    network afterwards a new index needs building.
+    """
+
+    def __init__(
+        self, network: Network, cell_size: float = 20.0, segment_length: float = 2.0
+    ) -> None:
+        self._cell_size = cell_size
+        self._lane_refs: list[LaneRef] = []
+        self._lane_lookup: dict[LaneRef, int] = {}
+        # Per lane: polyline vertex positions along the lane, and coordinates
+        self._lane_positions: list[np.ndarray] = []
+        self._lane_points: list[np.ndarray] = []
+
+        segment_lanes = []
+        segment_points = []
+        segment_positions = []
+        for lane_ref in network.all_lanes():
+            lane = network.lane(lane_ref)
+            n_points = max(2, math.ceil(lane.length / segment_length) + 1)
+            positions = np.linspace(0, lane.length, n_points)
+            points = np.array(
+                [tuple(lane.interpolate(float(p)).point) for p in positions]
+            )
+
+            lane_index = len(self._lane_refs)
+            self._lane_lookup[lane_ref] = lane_index
+            self._lane_refs.append(lane_ref)
+            self._lane_positions.append(positions)
+            self._lane_points.append(points)
+
+            segment_lanes.append(np.full(n_points - 1, lane_index))
+            segment_points.append(np.hstack((points[:-1], points[1:])))
+            segment_positions.append(positions[:-1])
+
+        # Flat segment table: lane index, start position along the lane, and
+        # (x0, y0, x1, y1) of the segment end points
+        self._segment_lane = np.concatenate(segment_lanes or [np.zeros(0, int)])
+        self._segment_position = np.concatenate(segment_positions or [np.zeros(0)])
+        self._segments = np.concatenate(segment_points or [np.zeros((0, 4))])
+
+        low = np.minimum(self._segments[:, :2], self._segments[:, 2:])
+        high = np.maximum(self._segments[:, :2], self._segments[:, 2:])
+        self._segment_bounds = np.hstack((low, high))
+
+        cells: dict[tuple[int, int], list[int]] = {}
+        low_cells = np.floor(low / cell_size).astype(int)
+        high_cells = np.floor(high / cell_size).astype(int)
+        for segment, (cx0, cy0), (cx1, cy1) in zip(
+            range(len(self._segments)), low_cells, high_cells
+        ):
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    cells.setdefault((cx, cy), []).append(segment)
+        self._cells = {
+            cell: np.array(segments, dtype=np.intp) for cell, segments in cells.items()
+        }
+
+    def _segments_in_rect(self, rect: Rect) -> np.ndarray:
+        x0, y0, x1, y1 = rect
+        cx0, cy0 = math.floor(x0 / self._cell_size), math.floor(y0 / self._cell_size)
+        cx1, cy1 = math.floor(x1 / self._cell_size), math.floor(y1 / self._cell_size)
+
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self._cells):
+            # Query covers more cells than exist, cheaper to go over them all
+            found = list(self._cells.values())
+        else:
+            found = [
+                self._cells[cell]
+                for cx in range(cx0, cx1 + 1)
+                for cy in range(cy0, cy1 + 1)
+                if (cell := (cx, cy)) in self._cells
+            ]
+        if not found:
+            return np.zeros(0, dtype=np.intp)
+
+        segments = np.unique(np.concatenate(found))
+        bounds = self._segment_bounds[segments]
+        overlaps = (
+            (bounds[:, 0] <= x1)
+            & (bounds[:, 2] >= x0)
+            & (bounds[:, 1] <= y1)
+            & (bounds[:, 3] >= y0)
+        )
+        return segments[overlaps]
+
+    def lanes_in_rect(self, rect: Rect) -> list[LaneRef]:
+        """Lanes that pass through (or close to) a rectangle.
+
+        Each segment is tested by its bounding box so a lane that only comes
+        near the corner of the rectangle may be included.
+        """
+        lane_indexes = np.unique(self._segment_lane[self._segments_in_rect(rect)])
+        return [self._lane_refs[i] for i in lane_indexes]
+
+    def nearest_lane(self, x: float, y: float, max_distance: float) -> LanePoint | None:
+        """Find the closest point on any lane to (x, y), if there is one within
+        max_distance."""
+        segments = self._segments_in_rect(
+            (x - max_distance, y - max_distance, x + max_distance, y + max_distance)
+        )
+        if segments.shape[0] == 0:
+            return None
+
+        start = self._segments[segments, :2]
+        direction = self._segments[segments, 2:] - start
+        length_squared = np.einsum("ij,ij->i", direction, direction)
+        offset = np.array([x, y]) - start
+        t = np.clip(
+            np.einsum("ij,ij->i", offset, direction)
+            / np.where(length_squared > 0, length_squared, 1),
+            0,
+            1,
+        )
+        closest = start + direction * t[:, None]
+        distance = np.hypot(closest[:, 0] - x, closest[:, 1] - y)
+
+        best = int(np.argmin(distance))
+        if distance[best] > max_distance:
+            return None
+
+        segment = segments[best]
+        return LanePoint(
+            self._lane_refs[self._segment_lane[segment]],
+            float(
+                self._segment_position[segment]
+                + t[best] * math.sqrt(length_squared[best])
+            ),
+            float(distance[best]),
+        )
+
+    def vehicle_points(self, lane_ref: LaneRef, positions: np.ndarray) -> np.ndarray:
+        """Coordinates (as an (n, 2) array) of vehicles at `positions` along
+        a lane."""
+        lane_index = self._lane_lookup[lane_ref]
+        lane_positions = self._lane_positions[lane_index]
+        lane_points = self._lane_points[lane_index]
+        return np.column_stack(
+            (
+                np.interp(positions, lane_positions, lane_points[:, 0]),
+                np.interp(positions, lane_positions, lane_points[:, 1]),
+            )
+        )
+
+    def vehicles_in_rect(
+        self, vehicle_positions: VehiclePositions, rect: Rect
+    ) -> Iterator[tuple[LaneRef, np.ndarray, np.ndarray]]:
+        """Iterate the vehicles inside a rectangle, grouped by lane.
+
+        Yields the lane, and the ids and positions of the vehicles on that lane
+        that are inside the rectangle.
+        """
+        x0, y0, x1, y1 = rect
+        for lane_ref in self.lanes_in_rect(rect):
+            positions = vehicle_positions.positions_by_lane[lane_ref]
+            if positions.shape[0] == 0:
+                continue
+            points = self.vehicle_points(lane_ref, positions)
+            inside = (
+                (points[:, 0] >= x0)
+                & (points[:, 0] <= x1)
+                & (points[:, 1] >= y0)
+                & (points[:, 1] <= y1)
+            )
+            if np.any(inside):
+                ids = vehicle_positions.ids_by_lane[lane_ref]
+                yield lane_ref, ids[inside], positions[inside]
+
+    def vehicle_at(
+        self, vehicle_positions: VehiclePositions, x: float, y: float, radius: float
+    ) -> uuid.UUID | None:
+        """The vehicle closest to (x, y), if any is within `radius`"""
+        best_id = None
+        best_distance = radius
+        rect = (x - radius, y - radius, x + radius, y + radius)
+        for lane_ref, ids, positions in self.vehicles_in_rect(vehicle_positions, rect):
+            points = self.vehicle_points(lane_ref, positions)
+            distance = np.hypot(points[:, 0] - x, points[:, 1] - y)
+            nearest = int(np.argmin(distance))
+            if distance[nearest] <= best_distance:
+                best_distance = distance[nearest]
+                best_id = ids[nearest]
+        return best_id
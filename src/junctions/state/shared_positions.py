@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import uuid
+from dataclasses import dataclass
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from junctions.state.vehicle_positions import VehiclePositions
+
+if TYPE_CHECKING:
+    from junctions.network import Network
+
+# Header fields, stored as uint64 at the start of the shared memory block
+_GENERATION = 0
+_COUNT = 1
+_LANE_COUNT = 2
+_CAPACITY = 3
+_HEADER_SIZE = 4
+
+
+class TornReadError(Exception):
+    """A consistent copy of the shared state could not be read"""
+
+
+def _layout(
+    shm: SharedMemory, lane_count: int, capacity: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    buffer = shm.buf
+    header = np.ndarray((_HEADER_SIZE,), dtype=np.uint64, buffer=buffer)
+    offset = header.nbytes
+    lane_offsets = np.ndarray(
+        (lane_count + 1,), dtype=np.int64, buffer=buffer, offset=offset
+    )
+    offset += lane_offsets.nbytes
+    ids = np.ndarray((capacity, 2), dtype=np.uint64, buffer=buffer, offset=offset)
+    offset += ids.nbytes
+    positions = np.ndarray((capacity,), dtype=np.float32, buffer=buffer, offset=offset)
+    return header, lane_offsets, ids, positions
+
+
+def _size(lane_count: int, capacity: int) -> int:
+    return 8 * (_HEADER_SIZE + lane_count + 1) + capacity * (16 + 4)
+
+
+@dataclass(frozen=True)
+class VehicleTable:
+    """Flat view of every vehicle, as published by `SharedVehiclePositions`.
+
+    Vehicles are grouped by lane (in `Network.lane_index()` order), and sorted
+    by position within each lane. The vehicles on lane i are in rows
+    `lane_offsets[i]:lane_offsets[i + 1]`. IDs are stored as two uint64 per
+    vehicle (high and low halves of `UUID.int`).
+    """
+
+    generation: int
+    lane_offsets: np.ndarray
+    ids: np.ndarray
+    positions: np.ndarray
+
+    def lane_positions(self, lane_index: int) -> np.ndarray:
+        return self.positions[
+            self.lane_offsets[lane_index] : self.lane_offsets[lane_index + 1]
+        ]
+
+    def vehicle_ids(self) -> list[uuid.UUID]:
+        return [uuid.UUID(int=(int(high) << 64) | int(low)) for high, low in self.ids]
+
+    def to_vehicle_positions(self, network: Network) -> VehiclePositions:
+        lane_refs = list(network.all_lanes())
+        lane_indexes = np.repeat(
+            [network.lane_index(lane_ref) for lane_ref in lane_refs],
+            np.diff(self.lane_offsets),
+        )
+        by_index = {network.lane_index(lane_ref): lane_ref for lane_ref in lane_refs}
+        vehicle_positions = VehiclePositions()
+        vehicle_positions.create_vehicles(
+            [by_index[i] for i in lane_indexes],
+            self.positions.tolist(),
+            self.vehicle_ids(),
+        )
+        return vehicle_positions
+
+
+class SharedVehiclePositions:
+    """Publishes vehicle positions to shared memory for other processes.
+
+    Each call to `publish()` writes every vehicle into one flat table in a
+    shared memory block, which readers in other processes can map by name
+    with `SharedVehiclePositionsReader` without copying or pickling.
+
+    The table is protected by a seqlock: a generation counter that is odd
+    while a publish is in progress, and bumped again when it is finished.
+    The writer never waits for readers - instead readers check that the
+    generation was even and unchanged over the time they were reading, and
+    try again if not.
+
+    Readers are expected to be separate processes (not forked from the
+    writer, which shares its resource tracker - see
+    `SharedVehiclePositionsReader`).
+    """
+
+    def __init__(
+        self, network: Network, capacity: int, name: str | None = None
+    ) -> None:
+        self._network = network
+        lane_count = network.lane_count()
+        self._shm = SharedMemory(
+            name=name, create=True, size=_size(lane_count, capacity)
+        )
+        self._header, self._lane_offsets, self._ids, self._positions = _layout(
+            self._shm, lane_count, capacity
+        )
+        self._header[:] = 0
+        self._header[_LANE_COUNT] = lane_count
+        self._header[_CAPACITY] = capacity
+        self._lane_offsets[:] = 0
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def generation(self) -> int:
+        return int(self._header[_GENERATION])
+
+    def publish(self, vehicle_positions: VehiclePositions) -> int:
+        """Write the current vehicle positions, returning the new generation"""
+        network = self._network
+        counts = np.zeros(network.lane_count(), dtype=np.int64)
+        lanes = []
+        for lane_ref, vehicle_data in vehicle_positions.group_by_lane():
+            if vehicle_data.shape[0]:
+                lane_index = network.lane_index(lane_ref)
+                counts[lane_index] = vehicle_data.shape[0]
+                lanes.append((lane_index, vehicle_data))
+
+        total = int(counts.sum())
+        if total > self._positions.shape[0]:
+            raise ValueError(
+                f"{total} vehicles do not fit in capacity {self._positions.shape[0]}"
+            )
+
+        self._header[_GENERATION] += 1  # odd: write in progress
+        self._lane_offsets[0] = 0
+        np.cumsum(counts, out=self._lane_offsets[1:])
+        for lane_index, vehicle_data in lanes:
+            start = self._lane_offsets[lane_index]
+            end = start + vehicle_data.shape[0]
+            self._positions[start:end] = vehicle_data["position"]
+            ints = [vehicle_id.int for vehicle_id in vehicle_data["id"]]
+            self._ids[start:end, 0] = [i >> 64 for i in ints]
+            self._ids[start:end, 1] = [i & 0xFFFFFFFFFFFFFFFF for i in ints]
+        self._header[_COUNT] = total
+        self._header[_GENERATION] += 1  # even: consistent again
+
+        return self.generation
+
+    def close(self) -> None:
+        """Release and remove the shared memory block"""
+        del self._header, self._lane_offsets, self._ids, self._positions
+        self._shm.close()
+        self._shm.unlink()
+
+
+class SharedVehiclePositionsReader:
+    """Maps a `SharedVehiclePositions` published by another process.
+
+    `view()` gives a zero copy view of the current table. The writer may
+    change it at any time, so once finished with the view check it with
+    `is_consistent()`, and discard anything computed from it if not. Use
+    `snapshot()` to get a copy that is known to be consistent.
+    """
+
+    def __init__(self, name: str) -> None:
+        self._shm = SharedMemory(name=name)
+        # Attaching registers the block with this process's resource tracker,
+        # which would remove it when this process exits - but it belongs to
+        # the writer.
+        resource_tracker.unregister(self._shm._name, "shared_memory")  # type: ignore
+        header = np.ndarray((_HEADER_SIZE,), dtype=np.uint64, buffer=self._shm.buf)
+        lane_count = int(header[_LANE_COUNT])
+        capacity = int(header[_CAPACITY])
+        del header
+        self._header, self._lane_offsets, self._ids, self._positions = _layout(
+            self._shm, lane_count, capacity
+        )
+
+    def view(self) -> VehicleTable | None:
+        """Zero copy view of the table, or None if a publish is in progress"""
+        generation = int(self._header[_GENERATION])
+        if generation % 2:
+            return None
+        count = int(self._header[_COUNT])
+        return VehicleTable(
+            generation, self._lane_offsets, self._ids[:count], self._positions[:count]
+        )
+
+    def is_consistent(self, table: VehicleTable) -> bool:
+        """Whether the table has not been written to since the view was taken"""
+        return int(self._header[_GENERATION]) == table.generation
+
+    def snapshot(self, max_attempts: int = 100) -> VehicleTable:
+        """Copy of the table, retrying until a consistent copy is read"""
+        for _ in range(max_attempts):
+            table = self.view()
+            if table is None:
+                continue
+            copy = VehicleTable(
+                table.generation,
+                table.lane_offsets.copy(),
+                table.ids.copy(),
+                table.positions.copy(),
+            )
+            if self.is_consistent(table):
+                return copy
+        raise TornReadError(f"no consistent read in {max_attempts} attempts")
+
+    def close(self) -> None:
+        del self._header, self._lane_offsets, self._ids, self._positions
+        self._shm.close()
@@ -1,9 +1,9 @@
 from __future__ import annotations
 
+import itertools
 import uuid
-from collections import defaultdict
 from copy import deepcopy
-from typing import Iterable, Mapping, MutableMapping, TypedDict
+from typing import Callable, Iterable, MutableMapping, Sequence, TypedDict
 
 import numpy as np
 
@@ -15,20 +15,45 @@ class VehiclePosition(TypedDict):
     position: float
 
 
+_VEHICLE_DTYPE = [("position", "f4"), ("id", "O")]
+
+# Returned for lanes with no vehicles, without adding them to the storage
+_NO_VEHICLES = np.array([], dtype=_VEHICLE_DTYPE)
+_NO_VEHICLES.flags.writeable = False
+
+
 class VehiclePositionsByLane:
-    def __init__(self, storage: Mapping[LaneRef, np.ndarray]) -> None:
-        self._storage = storage
+    def __init__(self, lane: Callable[[LaneRef], np.ndarray]) -> None:
+        self._lane = lane
 
     def __getitem__(self, lane_ref: LaneRef) -> np.ndarray:
-        return self._storage[lane_ref]["position"]
+        return self._lane(lane_ref)["position"]
 
 
 class VehicleIdsByLane:
-    def __init__(self, storage: Mapping[LaneRef, np.ndarray]) -> None:
-        self._storage = storage
+    def __init__(self, lane: Callable[[LaneRef], np.ndarray]) -> None:
+        self._lane = lane
 
     def __getitem__(self, lane_ref: LaneRef) -> np.ndarray:
-        return self._storage[lane_ref]["id"]
+        return self._lane(lane_ref)["id"]
+
+
+class _FreeFlow:
+    """A lane whose vehicles are all moving at the same speed, so their
+    positions are only brought up to date when they are read"""
+
+    __slots__ = ("vehicle_data", "speed", "since")
+
+    def __init__(self, vehicle_data: np.ndarray, speed: float, since: float) -> None:
+        self.vehicle_data = vehicle_data
+        self.speed = speed
+        self.since = since
+
+    def catch_up(self, clock: float) -> np.ndarray:
+        if clock != self.since:
+            self.vehicle_data["position"] += self.speed * (clock - self.since)
+            self.since = clock
+        return self.vehicle_data
 
 
 class VehiclePositions:
@@ -36,6 +61,12 @@ class VehiclePositions:
 
     Each vehicle is on a lane (referenced by a LaneRef object) and has a position
     from the start of that lane.
+
+    Lanes can be put in free flow with set_free_flow(), when every vehicle on
+    them is moving at the same speed. Their positions then follow from the
+    clock (see advance_clock()), and are only calculated when the lane is
+    read. The lane goes back to normal when vehicles are added to or removed
+    from it, or with end_free_flow().
     """
 
     def __init__(self):
@@ -47,9 +78,14 @@ class VehiclePositions:
         # Importantly, the structured array is always sorted by ascending order
         # of position, which makes various aspects of iterating through the
         # vehicles (for solving the sim) more efficient.
-        self._storage: MutableMapping[LaneRef, np.ndarray] = defaultdict(
-            VehiclePositions._empty_storage
-        )
+        #
+        # Only lanes with vehicles on them have an entry (see _set_lane()), so
+        # iterating the storage only visits occupied lanes, and reading an
+        # empty lane doesn't add one.
+        self._storage: dict[LaneRef, np.ndarray] = {}
+        # Lanes in free flow are kept here instead of in _storage
+        self._free_flow: dict[LaneRef, _FreeFlow] = {}
+        self._clock = 0.0
         # Second, we maintain an index by vehicle ID, which is useful for quickly
         # finding where a vehicle is when the ID is already known. (This is
         # generally less useful in simulation stepping, where what we need to
@@ -60,18 +96,39 @@ class VehiclePositions:
         # make a deep clone of the storage data and return it
         clone = VehiclePositions()
         clone._storage = deepcopy(self._storage)
+        clone._free_flow = deepcopy(self._free_flow)
+        clone._clock = self._clock
         clone._vehicle_storage_map = deepcopy(self._vehicle_storage_map)
         return clone
 
     @staticmethod
     def _empty_storage() -> np.ndarray:
-        return np.array([], dtype=[("position", "f4"), ("id", "O")])
-
-    def create_vehicle(self, lane_ref: LaneRef, position: float) -> uuid.UUID:
-        # insert a new vehicle
-        storage = self._storage[lane_ref]
-
-        new_id = uuid.uuid4()
+        return np.array([], dtype=_VEHICLE_DTYPE)
+
+    def _lane(self, lane_ref: LaneRef) -> np.ndarray:
+        vehicle_data = self._storage.get(lane_ref)
+        if vehicle_data is not None:
+            return vehicle_data
+        free_flow = self._free_flow.get(lane_ref)
+        if free_flow is not None:
+            return free_flow.catch_up(self._clock)
+        return _NO_VEHICLES
+
+    def _set_lane(self, lane_ref: LaneRef, vehicle_data: np.ndarray) -> None:
+        self._free_flow.pop(lane_ref, None)
+        if vehicle_data.shape[0]:
+            self._storage[lane_ref] = vehicle_data
+        else:
+            self._storage.pop(lane_ref, None)
+
+    def create_vehicle(
+        self, lane_ref: LaneRef, position: float, id: uuid.UUID | None = None
+    ) -> uuid.UUID:
+        # insert a new vehicle, with a new ID unless we were given one (e.g.
+        # when moving a vehicle over from another VehiclePositions)
+        storage = self._lane(lane_ref)
+
+        new_id = uuid.uuid4() if id is None else id
 
         # we have to be careful to insert it at the right place...
         vehicle_index = np.searchsorted(self.positions_by_lane[lane_ref], position)
@@ -79,7 +136,7 @@ class VehiclePositions:
         updated = np.hstack(
             (
                 storage[:vehicle_index],
-                np.array([(position, new_id)], dtype=[("position", "f4"), ("id", "O")]),
+                np.array([(position, new_id)], dtype=_VEHICLE_DTYPE),
                 storage[vehicle_index:],
             )
         )
@@ -93,37 +150,71 @@ class VehiclePositions:
             )
 
         # now set the storage data
-        self._storage[lane_ref] = updated
+        self._set_lane(lane_ref, updated)
 
         # and insert the reverse lookup into the index
         self._vehicle_storage_map[new_id] = (lane_ref, int(vehicle_index))
 
         return new_id
 
+    def create_vehicles(
+        self,
+        lane_refs: Sequence[LaneRef],
+        positions: Sequence[float],
+        ids: Sequence[uuid.UUID] | None = None,
+    ) -> list[uuid.UUID]:
+        """Insert many vehicles at once.
+
+        Vehicle i is created on lane_refs[i] at positions[i]. The new IDs are
+        returned in the same order. This is cheaper than repeated calls to
+        create_vehicle() because each affected lane is only rebuilt once.
+        """
+        new_ids = [uuid.uuid4() for _ in lane_refs] if ids is None else list(ids)
+
+        by_lane: dict[LaneRef, list[int]] = {}
+        for i, lane_ref in enumerate(lane_refs):
+            by_lane.setdefault(lane_ref, []).append(i)
+
+        for lane_ref, indexes in by_lane.items():
+            storage = self._lane(lane_ref)
+            new_rows = np.array(
+                [(positions[i], new_ids[i]) for i in indexes], dtype=storage.dtype
+            )
+            updated = np.hstack((storage, new_rows))
+            updated = updated[np.argsort(updated["position"], kind="stable")]
+
+            # the whole lane may have been reordered so rebuild its index
+            for vehicle_index, vehicle in enumerate(updated["id"]):
+                self._vehicle_storage_map[vehicle] = (lane_ref, vehicle_index)
+
+            self._set_lane(lane_ref, updated)
+
+        return new_ids
+
     def switch_lane(self, id: uuid.UUID, lane_ref: LaneRef, position: float) -> None:
         # move vehicle from wherever it currently is to a new lane ref/position
         old_lane_ref, old_index = self._vehicle_storage_map[id]
 
         # Update the old lane
-        old_storage = self._storage[old_lane_ref]
+        old_storage = self._lane(old_lane_ref)
         for i, vehicle in enumerate(old_storage[old_index + 1 :]["id"]):
             self._vehicle_storage_map[vehicle] = (
                 old_lane_ref,
                 old_index + i,
             )
         old_storage = np.hstack((old_storage[:old_index], old_storage[old_index + 1 :]))
-        self._storage[old_lane_ref] = old_storage
+        self._set_lane(old_lane_ref, old_storage)
 
         # Add to new lane
         new_vehicle_index = int(
             np.searchsorted(self.positions_by_lane[lane_ref], position)
         )
-        new_storage = self._storage[lane_ref]
+        new_storage = self._lane(lane_ref)
 
         new_storage = np.hstack(
             (
                 new_storage[:new_vehicle_index],
-                np.array([(position, id)], dtype=[("position", "f4"), ("id", "O")]),
+                np.array([(position, id)], dtype=_VEHICLE_DTYPE),
                 new_storage[new_vehicle_index:],
             )
         )
@@ -137,21 +228,20 @@ class VehiclePositions:
 
         self._vehicle_storage_map[id] = (lane_ref, new_vehicle_index)
 
-        self._storage[lane_ref] = new_storage
+        self._set_lane(lane_ref, new_storage)
 
     def remove(self, id: uuid.UUID) -> None:
         old_lane_ref, old_index = self._vehicle_storage_map[id]
 
         del self._vehicle_storage_map[id]
 
-        for i, (_, id) in enumerate(self._storage[old_lane_ref][old_index + 1 :]):
+        old_storage = self._lane(old_lane_ref)
+        for i, (_, id) in enumerate(old_storage[old_index + 1 :]):
             self._vehicle_storage_map[id] = (old_lane_ref, old_index + i)
 
-        self._storage[old_lane_ref] = np.hstack(
-            (
-                self._storage[old_lane_ref][:old_index],
-                self._storage[old_lane_ref][old_index + 1 :],
-            )
+        self._set_lane(
+            old_lane_ref,
+            np.hstack((old_storage[:old_index], old_storage[old_index + 1 :])),
         )
 
     @property
@@ -168,7 +258,7 @@ class VehiclePositions:
         the position of a vehicle while guaranteeing that the ordering
         is not broken use switch_lane().
         """
-        return VehiclePositionsByLane(self._storage)
+        return VehiclePositionsByLane(self._lane)
 
     @property
     def ids_by_lane(self) -> VehicleIdsByLane:
@@ -185,7 +275,7 @@ class VehiclePositions:
         class. DO NOT change the elements of the returned array as
         the storage state will become inconsistent.
         """
-        return VehicleIdsByLane(self._storage)
+        return VehicleIdsByLane(self._lane)
 
     def __getitem__(self, id: uuid.UUID) -> VehiclePosition:
         """For retrieving the vehicle lane/position by vehicle ID"""
@@ -194,6 +284,48 @@ class VehiclePositions:
             {"lane_ref": lane_ref, "position": self.positions_by_lane[lane_ref][idx]}
         )
 
-    def group_by_lane(self) -> Iterable[tuple[LaneRef, np.ndarray]]:
-        """Iterate all the vehicles in the system, grouped by lane."""
-        return self._storage.items()
+    def group_by_lane(
+        self, include_free_flow: bool = True
+    ) -> Iterable[tuple[LaneRef, np.ndarray]]:
+        """Iterate all the vehicles in the system, grouped by lane.
+
+        Only lanes with vehicles on them are visited. Vehicles must not be
+        added, moved or removed while iterating. Lanes in free flow are left
+        out if include_free_flow is False.
+        """
+        if not include_free_flow or not self._free_flow:
+            return self._storage.items()
+        return itertools.chain(
+            self._storage.items(),
+            (
+                (lane_ref, free_flow.catch_up(self._clock))
+                for lane_ref, free_flow in self._free_flow.items()
+            ),
+        )
+
+    def occupied_lanes(self) -> Iterable[LaneRef]:
+        """The lanes that have at least one vehicle on them"""
+        return itertools.chain(self._storage.keys(), self._free_flow.keys())
+
+    @property
+    def clock(self) -> float:
+        return self._clock
+
+    def advance_clock(self, dt: float) -> None:
+        """Move the vehicles on lanes in free flow on by dt seconds"""
+        self._clock += dt
+
+    def set_free_flow(self, lane_ref: LaneRef, speed: float) -> None:
+        """Move every vehicle on the (occupied) lane at `speed` as the clock
+        advances, until the lane is changed or end_free_flow() is called."""
+        self._free_flow[lane_ref] = _FreeFlow(
+            self._storage.pop(lane_ref), speed, self._clock
+        )
+
+    def end_free_flow(self, lane_ref: LaneRef) -> None:
+        free_flow = self._free_flow.pop(lane_ref, None)
+        if free_flow is not None:
+            self._storage[lane_ref] = free_flow.catch_up(self._clock)
+
+    def is_free_flow(self, lane_ref: LaneRef) -> bool:
+        return lane_ref in self._free_flow
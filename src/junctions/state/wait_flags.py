@@ -1,19 +1,91 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
 from junctions.network import LaneRef
 
+if TYPE_CHECKING:
+    from junctions.network import Network
+
 
 class WaitFlags:
-    def __init__(self):
-        self._wait_flags: set[LaneRef] = set()
+    """Whether vehicles have to wait before entering each lane.
+
+    The flags are a boolean array indexed by `Network.lane_index()`, so they
+    can be gathered for many lanes at once and compared between steps, as
+    well as looked up by `LaneRef`.
+
+    Without a network the flags are only kept by `LaneRef`. Use
+    `with_network()` to get them by lane index; `diff()` does this with the
+    network of the other flags.
+    """
+
+    def __init__(self, network: Network | None = None, flags: np.ndarray | None = None):
+        self._network = network
+        self._lanes: dict[LaneRef, bool] = {}
+        if flags is None:
+            flags = np.zeros(0 if network is None else network.lane_count(), dtype=bool)
+        self._flags = flags
 
     def __getitem__(self, lane_ref: LaneRef) -> bool:
-        return lane_ref in self._wait_flags
+        if self._network is None:
+            return self._lanes.get(lane_ref, False)
+        return bool(self._flags[self._network.lane_index(lane_ref)])
 
     def __setitem__(self, lane_ref: LaneRef, value: bool) -> None:
-        if value:
-            self._wait_flags |= {lane_ref}
+        if self._network is None:
+            if value:
+                self._lanes[lane_ref] = True
+            else:
+                self._lanes.pop(lane_ref, None)
         else:
-            try:
-                self._wait_flags.remove(lane_ref)
-            except KeyError:
-                # Not an existing member of the set - does not matter
-                pass
+            self._flags[self._network.lane_index(lane_ref)] = value
+
+    def with_network(self, network: Network) -> WaitFlags:
+        """The flags indexed by the lanes of `network` (these flags, if they
+        already are)"""
+        if self._network is network:
+            return self
+        wait_flags = WaitFlags(network)
+        if self._network is None:
+            for lane_ref in self._lanes:
+                wait_flags[lane_ref] = True
+        else:
+            for lane_ref in network.all_lanes():
+                wait_flags[lane_ref] = self[lane_ref]
+        return wait_flags
+
+    def _indexed(self) -> np.ndarray:
+        if self._network is None:
+            raise ValueError(
+                "Wait flags without a network have no lane indexes, "
+                "see with_network()"
+            )
+        return self._flags
+
+    @property
+    def flags(self) -> np.ndarray:
+        """Read only view of the flags, by lane index"""
+        view = self._indexed().view()
+        view.flags.writeable = False
+        return view
+
+    def gather(self, lane_indexes: np.ndarray) -> np.ndarray:
+        """Flags of the lanes with the given indexes"""
+        return self._indexed()[lane_indexes]
+
+    def diff(self, previous: WaitFlags) -> np.ndarray:
+        """Indexes of the lanes whose flag is different to `previous`"""
+        network = self._network or previous._network
+        if network is None:
+            raise ValueError("Can't diff wait flags when neither has a network")
+        current = self.with_network(network)._flags
+        before = previous.with_network(network)._flags
+        return np.flatnonzero(current != before)
+
+    def copy(self) -> WaitFlags:
+        wait_flags = WaitFlags(self._network, self._flags.copy())
+        wait_flags._lanes = dict(self._lanes)
+        return wait_flags
@@ -1,22 +1,51 @@
 from __future__ import annotations
 
-import random
+import heapq
+import math
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import TYPE_CHECKING, Final
+from time import perf_counter
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Final,
+    Iterator,
+    Mapping,
+    Sequence,
+    TypeVar,
+)
 
 import numpy as np
 
+from junctions.lane_events import ENTRY, EXIT
 from junctions.network import LaneRef
-from junctions.priority_wait import priority_wait
+from junctions.priority_wait import priority_wait, time_to_wait_change
 from junctions.state.vehicle_positions import VehiclePositions
 from junctions.state.wait_flags import WaitFlags
+from junctions.turning import LaneChooser
 
 if TYPE_CHECKING:
+    from junctions.demand import Demand
+    from junctions.journal import StepJournal
+    from junctions.journeys import JourneyTimes
+    from junctions.lane_events import LaneEventLog
+    from junctions.metrics import TrafficMetrics
     from junctions.network import Network
+    from junctions.profiling import StepperStats
+    from junctions.rng import RandomStreams
+    from junctions.routing import Routes
 
 VEHICLE_SEPARATION_LIMIT: Final = 5
 
+# When choosing an adaptive time step, vehicles closing up behind a stopped
+# vehicle are stepped to just inside the separation limit. Stepping to
+# exactly the limit wouldn't stop them (the limit is only applied to gaps
+# strictly less than it), so they would overshoot on the following step.
+GAP_TOLERANCE: Final = 1e-3
+
+T = TypeVar("T")
+
 
 @dataclass
 class LaneChange:
@@ -30,38 +59,351 @@ class RemoveVehicle:
     id: uuid.UUID
 
 
+def _read_only(array: np.ndarray) -> np.ndarray:
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+# Positions and IDs of a lane with no vehicles, in a frame
+_EMPTY_LANE: Final = (
+    _read_only(np.zeros(0, dtype=np.float32)),
+    _read_only(np.zeros(0, dtype=object)),
+)
+
+
+@dataclass(frozen=True)
+class Frame:
+    """The state of the simulation after a step of `Stepper.run()`.
+
+    Frames don't copy anything: the arrays are read only views onto the
+    simulation state, so they are only valid until the run carries on.
+    """
+
+    time: float
+    step: int
+    wait_flags: np.ndarray
+    # Positions and IDs of the vehicles on each occupied lane
+    vehicles: Mapping[LaneRef, tuple[np.ndarray, np.ndarray]]
+
+    def lanes(self) -> Iterator[tuple[LaneRef, np.ndarray, np.ndarray]]:
+        """The positions and IDs of the vehicles on each occupied lane"""
+        for lane_ref, (positions, ids) in self.vehicles.items():
+            yield lane_ref, positions, ids
+
+    def positions(self, lane_ref: LaneRef) -> np.ndarray:
+        return self.vehicles.get(lane_ref, _EMPTY_LANE)[0]
+
+    def ids(self, lane_ref: LaneRef) -> np.ndarray:
+        return self.vehicles.get(lane_ref, _EMPTY_LANE)[1]
+
+
 class Stepper:
     """Utility for stepping the simulation in time
 
 
     The algorithm is defined in doc/03-vehicles.md
+
+    When vehicles reach the end of a lane they pick the next lane at random,
+    in proportion to the connection weights (see `Network.connect_lanes()`).
+    By default this uses `rng` (a new NumPy generator if it isn't given, so
+    pass a seeded one to repeat a run). If a `seed` is given, each
+    choice is instead derived from the seed, the vehicle ID and the lane.
+    That only repeats a run if the vehicle IDs are the same too: they are
+    random unless given to `VehiclePositions.create_vehicle()`, or made by a
+    `Demand` with `streams`. With `streams`, choices come from their
+    lane choice stream (see `RandomStreams`), for common random numbers
+    between variants of a network. Vehicles given a destination in `routes`
+    follow the quickest route to it instead, and leave the network at the end
+    of the destination lane.
+
+    With `lookahead`, the separation limit also applies across lane ends: the
+    lead vehicle on a lane stops if it is within the limit of the last vehicle
+    on the lane it is going to move onto. Its next lane is chosen as soon as it
+    is the lead vehicle, rather than when it reaches the end of the lane.
+
+    With `threads` > 1 the per-lane work of moving vehicles and finding the
+    ones that have reached the end of their lane is split over a thread pool.
+    NumPy releases the GIL for large arrays, so this helps when there are many
+    vehicles per lane. Results are merged in lane order, so stepping gives the
+    same result as with a single thread. Call `close()` when finished with the
+    stepper to shut down the pool.
+
+    With `free_flow`, lanes where every vehicle is moving freely (no gaps
+    under the separation limit, and the lead vehicle not yet near the end)
+    are put in free flow (see `VehiclePositions.set_free_flow()`). Their
+    vehicles are moved by the clock instead of on every step, until the lead
+    vehicle gets within the separation limit of the end of the lane or the
+    lane changes, so long uncongested lanes cost next to nothing.
     """
 
-    def __init__(self, network: Network, vehicle_positions: VehiclePositions) -> None:
+    def __init__(
+        self,
+        network: Network,
+        vehicle_positions: VehiclePositions,
+        *,
+        stats: StepperStats | None = None,
+        metrics: TrafficMetrics | None = None,
+        demand: Demand | None = None,
+        seed: int | None = None,
+        threads: int = 1,
+        routes: Routes | None = None,
+        lookahead: bool = False,
+        free_flow: bool = False,
+        journal: StepJournal | None = None,
+        lane_events: LaneEventLog | None = None,
+        journeys: JourneyTimes | None = None,
+        streams: RandomStreams | None = None,
+        rng: np.random.Generator | None = None,
+    ) -> None:
         self._network = network
         self._vehicle_positions = vehicle_positions
         self._wait_flags: WaitFlags | None = None
-        self._next_lane_choice: dict[uuid.UUID, LaneRef] = {}
+        self._next_lane_choice: dict[uuid.UUID, LaneRef | None] = {}
+        self._stats = stats
+        self._metrics = metrics
+        self._demand = demand
+        self._threads = threads
+        self._executor = ThreadPoolExecutor(threads) if threads > 1 else None
+        self._routes = routes
+        self._lane_chooser = LaneChooser(network, seed, streams, rng)
+        self._lookahead = lookahead
+        self._lane_refs: list[LaneRef] = []
+        self._lane_lengths = np.zeros(0)
+        # Chosen next lane of the lead vehicle on each lane, and its ID
+        self._lead_successors = np.zeros(0, dtype=np.intp)
+        self._lead_ids: list[uuid.UUID | None] = []
+        self._free_flow = free_flow
+        self._journal = journal
+        self._lane_events = lane_events
+        self._journeys = journeys
+        # Clock time at which each lane in free flow has to go back to being
+        # stepped, as a heap. Entries for lanes that have since left free
+        # flow (or been put back in with a new end time) are skipped.
+        self._free_flow_ends: list[tuple[float, int, LaneRef]] = []
+        self._free_flow_end: dict[LaneRef, float] = {}
+
+    def close(self) -> None:
+        """Shut down the thread pool, if there is one"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
 
     @property
     def wait_flags(self) -> WaitFlags | None:
         return self._wait_flags
 
-    def _move_vehicles(self, dt: float):
-        """Move all the vehicles according to the speed limit of the lane
-        they are on. Stop if they are blocked by a vehicle in front.
-        """
-        for lane_ref, vehicle_data in self._vehicle_positions.group_by_lane():
-            speed_limit = self._network.speed_limit(lane_ref)
+    @property
+    def stats(self) -> StepperStats | None:
+        """Per-phase timings, or None if the stepper was created without stats"""
+        return self._stats
 
-            position = vehicle_data["position"]
-            movement = np.ones_like(position) * dt * speed_limit
+    @property
+    def metrics(self) -> TrafficMetrics | None:
+        """Traffic statistics, or None if the stepper was created without metrics"""
+        return self._metrics
 
-            gap = np.diff(position)
+    @property
+    def demand(self) -> Demand | None:
+        return self._demand
+
+    @property
+    def routes(self) -> Routes | None:
+        return self._routes
+
+    @property
+    def journal(self) -> StepJournal | None:
+        """Changes made by the last step, or None if the stepper was created
+        without a journal"""
+        return self._journal
+
+    @property
+    def lane_events(self) -> LaneEventLog | None:
+        return self._lane_events
 
-            movement[:-1][gap < VEHICLE_SEPARATION_LIMIT] = 0
+    @property
+    def journeys(self) -> JourneyTimes | None:
+        return self._journeys
+
+    def _occupied_lanes(self) -> list[tuple[LaneRef, np.ndarray]]:
+        # Lanes in free flow move by themselves, so they are left out
+        return list(
+            self._vehicle_positions.group_by_lane(include_free_flow=not self._free_flow)
+        )
+
+    def _map_lanes(
+        self,
+        kernel: Callable[[LaneRef, np.ndarray], T],
+        lanes: list[tuple[LaneRef, np.ndarray]],
+    ) -> list[T]:
+        """Apply a per-lane kernel to each lane, returning the results in lane
+        order. With a thread pool the lanes are split into contiguous chunks
+        of roughly equal numbers of vehicles, one chunk per thread. Kernels
+        must only modify the data of the lane they are given."""
+        if self._executor is None or len(lanes) < 2:
+            return [kernel(lane_ref, vehicle_data) for lane_ref, vehicle_data in lanes]
+
+        vehicle_counts = np.cumsum([vehicle_data.shape[0] for _, vehicle_data in lanes])
+        bounds = np.searchsorted(
+            vehicle_counts,
+            np.linspace(0, vehicle_counts[-1], self._threads + 1)[1:-1],
+        )
+        chunks = np.split(np.arange(len(lanes)), bounds)
+
+        def run_chunk(chunk: np.ndarray) -> list[T]:
+            return [kernel(*lanes[i]) for i in chunk]
+
+        return [
+            result
+            for chunk_results in self._executor.map(run_chunk, chunks)
+            for result in chunk_results
+        ]
+
+    def _move_lane(
+        self,
+        lane_ref: LaneRef,
+        vehicle_data: np.ndarray,
+        dt: float,
+        lead_blocked: bool = False,
+    ) -> int:
+        # Returns the number of vehicles held up by the vehicle in front
+        speed_limit = self._network.speed_limit(lane_ref)
+
+        position = vehicle_data["position"]
+        movement = np.ones_like(position) * dt * speed_limit
+
+        gap = np.diff(position)
+
+        queued = gap < VEHICLE_SEPARATION_LIMIT
+        movement[:-1][queued] = 0
+        if lead_blocked:
+            movement[-1] = 0
+
+        position[:] += movement
+
+        return int(np.count_nonzero(queued)) + lead_blocked
+
+    def _blocked_leads(self, lanes: list[tuple[LaneRef, np.ndarray]]) -> set[LaneRef]:
+        """Lanes whose lead vehicle is within the separation limit of the last
+        vehicle on the lane it is going to move on to."""
+        network = self._network
+        lane_count = network.lane_count()
+        if self._lane_lengths.shape[0] != lane_count:
+            self._lane_refs = sorted(network.all_lanes(), key=network.lane_index)
+            self._lane_lengths = np.array(
+                [network.lane(lane_ref).length for lane_ref in self._lane_refs]
+            )
+            self._lead_successors = np.arange(lane_count)
+            self._lead_ids = [None] * lane_count
+        lane_indexes = np.array([network.lane_index(lane_ref) for lane_ref, _ in lanes])
+
+        # Next lane of the lead vehicle on each lane, by lane index (the lane
+        # itself if it has nowhere to go, which can never block it). It is
+        # only chosen when a vehicle becomes the lead, not on every step.
+        lead_ids = [vehicle_data["id"][-1] for _, vehicle_data in lanes]
+        next_lane_choice = self._next_lane_choice
+        new_leads = [
+            (i, lead_id)
+            for i, lead_id in enumerate(lead_ids)
+            if lead_id != self._lead_ids[lane_indexes[i]]
+            or lead_id not in next_lane_choice
+        ]
+        if new_leads and self._routes is not None:
+            self._route_vehicles(
+                [int(lane_indexes[i]) for i, _ in new_leads],
+                [lead_id for _, lead_id in new_leads],
+            )
+        for i, lead_id in new_leads:
+            lane_index = int(lane_indexes[i])
+            next_lane_ref = self._choose_new_lane(lanes[i][0], lead_id)
+            self._lead_successors[lane_index] = (
+                lane_index
+                if next_lane_ref is None
+                else network.lane_index(next_lane_ref)
+            )
+            self._lead_ids[lane_index] = lead_id
+        successor = self._lead_successors[lane_indexes]
+
+        # Position of the last vehicle on every lane (infinite if empty)
+        tails = np.full(lane_count, np.inf)
+        tails[lane_indexes] = [vehicle_data["position"][0] for _, vehicle_data in lanes]
+        if self._free_flow:
+            # Lanes in free flow aren't stepped, so look up any that are next
+            vehicle_positions = self._vehicle_positions
+            for lane_index in np.unique(successor[np.isinf(tails[successor])]):
+                lane_ref = self._lane_refs[lane_index]
+                if vehicle_positions.is_free_flow(lane_ref):
+                    tails[lane_index] = vehicle_positions.positions_by_lane[lane_ref][0]
+
+        lead = np.array([vehicle_data["position"][-1] for _, vehicle_data in lanes])
+        gap = self._lane_lengths[lane_indexes] - lead + tails[successor]
+        blocked = (gap < VEHICLE_SEPARATION_LIMIT) & (successor != lane_indexes)
+        return {lanes[i][0] for i in np.flatnonzero(blocked)}
 
-            position[:] += movement
+    def _move_vehicles(self, dt: float):
+        """Move all the vehicles according to the speed limit of the lane
+        they are on. Stop if they are blocked by a vehicle in front.
+        """
+        if self._free_flow:
+            self._end_free_flow(dt)
+        lanes = self._occupied_lanes()
+        blocked = self._blocked_leads(lanes) if self._lookahead and lanes else set()
+        if self._free_flow:
+            self._vehicle_positions.advance_clock(dt)
+        queued = self._map_lanes(
+            lambda lane_ref, vehicle_data: self._move_lane(
+                lane_ref, vehicle_data, dt, lane_ref in blocked
+            ),
+            lanes,
+        )
+        if self._free_flow:
+            self._start_free_flow(lanes, queued, blocked)
+
+        metrics = self._metrics
+        if metrics is not None:
+            for (lane_ref, _), n_queued in zip(lanes, queued):
+                if n_queued:
+                    metrics.record_queue(self._network.lane_index(lane_ref), n_queued)
+
+    def _end_free_flow(self, dt: float) -> None:
+        # Put back lanes whose lead vehicle gets near the end within dt
+        vehicle_positions = self._vehicle_positions
+        until = vehicle_positions.clock + dt
+        ends = self._free_flow_ends
+        while ends and ends[0][0] <= until:
+            end, _, lane_ref = heapq.heappop(ends)
+            if self._free_flow_end.get(lane_ref) == end:
+                del self._free_flow_end[lane_ref]
+                vehicle_positions.end_free_flow(lane_ref)
+
+    def _start_free_flow(
+        self,
+        lanes: list[tuple[LaneRef, np.ndarray]],
+        queued: list[int],
+        blocked: set[LaneRef],
+    ) -> None:
+        # Every vehicle on a lane with nothing queued moves at the speed limit,
+        # so the gaps stay the same until the lead vehicle nears the end
+        network = self._network
+        vehicle_positions = self._vehicle_positions
+        clock = vehicle_positions.clock
+        for (lane_ref, vehicle_data), n_queued in zip(lanes, queued):
+            if n_queued or lane_ref in blocked:
+                continue
+            speed_limit = network.speed_limit(lane_ref)
+            distance = (
+                network.lane(lane_ref).length
+                - VEHICLE_SEPARATION_LIMIT
+                - float(vehicle_data["position"][-1])
+            )
+            if distance <= 0:
+                continue
+            end = clock + distance / speed_limit
+            vehicle_positions.set_free_flow(lane_ref, speed_limit)
+            self._free_flow_end[lane_ref] = end
+            heapq.heappush(
+                self._free_flow_ends, (end, network.lane_index(lane_ref), lane_ref)
+            )
 
     def _calculate_lane_changes(self) -> list[LaneChange | RemoveVehicle]:
         """For vehicles that have moved past the end of their current lane,
@@ -79,17 +421,32 @@ class Stepper:
 
         """
         changes = []
-
-        for lane_ref, vehicle_data in self._vehicle_positions.group_by_lane():
+        metrics = self._metrics
+
+        # Index where the vehicles are past the lane end - the lane data is
+        # sorted so vehicles after this index are past the end. Lane choices
+        # are then made one lane at a time, in lane order, so the result does
+        # not depend on how the lanes were split between threads.
+        lanes = self._occupied_lanes()
+        lane_end_indexes = self._map_lanes(self._lane_end_index, lanes)
+        if self._routes is not None:
+            exiting = [
+                (self._network.lane_index(lane_ref), vehicle_id)
+                for (lane_ref, vehicle_data), lane_end_index in zip(
+                    lanes, lane_end_indexes
+                )
+                for vehicle_id in vehicle_data["id"][lane_end_index:]
+            ]
+            if exiting:
+                lane_indexes, vehicle_ids = zip(*exiting)
+                self._route_vehicles(lane_indexes, vehicle_ids)
+
+        for (lane_ref, vehicle_data), lane_end_index in zip(lanes, lane_end_indexes):
             # iterator each lane (lane_ref) and the vehicles on that lane
             id = vehicle_data["id"]
             position = vehicle_data["position"]
             lane_length = self._network.lane(lane_ref).length
 
-            # Index where the vehicles are past the lane end - the lane data is
-            # sorted so vehicles after this index are past the end
-            lane_end_index = np.searchsorted(position, lane_length)
-
             for vehicle_index in range(lane_end_index, position.shape[0]):
                 vehicle_id = id[vehicle_index]
 
@@ -100,6 +457,8 @@ class Stepper:
                     if self._wait_flags and self._wait_flags[next_lane_ref]:
                         # Vehicle is stuck on the end of its current lane, no switch
                         changes.append(LaneChange(vehicle_id, lane_ref, lane_length))
+                        if metrics is not None:
+                            metrics.record_waiting(self._network.lane_index(lane_ref))
                     else:
                         # move vehicle to next lane, clear stored lane choice
                         del self._next_lane_choice[vehicle_id]
@@ -116,37 +475,253 @@ class Stepper:
                                 t_excess * next_lane_speed_limit,
                             )
                         )
+                        if metrics is not None:
+                            metrics.record_exit(
+                                self._network.lane_index(lane_ref),
+                                self._network.lane_index(next_lane_ref),
+                            )
                 else:
                     changes.append(RemoveVehicle(vehicle_id))
+                    self._next_lane_choice.pop(vehicle_id, None)
+                    if self._routes is not None:
+                        self._routes.remove(vehicle_id)
+                    if metrics is not None:
+                        metrics.record_exit(self._network.lane_index(lane_ref), None)
 
         return changes
 
+    def _route_vehicles(
+        self, lane_indexes: Sequence[int], vehicle_ids: Sequence[uuid.UUID]
+    ) -> None:
+        # Look up the next lanes of routed vehicles (that haven't already
+        # chosen) in one go
+        assert self._routes is not None
+        unchosen = [
+            (lane_index, vehicle_id)
+            for lane_index, vehicle_id in zip(lane_indexes, vehicle_ids)
+            if vehicle_id not in self._next_lane_choice
+        ]
+        if unchosen:
+            self._next_lane_choice.update(self._routes.choose(*zip(*unchosen)))
+
+    def _lane_end_index(self, lane_ref: LaneRef, vehicle_data: np.ndarray) -> int:
+        lane_length = self._network.lane(lane_ref).length
+        return int(np.searchsorted(vehicle_data["position"], lane_length))
+
     def _choose_new_lane(
         self, lane_ref: LaneRef, vehicle_id: uuid.UUID
     ) -> LaneRef | None:
         if vehicle_id in self._next_lane_choice:
             # next lane already chosen on a previous step, use that one
             return self._next_lane_choice[vehicle_id]
-        next_lane_choices = self._network.connected_lanes(lane_ref)
-
-        if next_lane_choices:
-            next_lane_ref = random.choice(next_lane_choices)
+        next_lane_ref = self._lane_chooser.choose(lane_ref, vehicle_id)
+        if next_lane_ref is not None:
             self._next_lane_choice[vehicle_id] = next_lane_ref
-            return next_lane_ref
-        return None
+        return next_lane_ref
+
+    def max_safe_dt(self) -> float:
+        """The largest time step that can be taken without skipping over
+        anything that changes how vehicles move. That is:
+
+        * A vehicle reaching the end of its lane
+        * A vehicle closing up to the separation limit behind a stopped vehicle
+        * The gap in front of a vehicle held by the separation limit opening
+          back up, as the vehicle in front moves away
+        * A vehicle on a feeder lane getting close enough to set a wait flag
+        * A queued vehicle from a demand source having room to enter its lane
+
+        Returns infinity if nothing is going to happen.
+        """
+        safe_dt = math.inf
+
+        for lane_ref, vehicle_data in self._vehicle_positions.group_by_lane():
+            position = vehicle_data["position"]
+            if position.shape[0] == 0:
+                continue
+
+            speed_limit = self._network.speed_limit(lane_ref)
+            lane_length = self._network.lane(lane_ref).length
+
+            if position[-1] < lane_length:
+                safe_dt = min(safe_dt, (lane_length - position[-1]) / speed_limit)
+
+            # As in _move_vehicles(), vehicles are stopped by the separation
+            # limit, or at the end of the lane waiting on a wait flag. Gaps only
+            # close when a moving vehicle is behind a stopped one.
+            gap = np.diff(position)
+            stopped = np.append(
+                gap < VEHICLE_SEPARATION_LIMIT, position[-1] >= lane_length
+            )
+            closing = gap[~stopped[:-1] & stopped[1:]] - (
+                VEHICLE_SEPARATION_LIMIT - GAP_TOLERANCE
+            )
+            if closing.shape[0]:
+                safe_dt = min(safe_dt, float(closing.min()) / speed_limit)
+
+            # Vehicles held by the separation limit behind a moving vehicle
+            # set off again once the gap has opened back up to the limit
+            reopening = VEHICLE_SEPARATION_LIMIT - gap[stopped[:-1] & ~stopped[1:]]
+            if reopening.shape[0]:
+                safe_dt = min(safe_dt, float(reopening.min()) / speed_limit)
+
+        safe_dt = min(
+            safe_dt, time_to_wait_change(self._network, self._vehicle_positions)
+        )
+
+        if self._demand is not None:
+            safe_dt = min(
+                safe_dt,
+                self._demand.time_to_admission(self._network, self._vehicle_positions),
+            )
+
+        return float(safe_dt)
+
+    def advance(
+        self, duration: float, min_dt: float = 0.01, max_dt: float = 1.0
+    ) -> int:
+        """Step forward by `duration` seconds with adaptive time steps.
+
+        Each step is the largest safe step (see max_safe_dt()), but no smaller
+        than `min_dt` and no larger than `max_dt`. Light traffic can then
+        be simulated with far fewer steps than with a fixed time step, without
+        losing accuracy. Returns the number of steps taken.
+        """
+        remaining = duration
+        steps = 0
+        while remaining > 0:
+            dt = min(max(self.max_safe_dt(), min_dt), max_dt, remaining)
+            self.step(dt)
+            remaining -= dt
+            steps += 1
+        return steps
+
+    def run(self, duration: float, dt: float, every: int = 1) -> Iterator[Frame]:
+        """Step for `duration` seconds with a fixed time step, yielding a
+        `Frame` every `every` steps. Time in the frames is from the start of
+        the run. Nothing is kept between frames, so a run of any length uses
+        the same memory."""
+        if every < 1:
+            raise ValueError("every must be at least 1")
+        steps = int(round(duration / dt))
+        for step in range(1, steps + 1):
+            self.step(dt)
+            if step % every == 0:
+                assert self._wait_flags is not None
+                yield Frame(
+                    step * dt,
+                    step,
+                    self._wait_flags.with_network(self._network).flags,
+                    {
+                        lane_ref: (
+                            _read_only(vehicle_data["position"]),
+                            _read_only(vehicle_data["id"]),
+                        )
+                        for lane_ref, vehicle_data in (
+                            self._vehicle_positions.group_by_lane()
+                        )
+                    },
+                )
+
+    def _record_transition(
+        self, journal: StepJournal, vehicle_id: uuid.UUID, lane_ref: LaneRef
+    ) -> None:
+        from_lane_ref = self._vehicle_positions[vehicle_id]["lane_ref"]
+        if from_lane_ref != lane_ref:
+            journal.record_transition(
+                vehicle_id,
+                self._network.lane_index(from_lane_ref),
+                self._network.lane_index(lane_ref),
+            )
+
+    def _record_lane_events(
+        self, lane_events: LaneEventLog, vehicle_id: uuid.UUID, lane_ref: LaneRef | None
+    ) -> None:
+        # Exit from the vehicle's current lane, and entry onto lane_ref (if it
+        # is moving onto another lane rather than leaving the network)
+        from_lane_ref = self._vehicle_positions[vehicle_id]["lane_ref"]
+        if from_lane_ref != lane_ref:
+            lane_events.record(
+                vehicle_id, self._network.lane_index(from_lane_ref), EXIT
+            )
+            if lane_ref is not None:
+                lane_events.record(
+                    vehicle_id, self._network.lane_index(lane_ref), ENTRY
+                )
 
     def step(self, dt: float) -> None:
         """Perform a step with time interval dt"""
-
+        stats = self._stats
+        t = perf_counter() if stats is not None else 0.0
+        if self._metrics is not None:
+            self._metrics.begin_step(dt)
+        journal = self._journal
+        if journal is not None:
+            journal.begin_step()
+        lane_events = self._lane_events
+        if lane_events is not None:
+            lane_events.begin_step(dt)
+        journeys = self._journeys
+        if journeys is not None:
+            journeys.begin_step(dt)
+
+        previous_wait_flags = self._wait_flags
         self._wait_flags = priority_wait(self._network, self._vehicle_positions)
+        if journal is not None:
+            journal.record_wait_flags(
+                self._wait_flags.with_network(self._network),
+                previous_wait_flags or WaitFlags(self._network),
+            )
+        if stats is not None:
+            t = stats.lap("priority_wait", t)
 
         self._move_vehicles(dt)
+        if stats is not None:
+            t = stats.lap("move_vehicles", t)
 
         # lane switches needed
-        for change in self._calculate_lane_changes():
+        changes = self._calculate_lane_changes()
+        if stats is not None:
+            t = stats.lap("calculate_lane_changes", t)
+
+        for change in changes:
             match change:
                 case LaneChange(vehicle_id, lane_ref, position):
+                    if journal is not None:
+                        self._record_transition(journal, vehicle_id, lane_ref)
+                    if lane_events is not None:
+                        self._record_lane_events(lane_events, vehicle_id, lane_ref)
                     self._vehicle_positions.switch_lane(vehicle_id, lane_ref, position)
 
                 case RemoveVehicle(vehicle_id):
+                    if journal is not None:
+                        journal.record_removed(vehicle_id)
+                    if lane_events is not None:
+                        self._record_lane_events(lane_events, vehicle_id, None)
+                    if journeys is not None:
+                        journeys.record_removal(
+                            vehicle_id,
+                            self._network.lane_index(
+                                self._vehicle_positions[vehicle_id]["lane_ref"]
+                            ),
+                        )
                     self._vehicle_positions.remove(vehicle_id)
+        if stats is not None:
+            stats.lap("apply_lane_changes", t)
+
+        if self._demand is not None:
+            # new vehicles enter once everything else has moved out of the way
+            spawned = self._demand.step(dt, self._vehicle_positions)
+            if journal is not None:
+                journal.record_spawned(spawned)
+            if lane_events is not None or journeys is not None:
+                for vehicle_id in spawned:
+                    lane_index = self._network.lane_index(
+                        self._vehicle_positions[vehicle_id]["lane_ref"]
+                    )
+                    if lane_events is not None:
+                        lane_events.record(vehicle_id, lane_index, ENTRY)
+                    if journeys is not None:
+                        journeys.record_spawn(vehicle_id, lane_index)
+
+        if self._metrics is not None:
+            self._metrics.end_step(dt)
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Sequence
+
+import numpy as np
+
+from junctions.rng import counter_uniform
+
+if TYPE_CHECKING:
+    import uuid
+
+    from junctions.network import LaneRef, Network
+    from junctions.rng import RandomStreams
+
+
+class AliasTable:
+    """Walker/Vose alias table for sampling from a discrete distribution in
+    constant time.
+
+    Each of the n slots holds a probability and an alias. A uniform u in
+    [0, 1) picks slot `i = int(u * n)`, and the fractional part of `u * n`
+    then decides between the slot itself and its alias, so only a single
+    uniform is needed per sample.
+    """
+
+    def __init__(self, weights: Sequence[float]) -> None:
+        weight = np.asarray(weights, dtype=np.float64)
+        n = weight.shape[0]
+        total = weight.sum()
+        if n == 0 or total <= 0:
+            raise ValueError("weights must have a positive total")
+
+        probability = weight * n / total
+        alias = np.arange(n, dtype=np.intp)
+        small = [i for i in range(n) if probability[i] < 1]
+        large = [i for i in range(n) if probability[i] >= 1]
+        while small and large:
+            s = small.pop()
+            g = large[-1]
+            alias[s] = g
+            probability[g] -= 1 - probability[s]
+            if probability[g] < 1:
+                large.pop()
+                small.append(g)
+        # anything left over is 1 up to rounding error
+        probability[small + large] = 1
+
+        self.probability = probability
+        self.alias = alias
+
+    def __len__(self) -> int:
+        return self.probability.shape[0]
+
+    def sample(self, u: np.ndarray) -> np.ndarray:
+        """Slot indexes for an array of uniforms in [0, 1)"""
+        scaled = np.asarray(u) * len(self)
+        i = scaled.astype(np.intp)
+        return np.where(scaled - i < self.probability[i], i, self.alias[i])
+
+    def sample_one(self, u: float) -> int:
+        scaled = u * len(self)
+        i = int(scaled)
+        return i if scaled - i < self.probability[i] else int(self.alias[i])
+
+
+class TurningTables:
+    """Alias tables for choosing the next lane, built from the connection
+    weights of a network (see `Network.connect_lanes()`).
+
+    Tables are built the first time a lane is used, and only rebuilt for a
+    lane when its connections or weights have changed since.
+    """
+
+    def __init__(self, network: Network) -> None:
+        self._network = network
+        self._tables: dict[LaneRef, tuple[int, AliasTable]] = {}
+
+    def table(self, lane_ref: LaneRef) -> AliasTable:
+        version = self._network.connection_version(lane_ref)
+        cached = self._tables.get(lane_ref)
+        if cached is None or cached[0] != version:
+            cached = (
+                version,
+                AliasTable(self._network.connection_weights(lane_ref)),
+            )
+            self._tables[lane_ref] = cached
+        return cached[1]
+
+    def choose(self, lane_ref: LaneRef, u: float) -> LaneRef:
+        """Next lane for a vehicle leaving the lane, given a uniform u"""
+        connected_lanes = self._network.connected_lanes(lane_ref)
+        return connected_lanes[self.table(lane_ref).sample_one(u)]
+
+    def sample(
+        self, lane_ref: LaneRef, rng: np.random.Generator, size: int
+    ) -> np.ndarray:
+        """Indexes into the lane's connected lanes for `size` vehicles"""
+        return self.table(lane_ref).sample(rng.random(size))
+
+
+class LaneChooser:
+    """Chooses the next lane for vehicles leaving a lane, from the turning
+    tables, as used by `Stepper` and `EventEngine`.
+
+    Uniforms come from the lane choice stream of `streams` if given, or are
+    derived from `seed`, the vehicle ID and the lane (so every engine, and
+    every region of a partitioned run, makes the same choice), or otherwise
+    are drawn from `rng`.
+    """
+
+    def __init__(
+        self,
+        network: Network,
+        seed: int | None = None,
+        streams: RandomStreams | None = None,
+        rng: np.random.Generator | None = None,
+    ) -> None:
+        self._network = network
+        self._turning = TurningTables(network)
+        self._seed = seed
+        self._streams = streams
+        self._rng = rng if rng is not None else np.random.default_rng()
+
+    def choose(self, lane_ref: LaneRef, vehicle_id: uuid.UUID) -> LaneRef | None:
+        """Next lane for the vehicle, or None if the lane leads nowhere"""
+        if not self._network.connected_lanes(lane_ref):
+            return None
+        if self._streams is not None:
+            u = self._streams.lane_choice(vehicle_id, lane_ref)
+        elif self._seed is None:
+            u = self._rng.random()
+        else:
+            u = counter_uniform(
+                self._seed, vehicle_id.int, self._network.lane_index(lane_ref)
+            )
+        return self._turning.choose(lane_ref, u)
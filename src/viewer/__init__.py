@@ -1,13 +1,14 @@
 import math
-import random
 from time import time
 
+from junctions.demand import Demand, DemandSource
 from junctions.network import LaneRef, Network
+from junctions.spatial_index import LaneSpatialIndex
 from junctions.state.vehicle_positions import VehiclePositions
 from junctions.stepper import Stepper
 from junctions.types import Road, Tee
 from pyglet import app, window
-from pyglet.math import Mat4, Vec3
+from pyglet.math import Mat4
 
 from viewer.network_renderer import NetworkRenderer
 from viewer.vehicle_positions_renderer import VehiclePositionsRenderer
@@ -51,37 +52,84 @@ def run():
     network.connect_lanes(LaneRef("tee1", "f"), LaneRef("road3", "a"))
 
     vehicle_positions = VehiclePositions()
-    stepper = Stepper(network, vehicle_positions)
+    demand = Demand(
+        [
+            DemandSource(LaneRef("road1", "a"), rate=0.2),
+            DemandSource(LaneRef("road2", "b"), rate=0.2),
+            DemandSource(LaneRef("road3", "b"), rate=0.1),
+        ]
+    )
+    stepper = Stepper(network, vehicle_positions, demand=demand)
+
+    spatial_index = LaneSpatialIndex(network)
+
+    # Camera - drag to pan and scroll to zoom. (x0, y0) is the point of the
+    # network at the bottom left of the window, shown at double scale to
+    # begin with.
+    x0, y0, scale = 0.0, 0.0, 2.0
+
+    def update_view():
+        win.view = Mat4(
+            scale, 0.0, 0.0, 0.0,
+            0.0, scale, 0.0, 0.0,
+            0.0, 0.0, 1.0, 0.0,
+            -x0 * scale, -y0 * scale, 0.0, 1.0,
+        )  # fmt: skip
 
-    # Double the scale
-    win.view = Mat4.from_scale(Vec3(2, 2, 1))
+    update_view()
 
     t = time()
+    network_renderer: NetworkRenderer | None = None
+    network_viewport = None
 
     @win.event
     def on_draw():
-        nonlocal vehicle_positions, t
+        nonlocal vehicle_positions, t, network_renderer, network_viewport
         win.clear()
 
         dt = time() - t
         t += dt
 
-        if random.random() < dt:
-            choices = (
-                LaneRef("road1", "a"),
-                LaneRef("road2", "b"),
-                LaneRef("road1", "a"),
-                LaneRef("road2", "b"),
-                LaneRef("road3", "b"),
-            )
-            where = random.choice(choices)
-            vehicle_positions.create_vehicle(where, 0.0)
-
         stepper.step(dt * 2)
 
-        network_renderer = NetworkRenderer(network, stepper.wait_flags)
-        vehicles_state_renderer = VehiclePositionsRenderer(network, vehicle_positions)
+        # Only the junctions and vehicles in view are drawn
+        viewport = (x0, y0, x0 + win.width / scale, y0 + win.height / scale)
+        if network_renderer is None or viewport != network_viewport:
+            network_renderer = NetworkRenderer(
+                network, stepper.wait_flags, spatial_index, viewport
+            )
+            network_viewport = viewport
+        elif stepper.wait_flags is not None:
+            # Only recolour lanes whose wait flag changed
+            network_renderer.update_wait_flags(stepper.wait_flags)
+        vehicles_state_renderer = VehiclePositionsRenderer(
+            network, vehicle_positions, spatial_index, viewport
+        )
         network_renderer.draw()
         vehicles_state_renderer.draw()
 
+    @win.event
+    def on_mouse_drag(x, y, dx, dy, buttons, modifiers):
+        nonlocal x0, y0
+        x0 -= dx / scale
+        y0 -= dy / scale
+        update_view()
+
+    @win.event
+    def on_mouse_scroll(x, y, scroll_x, scroll_y):
+        nonlocal x0, y0, scale
+        # Zoom about the point under the mouse
+        world_x, world_y = x0 + x / scale, y0 + y / scale
+        scale = min(max(scale * 1.1**scroll_y, 0.1), 50.0)
+        x0, y0 = world_x - x / scale, world_y - y / scale
+        update_view()
+
+    @win.event
+    def on_mouse_press(x, y, button, modifiers):
+        # Show the vehicle clicked on in the title bar
+        vehicle_id = spatial_index.vehicle_at(
+            vehicle_positions, x0 + x / scale, y0 + y / scale, radius=4
+        )
+        win.set_caption("" if vehicle_id is None else str(vehicle_id))
+
     app.run()
@@ -1,12 +1,22 @@
 from __future__ import annotations
 
-from typing import Final, Sequence
+from typing import TYPE_CHECKING, Final, Sequence
 
+import numpy as np
 import pyglet
 from junctions.network import LaneRef, Network
 from junctions.state.wait_flags import WaitFlags
 from junctions.types import Arc, ArcLane, Junction, Lane, Road, Tee
 
+if TYPE_CHECKING:
+    from junctions.spatial_index import LaneSpatialIndex, Rect
+
+    # Shapes for a junction: the shapes drawing each lane (in LANE_LABELS
+    # order), so they can be recoloured, and any other shapes
+    JunctionShapes = tuple[
+        Sequence[Sequence[pyglet.shapes.ShapeBase]], Sequence[pyglet.shapes.ShapeBase]
+    ]
+
 DEFAULT_LANE_COLOR: Final = (150, 150, 150, 255)
 WAIT_LANE_COLOR: Final = (243, 150, 150, 255)
 
@@ -31,11 +41,15 @@ def _node_markers(
     return (a, b)
 
 
+def _lane_color(wait_flag: bool) -> tuple[int, int, int, int]:
+    return WAIT_LANE_COLOR if wait_flag else DEFAULT_LANE_COLOR
+
+
 def _road_shapes(
     road: Road,
     wait_flags: tuple[bool, bool],
     batch: pyglet.graphics.Batch,
-) -> Sequence[pyglet.shapes.ShapeBase]:
+) -> JunctionShapes:
     lanes = road.lanes
 
     lane_a = pyglet.shapes.Line(
@@ -43,7 +57,7 @@ def _road_shapes(
         lanes["a"].start.y,
         lanes["a"].end.x,
         lanes["a"].end.y,
-        color=WAIT_LANE_COLOR if wait_flags[0] else DEFAULT_LANE_COLOR,
+        color=_lane_color(wait_flags[0]),
         batch=batch,
     )
     lane_b = pyglet.shapes.Line(
@@ -51,15 +65,13 @@ def _road_shapes(
         lanes["b"].start.y,
         lanes["b"].end.x,
         lanes["b"].end.y,
-        color=WAIT_LANE_COLOR if wait_flags[1] else DEFAULT_LANE_COLOR,
+        color=_lane_color(wait_flags[1]),
         batch=batch,
     )
 
     return (
-        lane_a,
-        lane_b,
-        *_node_markers(lanes["a"], batch),
-        *_node_markers(lanes["b"], batch),
+        ((lane_a,), (lane_b,)),
+        (*_node_markers(lanes["a"], batch), *_node_markers(lanes["b"], batch)),
     )
 
 
@@ -90,18 +102,12 @@ def _arc_shapes(
     arc: Arc,
     wait_flags: tuple[bool, bool],
     batch: pyglet.graphics.Batch,
-) -> Sequence[pyglet.shapes.ShapeBase]:
-    lane_a = _arc_lane_shapes(
-        arc.lanes["a"], WAIT_LANE_COLOR if wait_flags[0] else DEFAULT_LANE_COLOR, batch
-    )
-    lane_b = _arc_lane_shapes(
-        arc.lanes["b"], WAIT_LANE_COLOR if wait_flags[1] else DEFAULT_LANE_COLOR, batch
-    )
+) -> JunctionShapes:
+    lane_a = _arc_lane_shapes(arc.lanes["a"], _lane_color(wait_flags[0]), batch)
+    lane_b = _arc_lane_shapes(arc.lanes["b"], _lane_color(wait_flags[1]), batch)
     return (
-        *lane_a,
-        *lane_b,
-        *_node_markers(arc.lanes["a"], batch),
-        *_node_markers(arc.lanes["b"], batch),
+        (lane_a, lane_b),
+        (*_node_markers(arc.lanes["a"], batch), *_node_markers(arc.lanes["b"], batch)),
     )
 
 
@@ -109,58 +115,93 @@ def _tee_shapes(
     tee: Tee,
     wait_flags: tuple[bool, bool, bool, bool, bool, bool],
     batch: pyglet.graphics.Batch,
-) -> Sequence[pyglet.shapes.ShapeBase]:
+) -> JunctionShapes:
+    parts = (
+        _road_shapes(tee.main_road, wait_flags[:2], batch),
+        _arc_shapes(tee.branch_a, wait_flags[2:4], batch),
+        _arc_shapes(tee.branch_b, wait_flags[4:], batch),
+    )
     return (
-        *_road_shapes(tee.main_road, wait_flags[:2], batch),
-        *_arc_shapes(tee.branch_a, wait_flags[2:4], batch),
-        *_arc_shapes(tee.branch_b, wait_flags[4:], batch),
+        tuple(lane for lanes, _ in parts for lane in lanes),
+        tuple(shape for _, shapes in parts for shape in shapes),
     )
 
 
 class NetworkRenderer:
-    def __init__(self, network: Network, wait_flags: WaitFlags | None = None):
-        self._junctions: dict[str, Sequence[pyglet.shapes.ShapeBase]] = {}
-        self._wait_flags = wait_flags or WaitFlags()
+    def __init__(
+        self,
+        network: Network,
+        wait_flags: WaitFlags | None = None,
+        spatial_index: LaneSpatialIndex | None = None,
+        viewport: Rect | None = None,
+    ):
+        self._network = network
+        self._junctions: dict[str, JunctionShapes] = {}
+        # Shapes drawing each lane, by lane index
+        self._lane_shapes: dict[int, Sequence[pyglet.shapes.ShapeBase]] = {}
+        self._wait_flags = (
+            WaitFlags(network)
+            if wait_flags is None
+            else wait_flags.with_network(network).copy()
+        )
         self._batch: pyglet.graphics.Batch = pyglet.graphics.Batch()
-        for junction_label in network.junction_labels():
+
+        junction_labels = network.junction_labels()
+        if spatial_index is not None and viewport is not None:
+            # Skip junctions that have no lanes in view
+            visible = {lane.junction for lane in spatial_index.lanes_in_rect(viewport)}
+            junction_labels = [label for label in junction_labels if label in visible]
+
+        for junction_label in junction_labels:
             junction = network.junction(junction_label)
             self._add_junction(junction_label, junction)
 
     def draw(self):
         self._batch.draw()
 
+    def update_wait_flags(self, wait_flags: WaitFlags) -> None:
+        """Recolour only the lanes whose wait flag has changed"""
+        wait_flags = wait_flags.with_network(self._network)
+        for lane_index in wait_flags.diff(self._wait_flags).tolist():
+            color = _lane_color(bool(wait_flags.flags[lane_index]))
+            for shape in self._lane_shapes.get(lane_index, ()):
+                shape.color = color
+        self._wait_flags = wait_flags.copy()
+
     def _add_junction(self, label: str, junction: Junction):
+        lane_indexes = [
+            self._network.lane_index(LaneRef(label, lane_label))
+            for lane_label in junction.LANE_LABELS
+        ]
+        wait_flags = tuple(
+            bool(flag) for flag in self._wait_flags.gather(np.array(lane_indexes))
+        )
+
         match junction:
             case Road():
-                self._junctions[label] = _road_shapes(
-                    junction,
-                    (
-                        self._wait_flags[LaneRef(label, junction.LANE_LABELS[0])],
-                        self._wait_flags[LaneRef(label, junction.LANE_LABELS[1])],
-                    ),
-                    self._batch,
+                shapes = _road_shapes(
+                    junction, (wait_flags[0], wait_flags[1]), self._batch
                 )
-
             case Arc():
-                self._junctions[label] = _arc_shapes(
-                    junction,
-                    (
-                        self._wait_flags[LaneRef(label, junction.LANE_LABELS[0])],
-                        self._wait_flags[LaneRef(label, junction.LANE_LABELS[1])],
-                    ),
-                    self._batch,
+                shapes = _arc_shapes(
+                    junction, (wait_flags[0], wait_flags[1]), self._batch
                 )
-
             case Tee():
-                self._junctions[label] = _tee_shapes(
+                shapes = _tee_shapes(
                     junction,
                     (
-                        self._wait_flags[LaneRef(label, junction.LANE_LABELS[0])],
-                        self._wait_flags[LaneRef(label, junction.LANE_LABELS[1])],
-                        self._wait_flags[LaneRef(label, junction.LANE_LABELS[2])],
-                        self._wait_flags[LaneRef(label, junction.LANE_LABELS[3])],
-                        self._wait_flags[LaneRef(label, junction.LANE_LABELS[4])],
-                        self._wait_flags[LaneRef(label, junction.LANE_LABELS[5])],
+                        wait_flags[0],
+                        wait_flags[1],
+                        wait_flags[2],
+                        wait_flags[3],
+                        wait_flags[4],
+                        wait_flags[5],
                     ),
                     self._batch,
                 )
+            case _:
+                return
+
+        self._junctions[label] = shapes
+        for lane_index, lane_shapes in zip(lane_indexes, shapes[0]):
+            self._lane_shapes[lane_index] = lane_shapes
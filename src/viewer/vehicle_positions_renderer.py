@@ -10,6 +10,7 @@ from pyglet.math import Vec2
 
 if TYPE_CHECKING:
     from junctions.network import Network
+    from junctions.spatial_index import LaneSpatialIndex, Rect
 
 
 def _vehicle_shapes(
@@ -38,14 +39,28 @@ def _vehicle_shapes(
 
 
 class VehiclePositionsRenderer:
-    def __init__(self, network: Network, vehicles_state: VehiclePositions):
+    def __init__(
+        self,
+        network: Network,
+        vehicles_state: VehiclePositions,
+        spatial_index: LaneSpatialIndex | None = None,
+        viewport: Rect | None = None,
+    ):
         self._network = network
         self._vehicles: dict[str, Sequence[pyglet.shapes.ShapeBase]] = {}
         self._batch: pyglet.graphics.Batch = pyglet.graphics.Batch()
 
-        for lane_ref, vehicle_data in vehicles_state.group_by_lane():
-            for row in vehicle_data:
-                self._add_vehicle(lane_ref, row["id"], row["position"])
+        if spatial_index is not None and viewport is not None:
+            # Only create shapes for vehicles that can be seen
+            for lane_ref, ids, positions in spatial_index.vehicles_in_rect(
+                vehicles_state, viewport
+            ):
+                for id, position in zip(ids, positions):
+                    self._add_vehicle(lane_ref, id, position)
+        else:
+            for lane_ref, vehicle_data in vehicles_state.group_by_lane():
+                for row in vehicle_data:
+                    self._add_vehicle(lane_ref, row["id"], row["position"])
 
     def draw(self):
         self._batch.draw()
@@ -0,0 +1,71 @@
+import multiprocessing
+
+from junctions.network import LaneRef
+from junctions.state.shared_positions import (
+    SharedVehiclePositions,
+    SharedVehiclePositionsReader,
+)
+from junctions.state.vehicle_positions import VehiclePositions
+
+from tests.junctions.test_priority_wait import simple_t_junction_network
+
+
+def _reader(name, connection):
+    network = simple_t_junction_network()
+    reader = SharedVehiclePositionsReader(name)
+
+    table = reader.view()
+    assert table is not None
+    vehicles = table.to_vehicle_positions(network)
+    results = {
+        "generation": table.generation,
+        "positions": list(vehicles.positions_by_lane[LaneRef("tee", "a")]),
+        "ids": list(vehicles.ids_by_lane[LaneRef("tee", "a")]),
+        "consistent": reader.is_consistent(table),
+    }
+
+    # ask the writer to publish again while we still hold the view
+    connection.send(results)
+    connection.recv()
+    results = {
+        "consistent": reader.is_consistent(table),
+        "snapshot_generation": reader.snapshot().generation,
+    }
+    reader.close()
+    connection.send(results)
+
+
+def test_read_shared_positions_from_another_process():
+    # GIVEN some vehicles, published to shared memory
+    network = simple_t_junction_network()
+    vehicles = VehiclePositions()
+    v1 = vehicles.create_vehicle(LaneRef("tee", "a"), 3.0)
+    v2 = vehicles.create_vehicle(LaneRef("tee", "a"), 1.0)
+    vehicles.create_vehicle(LaneRef("side_road", "b"), 50.0)
+    shared = SharedVehiclePositions(network, capacity=10)
+    shared.publish(vehicles)
+
+    # WHEN a separate process reads them
+    context = multiprocessing.get_context("spawn")
+    connection, child_connection = context.Pipe()
+    process = context.Process(target=_reader, args=(shared.name, child_connection))
+    process.start()
+    first = connection.recv()
+
+    # THEN it sees the same vehicles
+    assert first["generation"] == 2
+    assert first["positions"] == [1.0, 3.0]
+    assert first["ids"] == [v2, v1]
+    assert first["consistent"]
+
+    # AND WHEN the writer publishes again
+    vehicles.remove(v1)
+    shared.publish(vehicles)
+    connection.send(None)
+    second = connection.recv()
+    process.join()
+    shared.close()
+
+    # THEN the old view is detected as stale, and a new snapshot is taken
+    assert not second["consistent"]
+    assert second["snapshot_generation"] == 4
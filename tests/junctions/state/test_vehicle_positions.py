@@ -304,3 +304,58 @@ def test_iterate_all_vehicles():
     assert_array_equal(all_vehicles[1]["id"], np.array([v3, v4]))
     assert_almost_equal(all_vehicles[0]["position"], np.array([0.0, 1.0]))
     assert_almost_equal(all_vehicles[1]["position"], np.array([2.0, 3.0]))
+
+
+def test_create_vehicles_in_bulk():
+    # SET UP: a lane with some vehicles already on it
+    vehicle_positions = VehiclePositions()
+    lane_1 = LaneRef("road1", "a")
+    lane_2 = LaneRef("road2", "a")
+    v1 = vehicle_positions.create_vehicle(lane_1, 1.0)
+    v2 = vehicle_positions.create_vehicle(lane_1, 3.0)
+
+    # ACT: add several vehicles over two lanes at once
+    new_ids = vehicle_positions.create_vehicles(
+        [lane_1, lane_2, lane_1, lane_2], [2.0, 5.0, 0.0, 4.0]
+    )
+
+    # ASSERT: lanes are still sorted, and the IDs are in the order requested
+    assert len(new_ids) == 4
+    assert_almost_equal(vehicle_positions.positions_by_lane[lane_1], [0, 1, 2, 3])
+    assert_array_equal(
+        vehicle_positions.ids_by_lane[lane_1],
+        np.array([new_ids[2], v1, new_ids[0], v2]),
+    )
+    assert_array_equal(
+        vehicle_positions.ids_by_lane[lane_2], np.array([new_ids[3], new_ids[1]])
+    )
+
+    # ... and the by-ID lookup is up to date
+    assert vehicle_positions[v2] == {"lane_ref": lane_1, "position": pytest.approx(3)}
+    assert vehicle_positions[new_ids[1]] == {
+        "lane_ref": lane_2,
+        "position": pytest.approx(5),
+    }
+
+
+def test_only_occupied_lanes_are_stored():
+    # GIVEN vehicles on two lanes
+    vehicle_positions = VehiclePositions()
+    road_a = LaneRef(junction="road", lane="a")
+    road_b = LaneRef(junction="road", lane="b")
+    v1 = vehicle_positions.create_vehicle(road_a, 1.0)
+    v2 = vehicle_positions.create_vehicle(road_b, 2.0)
+
+    # WHEN I read some empty lanes, and empty lane a
+    assert vehicle_positions.positions_by_lane[LaneRef("other", "a")].shape == (0,)
+    assert vehicle_positions.ids_by_lane[LaneRef("other", "b")].shape == (0,)
+    vehicle_positions.switch_lane(v1, road_b, 0.5)
+
+    # THEN only lane b is visited
+    assert list(vehicle_positions.occupied_lanes()) == [road_b]
+    assert [lane for lane, _ in vehicle_positions.group_by_lane()] == [road_b]
+
+    # and removing the last vehicles leaves nothing
+    vehicle_positions.remove(v1)
+    vehicle_positions.remove(v2)
+    assert list(vehicle_positions.group_by_lane()) == []
@@ -1,6 +1,10 @@
-from junctions.network import LaneRef
+import numpy as np
+import pytest
+from junctions.network import LaneRef, Network
 from junctions.state.wait_flags import WaitFlags
 
+from tests.junctions.factories import RoadFactory
+
 
 def test_wait_flags_default_off():
     wait_flags = WaitFlags()
@@ -35,3 +39,68 @@ def test_set_wait_flag():
 
     assert wait_flags[LaneRef("a", "b")]
     assert not wait_flags[LaneRef("c", "d")]
+
+
+def test_wait_flags_by_lane_index():
+    # GIVEN wait flags for a network with a road
+    network = Network()
+    network.add_junction(RoadFactory.build(), "road")
+    wait_flags = WaitFlags(network)
+
+    # WHEN I set the flag on one lane
+    wait_flags[LaneRef("road", "b")] = True
+
+    # THEN the flags array is indexed by lane index
+    assert wait_flags.flags.tolist() == [False, True]
+    assert wait_flags.gather(np.array([1, 1, 0])).tolist() == [True, True, False]
+
+
+def test_wait_flags_diff():
+    # GIVEN wait flags for a network with two roads
+    network = Network()
+    network.add_junction(RoadFactory.build(), "road1")
+    network.add_junction(RoadFactory.build(), "road2")
+    before = WaitFlags(network)
+    before[LaneRef("road1", "a")] = True
+    before[LaneRef("road2", "a")] = True
+
+    # WHEN the flags change
+    after = before.copy()
+    after[LaneRef("road1", "a")] = False
+    after[LaneRef("road2", "b")] = True
+
+    # THEN the diff gives the lanes that changed, and the copy is independent
+    assert after.diff(before).tolist() == [0, 3]
+    assert before[LaneRef("road1", "a")]
+
+
+def test_wait_flags_without_network():
+    # GIVEN flags without a network, and flags for a network with two roads
+    network = Network()
+    network.add_junction(RoadFactory.build(), "road1")
+    network.add_junction(RoadFactory.build(), "road2")
+    before = WaitFlags()
+    before[LaneRef("road1", "a")] = True
+    after = WaitFlags()
+    after[LaneRef("road2", "b")] = True
+    indexed = WaitFlags(network)
+    indexed[LaneRef("road1", "a")] = True
+
+    # THEN they are compared and gathered by the network's lane indexes
+    road1_a = network.lane_index(LaneRef("road1", "a"))
+    road2_b = network.lane_index(LaneRef("road2", "b"))
+    assert after.diff(indexed).tolist() == sorted([road1_a, road2_b])
+    assert indexed.diff(after).tolist() == sorted([road1_a, road2_b])
+    assert before.diff(indexed).tolist() == []
+    assert after.with_network(network).gather(
+        np.array([road2_b, road1_a])
+    ).tolist() == [
+        True,
+        False,
+    ]
+
+    # ... but not without one
+    with pytest.raises(ValueError):
+        after.diff(before)
+    with pytest.raises(ValueError):
+        after.gather(np.array([road2_b]))
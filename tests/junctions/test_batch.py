@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+from junctions.batch import BatchedStepper, BatchedVehiclePositions
+from junctions.network import LaneRef
+from junctions.rng import counter_uniform, counter_uniform_array
+from junctions.stepper import Stepper
+
+from tests.junctions.test_priority_wait import simple_t_junction_network
+
+
+def test_counter_uniform_array_matches_scalar():
+    # GIVEN some seeds and keys
+    seeds = np.array([1, 2, 2**64 - 1], dtype=np.uint64)
+    keys = np.array([0, 5, 2**63], dtype=np.uint64)
+
+    # THEN the vectorised version matches the scalar one
+    expected = [counter_uniform(int(s), int(k), 7) for s, k in zip(seeds, keys)]
+    assert counter_uniform_array(seeds, keys, 7).tolist() == expected
+
+
+def test_batched_positions_are_sorted_per_replica():
+    # GIVEN batched vehicle positions
+    network = simple_t_junction_network()
+    vehicles = BatchedVehiclePositions(network, replicas=2)
+    lane_ref = LaneRef("tee", "a")
+
+    # WHEN vehicles are added in different orders to each replica
+    vehicles.create_vehicle(0, lane_ref, 5.0)
+    vehicles.create_vehicle(0, lane_ref, 1.0)
+    vehicles.create_vehicle(1, lane_ref, 3.0)
+
+    # THEN each replica is sorted, right aligned
+    assert vehicles.positions(lane_ref).tolist() == [[1.0, 5.0], [-np.inf, 3.0]]
+    assert vehicles.ids(lane_ref).tolist() == [[2, 1], [-1, 1]]
+    assert vehicles.counts(lane_ref).tolist() == [2, 1]
+
+
+def test_batched_stepper_matches_stepper():
+    # GIVEN a batch of replicas with different vehicles in each
+    network = simple_t_junction_network()
+    vehicles = BatchedVehiclePositions(network, replicas=3)
+    for replica in range(3):
+        for lane_ref in (
+            LaneRef("main_road_1", "a"),
+            LaneRef("main_road_2", "b"),
+            LaneRef("side_road", "b"),
+        ):
+            for position in range(replica, 100, 7 + replica):
+                vehicles.create_vehicle(replica, lane_ref, float(position))
+
+    # AND each replica on its own, with its own stepper
+    stepper = BatchedStepper(network, vehicles, seed=3)
+    singles = [vehicles.replica(replica) for replica in range(3)]
+    single_steppers = [
+        Stepper(network, single, seed=int(seed))
+        for single, seed in zip(singles, stepper.replica_seeds)
+    ]
+
+    # WHEN they are all stepped
+    for _ in range(200):
+        stepper.step(0.1)
+        for single_stepper in single_steppers:
+            single_stepper.step(0.1)
+
+    # THEN every replica matches stepping it on its own
+    for replica, single in enumerate(singles):
+        batched = vehicles.replica(replica)
+        for lane_ref in network.all_lanes():
+            assert list(batched.ids_by_lane[lane_ref]) == list(
+                single.ids_by_lane[lane_ref]
+            )
+            assert list(batched.positions_by_lane[lane_ref]) == pytest.approx(
+                list(single.positions_by_lane[lane_ref]), abs=1e-3
+            )
+
+
+def test_batched_demand_is_independent_per_replica():
+    # GIVEN a batch with demand on the entry lanes
+    network = simple_t_junction_network()
+    vehicles = BatchedVehiclePositions(network, replicas=50)
+    stepper = BatchedStepper(
+        network, vehicles, seed=1, demand={LaneRef("main_road_1", "a"): 0.2}
+    )
+
+    # WHEN it is stepped
+    for _ in range(200):
+        stepper.step(0.1)
+
+    # THEN vehicles have arrived, in different numbers in different replicas
+    counts = vehicles.vehicle_counts() + stepper.exits
+    assert counts.mean() == pytest.approx(4, abs=1.5)
+    assert len(set(counts.tolist())) > 1
+
+
+def test_batched_demand_with_large_mean():
+    # GIVEN a batch with far more demand than exp(-mean) can represent
+    network = simple_t_junction_network()
+    vehicles = BatchedVehiclePositions(network, replicas=50)
+    stepper = BatchedStepper(
+        network, vehicles, seed=1, demand={LaneRef("main_road_1", "a"): 10000}
+    )
+
+    # WHEN it is stepped once
+    stepper.step(0.1)
+
+    # THEN the number of arrivals in each replica is around the mean
+    arrivals = stepper.pending[:, 0] + vehicles.vehicle_counts()
+    assert arrivals.mean() == pytest.approx(1000, rel=0.02)
+    assert arrivals.std() == pytest.approx(np.sqrt(1000), rel=0.3)
@@ -0,0 +1,74 @@
+import math
+
+from junctions.conflicts import (
+    detect_conflicts,
+    junction_conflicts,
+    suggest_priorities,
+    use_detected_priorities,
+)
+from junctions.network import LaneRef, Network
+from junctions.priority_wait import priority_wait
+from junctions.state.vehicle_positions import VehiclePositions
+from junctions.types import Road, Tee
+
+from tests.junctions.test_priority_wait import simple_t_junction_network
+
+
+def test_tee_conflicts():
+    # GIVEN a t-junction
+    tee = Tee((0, 0), 0, 20, 5)
+
+    # WHEN I detect conflicts between its lanes
+    conflicts = {
+        (lane_1, lane_2): kind for lane_1, lane_2, kind, _, _ in junction_conflicts(tee)
+    }
+
+    # THEN the turns across the main road cross it, and lanes joining the
+    # same lane merge
+    assert conflicts == {
+        ("a", "d"): "cross",
+        ("a", "f"): "cross",
+        ("d", "f"): "cross",
+        ("a", "e"): "merge",
+        ("b", "d"): "merge",
+        ("c", "f"): "merge",
+    }
+
+
+def test_suggested_priorities_match_tee():
+    # GIVEN a network with a t-junction
+    network = simple_t_junction_network()
+    tee = network.junction("tee")
+
+    # WHEN I suggest priorities from the geometry
+    priorities = suggest_priorities(network, detect_conflicts(network))
+
+    # THEN they are the same as the hand written rules
+    for lane in tee.LANE_LABELS:
+        assert priorities.get(LaneRef("tee", lane), ()) == tuple(
+            LaneRef("tee", p) for p in tee.priority_over_lane(lane)
+        )
+
+
+def test_conflicts_between_junctions():
+    # GIVEN two roads that cross each other
+    network = Network()
+    network.add_junction(Road((0, 0), 0, 100, 5), label="north")
+    network.add_junction(Road((-50, 50), math.pi / 2, 100, 5), label="east")
+
+    # WHEN I detect conflicts and use them for priorities
+    conflicts = detect_conflicts(network)
+    priorities = use_detected_priorities(network)
+
+    # THEN every lane crosses both lanes of the other road
+    assert len(conflicts) == 4
+    assert all(c.kind == "cross" for c in conflicts)
+
+    # AND the wait flags follow the detected priorities
+    vehicles = VehiclePositions()
+    vehicles.create_vehicle(LaneRef("north", "a"), 10)
+    wait_flags = priority_wait(network, vehicles)
+    for lane_ref in network.all_lanes():
+        assert wait_flags[lane_ref] == (
+            LaneRef("north", "a") in priorities.get(lane_ref, ())
+        )
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+from junctions.convergence import (
+    SteadyStateDetector,
+    batch_means_half_width,
+    mser_truncation,
+    run_until_steady,
+)
+from junctions.demand import Demand, DemandSource
+from junctions.metrics import TrafficMetrics
+from junctions.network import LaneRef, Network
+from junctions.state.vehicle_positions import VehiclePositions
+from junctions.stepper import Stepper
+from junctions.types import Road
+
+
+def test_mser_drops_transient():
+    # GIVEN a series that starts far from its steady state
+    rng = np.random.default_rng(0)
+    series = rng.normal(10, 1, 500)
+    series[:100] = np.linspace(0, 10, 100)
+
+    # WHEN I find the warm-up
+    cutoff = mser_truncation(series)
+
+    # THEN it covers the transient, but not much more
+    assert 80 <= cutoff <= 150
+    assert mser_truncation(series[:4]) == 0
+
+
+def test_batch_means_half_width():
+    # GIVEN independent samples
+    series = np.random.default_rng(1).normal(0, 2, 4000)
+
+    # THEN the half width is close to that of the plain confidence interval
+    assert batch_means_half_width(series) == pytest.approx(
+        1.96 * 2 / np.sqrt(4000), rel=0.4
+    )
+    assert batch_means_half_width(series[:10]) == np.inf
+
+
+def test_detector_converges_once_precise():
+    # GIVEN a detector wanting the mean to within 1%
+    detector = SteadyStateDetector(precision=0.01)
+    rng = np.random.default_rng(2)
+
+    # WHEN I add noisy observations after a warm-up
+    added = 0
+    for value in np.concatenate((np.zeros(20), rng.normal(5, 1, 5000))):
+        added += 1
+        if detector.add(value):
+            break
+
+    # THEN it stops early, with the warm-up dropped from the mean
+    assert added < 5000
+    assert detector.half_width <= 0.01 * detector.mean
+    assert detector.mean == pytest.approx(5, rel=0.02)
+    assert detector.warmup >= 20
+
+
+def test_run_until_steady():
+    # GIVEN a road with steady demand, and a stepper with metrics
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 100, 5), "road")
+    demand = Demand([DemandSource(LaneRef("road", "a"), 0.5)], np.random.default_rng(3))
+    stepper = Stepper(
+        network, VehiclePositions(), demand=demand, metrics=TrafficMetrics(network)
+    )
+
+    # WHEN I run until the throughput has converged
+    result = run_until_steady(
+        stepper,
+        dt=0.1,
+        interval=5,
+        max_duration=20000,
+        detector=SteadyStateDetector(precision=0.1),
+    )
+
+    # THEN it stops before the maximum duration, at the demand rate, having
+    # dropped the time the road took to fill
+    assert result.converged
+    assert result.elapsed < 20000
+    assert result.mean == pytest.approx(0.5, abs=result.half_width + 0.05)
+    assert result.warmup >= 10
+
+
+def test_gridlock_converges_to_zero():
+    # GIVEN a road that nothing drives along
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 100, 5), "road")
+    stepper = Stepper(network, VehiclePositions(), metrics=TrafficMetrics(network))
+
+    # WHEN I run until steady
+    result = run_until_steady(stepper, dt=1, interval=5, max_duration=1000)
+
+    # THEN it stops as soon as there are enough observations
+    assert result.converged
+    assert result.elapsed == pytest.approx(200)
+    assert result.mean == 0
+
+
+def test_run_until_steady_needs_metrics():
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 100, 5), "road")
+    with pytest.raises(ValueError):
+        run_until_steady(Stepper(network, VehiclePositions()), 0.1, 5, 100)
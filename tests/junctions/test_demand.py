@@ -0,0 +1,148 @@
+import numpy as np
+import pytest
+from junctions.demand import Demand, DemandSource
+from junctions.network import LaneRef, Network
+from junctions.rng import RandomStreams
+from junctions.state.vehicle_positions import VehiclePositions
+from junctions.stepper import Stepper
+from junctions.types import Road
+
+
+def test_no_arrivals_with_zero_rate():
+    # GIVEN a source with no demand
+    vehicles = VehiclePositions()
+    demand = Demand([DemandSource(LaneRef("road1", "a"), 0.0)])
+
+    # WHEN I step
+    new_ids = demand.step(10.0, vehicles)
+
+    # THEN nothing arrives
+    assert new_ids == []
+    assert list(demand.pending) == [0]
+    assert demand.time == pytest.approx(10.0)
+
+
+def test_blocked_entry_queues_arrivals():
+    # GIVEN a source with very high demand
+    vehicles = VehiclePositions()
+    lane = LaneRef("road1", "a")
+    demand = Demand([DemandSource(lane, 100.0)], rng=np.random.default_rng(1))
+
+    # WHEN I step
+    new_ids = demand.step(1.0, vehicles)
+
+    # THEN only one vehicle fits at the start of the lane, the rest queue up
+    assert len(new_ids) == 1
+    assert vehicles[new_ids[0]] == {"lane_ref": lane, "position": 0.0}
+    assert demand.pending[0] > 50
+
+    # WHEN I step again without the lane entry clearing
+    pending = demand.pending[0]
+    assert demand.step(0.0, vehicles) == []
+
+    # THEN nothing more is admitted
+    assert demand.pending[0] == pending
+
+    # WHEN the first vehicle moves clear of the entry
+    vehicles.positions_by_lane[lane][0] = 6.0
+
+    # THEN the next one is admitted
+    assert len(demand.step(0.0, vehicles)) == 1
+    assert demand.pending[0] == pending - 1
+
+
+def test_sources_sharing_a_lane():
+    # GIVEN two busy sources on the same entry lane
+    vehicles = VehiclePositions()
+    lane = LaneRef("road1", "a")
+    demand = Demand(
+        [DemandSource(lane, 100.0), DemandSource(lane, 100.0)],
+        rng=np.random.default_rng(2),
+    )
+
+    # WHEN I step
+    new_ids = demand.step(1.0, vehicles)
+
+    # THEN they don't both place a vehicle on top of each other
+    assert len(new_ids) == 1
+    assert vehicles.positions_by_lane[lane].shape == (1,)
+
+
+def test_time_varying_rate():
+    # GIVEN a source that only has demand after t = 10
+    vehicles = VehiclePositions()
+    demand = Demand(
+        [DemandSource(LaneRef("road1", "a"), lambda t: 0.0 if t < 10 else 50.0)],
+        rng=np.random.default_rng(3),
+    )
+
+    # THEN nothing arrives before t = 10
+    for _ in range(10):
+        assert demand.step(1.0, vehicles) == []
+
+    # ... but it does after
+    assert len(demand.step(1.0, vehicles)) == 1
+
+
+def test_arrival_rate():
+    # GIVEN sources on lanes that are kept clear
+    demand = Demand(
+        [
+            DemandSource(LaneRef("road1", "a"), 2.0),
+            DemandSource(LaneRef("r", "a"), 0.5),
+        ],
+        rng=np.random.default_rng(4),
+    )
+
+    # WHEN I sample a long interval
+    demand.step(10000.0, VehiclePositions())
+
+    # THEN the arrivals match the rates (+1 for the admitted vehicle)
+    assert demand.pending[0] + 1 == pytest.approx(20000, rel=0.05)
+    assert demand.pending[1] + 1 == pytest.approx(5000, rel=0.05)
+
+
+def test_stepper_steps_demand():
+    # GIVEN a stepper with a demand source
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 1000, 5))
+    vehicles = VehiclePositions()
+    demand = Demand([DemandSource(LaneRef("road1", "a"), 1.0)])
+    stepper = Stepper(network, vehicles, demand=demand)
+    assert stepper.demand is demand
+
+    # WHEN I step for a while
+    for _ in range(300):
+        stepper.step(0.1)
+
+    # THEN vehicles have been generated and are spaced out
+    positions = vehicles.positions_by_lane[LaneRef("road1", "a")]
+    assert positions.shape[0] > 10
+    assert np.all(np.diff(positions) >= 5)
+
+
+def test_streams_give_common_arrivals():
+    # GIVEN two demands with the same random streams, one of them with an
+    # extra source on another lane
+    lane = LaneRef("road1", "a")
+    demand_a = Demand([DemandSource(lane, 0.5)], streams=RandomStreams(7))
+    demand_b = Demand(
+        [DemandSource(LaneRef("road2", "a"), 2.0), DemandSource(lane, 0.5)],
+        streams=RandomStreams(7),
+    )
+
+    # WHEN I step them, removing vehicles as soon as they arrive
+    arrivals = []
+    for demand in (demand_a, demand_b):
+        vehicles = VehiclePositions()
+        arrived = []
+        for step in range(200):
+            for vehicle_id in demand.step(0.1, vehicles):
+                if vehicles[vehicle_id]["lane_ref"] == lane:
+                    arrived.append((step, vehicle_id))
+                vehicles.remove(vehicle_id)
+        arrivals.append(arrived)
+
+    # THEN the same vehicles arrive on the shared lane at the same times
+    assert len(arrivals[0]) > 3
+    assert arrivals[0] == arrivals[1]
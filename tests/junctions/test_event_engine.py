@@ -0,0 +1,150 @@
+from unittest.mock import patch
+
+import pytest
+from junctions.event_engine import EventEngine
+from junctions.network import LaneRef, Network
+from junctions.state.vehicle_positions import VehiclePositions
+from junctions.state.wait_flags import WaitFlags
+from junctions.stepper import Stepper
+from junctions.types import Road
+
+from tests.junctions.test_priority_wait import simple_t_junction_network
+
+
+def test_free_flow_jumps_between_events():
+    # GIVEN a long road with a single vehicle
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 10000, 5))
+    vehicles = VehiclePositions()
+    v1 = vehicles.create_vehicle(LaneRef("road1", "a"), 0.0)
+    engine = EventEngine(network, vehicles)
+
+    # WHEN I advance a long way
+    engine.advance(500)
+
+    # THEN the vehicle has moved, without processing any events
+    assert vehicles[v1]["position"] == pytest.approx(5000)
+    assert engine.events_processed == 0
+    assert engine.time == pytest.approx(500)
+
+    # WHEN I advance past the end of the road
+    engine.advance(600)
+
+    # THEN the vehicle has left the network in a single event
+    with pytest.raises(KeyError):
+        vehicles[v1]
+    assert engine.events_processed == 1
+
+
+def test_moves_to_next_lane():
+    # GIVEN two connected roads with different speed limits
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 7, 5), label="first_road")
+    network.add_junction(Road((0, 7), 0, 10, 5), label="second_road", speed_limit=20)
+    network.connect_lanes(LaneRef("first_road", "a"), LaneRef("second_road", "a"))
+    vehicles = VehiclePositions()
+    v1 = vehicles.create_vehicle(LaneRef("first_road", "a"), 0.0)
+
+    # WHEN I advance past the end of the first road
+    engine = EventEngine(network, vehicles)
+    engine.advance(0.8)
+
+    # THEN the vehicle is on the second road, having moved there at 0.7s
+    assert vehicles[v1] == {
+        "lane_ref": LaneRef("second_road", "a"),
+        "position": pytest.approx(2.0),
+    }
+
+
+def test_queue_behind_waiting_vehicle():
+    # GIVEN two roads, with a wait flag on the second
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 100, 5), "road1")
+    network.add_junction(Road((0, 100), 0, 100, 5), "road2")
+    network.connect_lanes(LaneRef("road1", "a"), LaneRef("road2", "a"))
+    vehicles = VehiclePositions()
+    first = vehicles.create_vehicle(LaneRef("road1", "a"), 90)
+    second = vehicles.create_vehicle(LaneRef("road1", "a"), 50)
+    third = vehicles.create_vehicle(LaneRef("road1", "a"), 0)
+
+    wait_flags = WaitFlags()
+    wait_flags[LaneRef("road2", "a")] = True
+    with patch("junctions.event_engine.priority_wait", return_value=wait_flags):
+        engine = EventEngine(network, vehicles)
+
+        # WHEN I advance long enough for everything to catch up
+        engine.advance(20)
+
+        # THEN the vehicles are queued up at the separation limit
+        assert vehicles[first]["position"] == pytest.approx(100)
+        assert vehicles[second]["position"] == pytest.approx(95)
+        assert vehicles[third]["position"] == pytest.approx(90)
+
+    # WHEN the flag clears
+    engine.advance(0.95)
+
+    # THEN the queue moves off together
+    assert vehicles[first] == {
+        "lane_ref": LaneRef("road2", "a"),
+        "position": pytest.approx(9.5),
+    }
+    assert vehicles[second] == {
+        "lane_ref": LaneRef("road2", "a"),
+        "position": pytest.approx(4.5),
+    }
+    assert vehicles[third] == {
+        "lane_ref": LaneRef("road1", "a"),
+        "position": pytest.approx(99.5),
+    }
+
+
+def test_t_junction_matches_stepper():
+    # GIVEN a vehicle on the main road and one waiting to come out of the side
+    # road, in two copies of the same T-junction
+    network = simple_t_junction_network()
+    step_vehicles = VehiclePositions()
+    step_main = step_vehicles.create_vehicle(LaneRef("main_road_1", "a"), 70)
+    step_side = step_vehicles.create_vehicle(LaneRef("side_road", "b"), 95)
+    event_vehicles = step_vehicles.copy()
+
+    # ... all the lane choices go straight on to the main road
+    network.set_connection_weight(LaneRef("main_road_1", "a"), LaneRef("tee", "c"), 0)
+    network.set_connection_weight(LaneRef("side_road", "b"), LaneRef("tee", "d"), 0)
+
+    stepper = Stepper(network, step_vehicles)
+    for _ in range(2000):
+        stepper.step(0.01)
+
+    engine = EventEngine(network, event_vehicles)
+    engine.advance(20)
+
+    # THEN both simulations end up with the vehicles in the same place
+    for vehicle in (step_main, step_side):
+        assert event_vehicles[vehicle]["lane_ref"] == step_vehicles[vehicle]["lane_ref"]
+        assert event_vehicles[vehicle]["position"] == pytest.approx(
+            step_vehicles[vehicle]["position"], abs=0.1
+        )
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_seeded_lane_choices_match_stepper(seed):
+    # GIVEN two copies of a T-junction with vehicles about to choose where to
+    # go at the junction
+    network = simple_t_junction_network()
+    step_vehicles = VehiclePositions()
+    vehicles = [
+        step_vehicles.create_vehicle(LaneRef("main_road_1", "a"), 90),
+        step_vehicles.create_vehicle(LaneRef("side_road", "b"), 95),
+    ]
+    event_vehicles = step_vehicles.copy()
+
+    # WHEN both are run with the same seed
+    stepper = Stepper(network, step_vehicles, seed=seed)
+    for _ in range(1000):
+        stepper.step(0.01)
+    engine = EventEngine(network, event_vehicles, seed=seed)
+    engine.advance(10)
+
+    # THEN the vehicles took the same lanes
+    for vehicle in vehicles:
+        assert event_vehicles[vehicle]["lane_ref"] == step_vehicles[vehicle]["lane_ref"]
@@ -0,0 +1,65 @@
+import pytest
+from junctions.hybrid import HybridStepper
+from junctions.network import LaneRef
+from junctions.state.vehicle_positions import VehiclePositions
+
+from tests.junctions.test_priority_wait import simple_t_junction_network
+
+
+def _vehicle_count(vehicle_positions: VehiclePositions) -> int:
+    return sum(data.shape[0] for _, data in vehicle_positions.group_by_lane())
+
+
+def test_vehicles_pass_through_detailed_junction():
+    # GIVEN a t-junction simulated in detail, with the roads around it in
+    # the queue model
+    network = simple_t_junction_network()
+    vehicles = VehiclePositions()
+    stepper = HybridStepper(
+        network,
+        vehicles,
+        ["tee"],
+        dt=0.5,
+        demand={LaneRef("main_road_1", "a"): 0.2, LaneRef("main_road_2", "b"): 0.2},
+        seed=1,
+    )
+
+    # WHEN I run for a while
+    seen_on_tee = 0
+    for _ in range(600):
+        stepper.step()
+        seen_on_tee = max(seen_on_tee, _vehicle_count(vehicles))
+
+    # THEN vehicles cross the junction as individual vehicles, and leave the
+    # network from the queue model
+    meso = stepper.meso
+    assert seen_on_tee > 0
+    assert all(lane_ref.junction == "tee" for lane_ref in vehicles.occupied_lanes())
+    assert meso.network_exits > 20
+
+    # ... and no vehicles are lost converting between the models
+    admitted = 0.2 * 2 * stepper.time - meso.pending.sum()
+    assert admitted == pytest.approx(
+        meso.network_exits
+        + meso.counts.sum()
+        + meso.boundary_outflow.sum()
+        + _vehicle_count(vehicles)
+    )
+
+
+def test_queue_model_waits_for_detailed_main_road():
+    # GIVEN the roads around a t-junction simulated in detail, with the
+    # junction itself in the queue model
+    network = simple_t_junction_network()
+    vehicles = VehiclePositions()
+    stepper = HybridStepper(network, vehicles, ["main_road_1"], dt=0.5)
+
+    # ... and a vehicle about to reach the junction on the main road
+    vehicles.create_vehicle(LaneRef("main_road_1", "a"), 98.0)
+
+    # WHEN I step
+    stepper.step()
+
+    # THEN lanes crossing the main road wait for it
+    assert stepper.meso.wait_flags[LaneRef("tee", "d")]
+    assert not stepper.meso.wait_flags[LaneRef("tee", "a")]
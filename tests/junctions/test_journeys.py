@@ -0,0 +1,87 @@
+import pickle
+
+import numpy as np
+import pytest
+from junctions.demand import Demand, DemandSource
+from junctions.journeys import JourneyTimes
+from junctions.network import LaneRef, Network
+from junctions.state.vehicle_positions import VehiclePositions
+from junctions.stepper import Stepper
+from junctions.types import Road
+
+from tests.junctions.test_priority_wait import simple_t_junction_network
+
+
+def two_road_network():
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 10, 5), "road1")
+    network.add_junction(Road((0, 10), 0, 20, 5), "road2")
+    network.connect_lanes(LaneRef("road1", "a"), LaneRef("road2", "a"))
+    return network
+
+
+def test_free_flow_journey_times():
+    # GIVEN two connected roads with light demand, and a stepper collecting
+    # journey times
+    network = two_road_network()
+    vehicles = VehiclePositions()
+    demand = Demand(
+        [DemandSource(LaneRef("road1", "a"), 0.2)], np.random.default_rng(0)
+    )
+    journeys = JourneyTimes(network)
+    stepper = Stepper(network, vehicles, demand=demand, journeys=journeys)
+    assert stepper.journeys is journeys
+
+    # WHEN I step
+    for _ in range(1000):
+        stepper.step(0.1)
+
+    # THEN every vehicle took the free flow time to drive both roads
+    origin, destination = LaneRef("road1", "a"), LaneRef("road2", "a")
+    assert list(journeys.pairs()) == [(origin, destination)]
+    sketch = journeys.sketch(origin, destination)
+    assert sketch.count > 5
+    assert journeys.quantiles(origin, destination, [0.5, 0.99]) == pytest.approx(
+        [3.0, 3.0], abs=0.15
+    )
+
+    # ... and only the vehicles still in the network have spawn times kept
+    assert journeys.in_progress == sum(
+        data.shape[0] for _, data in vehicles.group_by_lane()
+    )
+
+
+def test_merge_journeys_from_workers():
+    # GIVEN journey times from two runs of a t-junction, sent back from
+    # workers
+    network = simple_t_junction_network()
+    runs = []
+    for seed in (1, 2):
+        demand = Demand(
+            [
+                DemandSource(LaneRef("main_road_1", "a"), 0.3),
+                DemandSource(LaneRef("side_road", "b"), 0.3),
+            ],
+            rng=np.random.default_rng(seed),
+        )
+        journeys = JourneyTimes(network)
+        stepper = Stepper(
+            network, VehiclePositions(), demand=demand, seed=seed, journeys=journeys
+        )
+        for _ in range(1500):
+            stepper.step(0.1)
+        runs.append(pickle.loads(pickle.dumps(journeys)))
+
+    # WHEN I merge them
+    merged = JourneyTimes(network)
+    for journeys in runs:
+        merged.merge(journeys)
+
+    # THEN each origin and destination has the journeys of both runs
+    pairs = set(merged.pairs())
+    assert pairs == set(runs[0].pairs()) | set(runs[1].pairs())
+    assert len(pairs) > 1
+    for origin, destination in pairs:
+        assert merged.sketch(origin, destination).count == sum(
+            journeys.sketch(origin, destination).count for journeys in runs
+        )
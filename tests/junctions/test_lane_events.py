@@ -0,0 +1,145 @@
+import numpy as np
+import pytest
+from junctions.demand import Demand, DemandSource
+from junctions.lane_events import (
+    ENTRY,
+    EXIT,
+    LaneEventLog,
+    lane_flows,
+    lane_traversals,
+    mean_travel_times,
+    read_lane_events,
+    reconstruct_trajectories,
+    vehicle_id_words,
+)
+from junctions.network import LaneRef, Network
+from junctions.state.vehicle_positions import VehiclePositions
+from junctions.stepper import Stepper
+from junctions.types import Road
+
+from tests.junctions.test_priority_wait import simple_t_junction_network
+
+
+def two_road_network():
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 10, 5), "road1")
+    network.add_junction(Road((0, 10), 0, 20, 5), "road2")
+    network.connect_lanes(LaneRef("road1", "a"), LaneRef("road2", "a"))
+    return network
+
+
+def test_log_records_lane_entries_and_exits(tmp_path):
+    # GIVEN two connected roads with demand onto the first, and a stepper
+    # logging lane events in small chunks
+    network = two_road_network()
+    vehicles = VehiclePositions()
+    demand = Demand(
+        [DemandSource(LaneRef("road1", "a"), 0.5)], np.random.default_rng(2)
+    )
+    log = LaneEventLog(tmp_path / "events.bin", chunk_size=4)
+    stepper = Stepper(network, vehicles, demand=demand, lane_events=log)
+    assert stepper.lane_events is log
+
+    # WHEN I step, then close the log
+    for _ in range(300):
+        stepper.step(0.1)
+    log.close()
+    events = read_lane_events(tmp_path / "events.bin")
+
+    # THEN every event was written to the file
+    assert events.shape[0] == log.events > 4
+
+    # ... and vehicles still in the network have entered a lane without
+    # leaving it
+    traversals = lane_traversals(events)
+    ongoing = {
+        tuple(words) for words in traversals["id"][np.isnan(traversals["exit_time"])]
+    }
+    assert ongoing == {
+        vehicle_id_words(vehicle_id)
+        for _, data in vehicles.group_by_lane()
+        for vehicle_id in data["id"]
+    }
+
+    # ... and travel times are the free flow times at the speed limit
+    road1_a = network.lane_index(LaneRef("road1", "a"))
+    road2_a = network.lane_index(LaneRef("road2", "a"))
+    travel_times = mean_travel_times(traversals, network.lane_count())
+    assert travel_times[road1_a] == pytest.approx(1.0, abs=0.11)
+    assert travel_times[road2_a] == pytest.approx(2.0, abs=0.11)
+
+    # ... and every vehicle that left the network is counted in the flow
+    leaving = np.count_nonzero((events["kind"] == EXIT) & (events["lane"] == road2_a))
+    assert lane_flows(events, network.lane_count(), 0, 30)[road2_a] == pytest.approx(
+        leaving / 30
+    )
+    assert leaving == np.count_nonzero(
+        (events["kind"] == ENTRY) & (events["lane"] == road1_a)
+    ) - len(ongoing)
+
+
+def test_travel_times_include_waiting(tmp_path):
+    # GIVEN a t-junction with demand on every entry lane, and a lane event log
+    network = simple_t_junction_network()
+    vehicles = VehiclePositions()
+    demand = Demand(
+        [
+            DemandSource(LaneRef("main_road_1", "a"), 0.5),
+            DemandSource(LaneRef("side_road", "b"), 0.5),
+        ],
+        rng=np.random.default_rng(1),
+    )
+    log = LaneEventLog(tmp_path / "events.bin")
+    stepper = Stepper(network, vehicles, demand=demand, seed=1, lane_events=log)
+
+    # WHEN I step
+    for _ in range(400):
+        stepper.step(0.1)
+    log.close()
+    traversals = lane_traversals(read_lane_events(tmp_path / "events.bin"))
+
+    # THEN no lane is driven along quicker than at the speed limit
+    done = ~np.isnan(traversals["exit_time"])
+    lane_refs = sorted(network.all_lanes(), key=network.lane_index)
+    free_flow_times = np.array(
+        [
+            network.lane(lane_ref).length / network.speed_limit(lane_ref)
+            for lane_ref in lane_refs
+        ]
+    )
+    travel_times = traversals["exit_time"][done] - traversals["entry_time"][done]
+    assert done.any()
+    assert np.all(travel_times >= free_flow_times[traversals["lane"][done]] - 0.11)
+
+
+def test_reconstruct_trajectories(tmp_path):
+    # GIVEN a log of one vehicle driving along two roads
+    network = two_road_network()
+    log = LaneEventLog(tmp_path / "events.bin")
+    vehicles = VehiclePositions()
+    vehicle_id = vehicles.create_vehicle(LaneRef("road1", "a"), 0)
+    log.record(vehicle_id, network.lane_index(LaneRef("road1", "a")), ENTRY)
+    log.begin_step(1.5)
+    log.record(vehicle_id, network.lane_index(LaneRef("road1", "a")), EXIT)
+    log.record(vehicle_id, network.lane_index(LaneRef("road2", "a")), ENTRY)
+    log.close()
+
+    # WHEN I reconstruct its trajectory
+    trajectories = reconstruct_trajectories(
+        lane_traversals(read_lane_events(tmp_path / "events.bin")),
+        network,
+        np.arange(0, 3, 0.5),
+    )
+
+    # THEN it drives at the speed limit, waiting at the end of the first road
+    # until it left
+    assert trajectories["time"].tolist() == [0, 0.5, 1, 1.5, 2, 2.5]
+    assert (
+        trajectories["lane"].tolist()
+        == [network.lane_index(LaneRef("road1", "a"))] * 3
+        + [network.lane_index(LaneRef("road2", "a"))] * 3
+    )
+    assert trajectories["position"].tolist() == pytest.approx([0, 5, 10, 0, 5, 10])
+    assert {tuple(words) for words in trajectories["id"]} == {
+        vehicle_id_words(vehicle_id)
+    }
@@ -0,0 +1,97 @@
+import pytest
+from junctions.meso import MesoStepper
+from junctions.network import LaneRef, Network
+from junctions.types import Road
+
+from tests.junctions.test_priority_wait import simple_t_junction_network
+
+
+def test_steady_flow_along_road():
+    # GIVEN a 100m road at 10m/s, with 0.5 vehicles per second arriving
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 100, 5), label="road")
+    stepper = MesoStepper(network, dt=0.5, demand={LaneRef("road", "a"): 0.5})
+
+    # WHEN I run for a minute
+    stepper.run(60)
+
+    # THEN vehicles take 10s to cross, so there are 5 on the road and the
+    # rest have left
+    assert stepper.counts[0] == pytest.approx(5)
+    assert stepper.network_exits == pytest.approx(25)
+
+
+def test_capacity_limits_flow():
+    # GIVEN a road with more demand than its capacity (10m/s / 5m = 2/s)
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 100, 5), label="road")
+    stepper = MesoStepper(network, dt=0.5, demand={LaneRef("road", "a"): 3})
+
+    # WHEN I run for a minute
+    stepper.run(60)
+
+    # THEN the extra vehicles are held back outside the network
+    assert stepper.network_exits == pytest.approx(2 * 50)
+    assert stepper.pending[0] == pytest.approx(60)
+
+
+def test_wait_on_t_junction():
+    # GIVEN a t-junction with vehicles on the main road
+    network = simple_t_junction_network()
+    stepper = MesoStepper(network, dt=0.5)
+    stepper.add_vehicles([LaneRef("tee", "a")], [1])
+
+    # WHEN I step
+    stepper.step()
+
+    # THEN the lanes crossing the main road get a wait flag
+    wait_flags = stepper.wait_flags
+    assert wait_flags[LaneRef("tee", "d")]
+    assert wait_flags[LaneRef("tee", "e")]
+    assert wait_flags[LaneRef("tee", "f")]
+    assert not wait_flags[LaneRef("tee", "a")]
+    assert not wait_flags[LaneRef("tee", "b")]
+    assert not wait_flags[LaneRef("tee", "c")]
+
+    # ... and they can't be changed from outside
+    with pytest.raises(ValueError):
+        wait_flags[LaneRef("tee", "a")] = True
+
+
+def test_side_road_waits_for_main_road():
+    # GIVEN a t-junction with busy traffic along the main road, and traffic
+    # waiting to turn out of the side road
+    network = simple_t_junction_network()
+    stepper = MesoStepper(
+        network,
+        dt=0.5,
+        demand={LaneRef("main_road_1", "a"): 0.5, LaneRef("side_road", "b"): 0.5},
+    )
+
+    # WHEN I run for a while
+    stepper.run(120)
+
+    # THEN nothing gets out of the side road, and vehicles queue on it
+    side_road = network.lane_index(LaneRef("side_road", "b"))
+    assert stepper.lane_exits[side_road] == 0
+    assert stepper.queued[side_road] > 1
+    assert stepper.lane_exits[network.lane_index(LaneRef("tee", "a"))] > 10
+
+
+def test_boundary_outflow():
+    # GIVEN two connected roads, only the first simulated
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 100, 5), label="road1")
+    network.add_junction(Road((0, 100), 0, 100, 5), label="road2")
+    network.connect_lanes(LaneRef("road1", "a"), LaneRef("road2", "a"))
+    stepper = MesoStepper(
+        network, dt=0.5, demand={LaneRef("road1", "a"): 1}, junctions=["road1"]
+    )
+
+    # WHEN I run for a while
+    stepper.run(30)
+
+    # THEN the flow onto the second road is collected at the boundary
+    road2 = network.lane_index(LaneRef("road2", "a"))
+    assert stepper.boundary_outflow[road2] == pytest.approx(20)
+    assert stepper.counts[road2] == 0
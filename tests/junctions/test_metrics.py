@@ -0,0 +1,121 @@
+import pytest
+from junctions.metrics import TrafficMetrics
+from junctions.network import LaneRef, Network
+from junctions.state.vehicle_positions import VehiclePositions
+from junctions.state.wait_flags import WaitFlags
+from junctions.stepper import Stepper
+from junctions.types import Road
+
+
+def two_road_network():
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 10, 5), "road1")
+    network.add_junction(Road((0, 10), 0, 10, 5), "road2")
+    network.connect_lanes(LaneRef("road1", "a"), LaneRef("road2", "a"))
+    return network
+
+
+def test_metrics_count_exits():
+    # GIVEN two connected roads and a vehicle near the end of the first
+    network = two_road_network()
+    vehicles = VehiclePositions()
+    vehicles.create_vehicle(LaneRef("road1", "a"), 9)
+    metrics = TrafficMetrics(network)
+    stepper = Stepper(network, vehicles, metrics=metrics)
+    assert stepper.metrics is metrics
+
+    # WHEN the vehicle steps onto the second road
+    stepper.step(0.2)
+
+    # THEN it has exited the first lane and the first junction
+    road1_a = network.lane_index(LaneRef("road1", "a"))
+    road2_a = network.lane_index(LaneRef("road2", "a"))
+    assert metrics.lane_exits[road1_a] == 1
+    assert metrics.network_exits.sum() == 0
+    assert list(metrics.junction_exits) == [1, 0]
+
+    # WHEN it drives off the end of the network
+    for _ in range(10):
+        stepper.step(0.2)
+
+    # THEN it is counted as leaving the network
+    assert metrics.lane_exits[road2_a] == 1
+    assert metrics.network_exits[road2_a] == 1
+    assert list(metrics.junction_exits) == [1, 1]
+    assert metrics.elapsed == pytest.approx(2.2)
+    assert metrics.steps == 11
+    assert metrics.junction_throughput("road2") == pytest.approx(1 / 2.2)
+    assert metrics.lane_throughput(LaneRef("road1", "a")) == pytest.approx(1 / 2.2)
+
+
+def test_metrics_wait_time(monkeypatch):
+    # GIVEN a vehicle about to move onto a lane with a wait flag
+    network = two_road_network()
+    vehicles = VehiclePositions()
+    vehicles.create_vehicle(LaneRef("road1", "a"), 9)
+    metrics = TrafficMetrics(network)
+    stepper = Stepper(network, vehicles, metrics=metrics)
+
+    wait_flags = WaitFlags()
+    wait_flags[LaneRef("road2", "a")] = True
+    monkeypatch.setattr("junctions.stepper.priority_wait", lambda *_: wait_flags)
+
+    # WHEN it is held for several steps
+    for _ in range(5):
+        stepper.step(0.2)
+
+    # THEN the wait is recorded against the lane it is waiting on
+    road1_a = network.lane_index(LaneRef("road1", "a"))
+    assert metrics.wait_time[road1_a] == pytest.approx(1.0)
+    assert metrics.lane_exits[road1_a] == 0
+    assert metrics.mean_delay()[road1_a] == 0
+
+
+def test_metrics_queue_length():
+    # GIVEN a single road with vehicles bunched up
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 100, 5))
+    vehicles = VehiclePositions()
+    ids = [
+        vehicles.create_vehicle(LaneRef("road1", "a"), position)
+        for position in (0, 1, 2, 50)
+    ]
+    metrics = TrafficMetrics(network)
+    stepper = Stepper(network, vehicles, metrics=metrics)
+
+    # WHEN I step
+    stepper.step(0.1)
+
+    # THEN the vehicles held by the separation rule are queued
+    road1_a = network.lane_index(LaneRef("road1", "a"))
+    assert metrics.queue_length[road1_a] == 2
+    assert metrics.max_queue_length[road1_a] == 2
+    assert metrics.queue_time[road1_a] == pytest.approx(0.2)
+    assert metrics.mean_queue_length()[road1_a] == pytest.approx(2)
+
+    # WHEN the queue clears and I step again
+    vehicles.remove(ids[0])
+    vehicles.remove(ids[1])
+    stepper.step(0.1)
+
+    # THEN nothing is queued, but the longest queue is kept
+    assert metrics.queue_length[road1_a] == 0
+    assert metrics.max_queue_length[road1_a] == 2
+    assert metrics.queue_time[road1_a] == pytest.approx(0.2)
+
+
+def test_metrics_queue_length_of_lone_blocked_lead():
+    # GIVEN two connected roads, with a vehicle at the very start of the
+    # second and a lone vehicle near the end of the first
+    network = two_road_network()
+    vehicles = VehiclePositions()
+    vehicles.create_vehicle(LaneRef("road2", "a"), 0.0)
+    vehicles.create_vehicle(LaneRef("road1", "a"), 9.0)
+    metrics = TrafficMetrics(network)
+    stepper = Stepper(network, vehicles, metrics=metrics, lookahead=True)
+
+    # WHEN I step with lookahead
+    stepper.step(0.1)
+
+    # THEN the lead vehicle held by the vehicle ahead is counted as queued
+    assert metrics.queue_length[network.lane_index(LaneRef("road1", "a"))] == 1
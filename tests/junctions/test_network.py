@@ -2,6 +2,7 @@ import pytest
 from junctions.network import LaneRef, Network
 
 from tests.junctions.factories import ArcFactory, RoadFactory
+from tests.junctions.test_priority_wait import simple_t_junction_network
 
 
 def test_add_road_default_label():
@@ -153,6 +154,55 @@ def test_connectivity():
     assert network.connected_lanes(LaneRef("blah", "foo")) == ()
 
 
+def test_connection_weights():
+    # GIVEN a network with a lane connected to two others
+    network = Network()
+    for road in RoadFactory.build_batch(3):
+        network.add_junction(road)
+    network.connect_lanes(LaneRef("road1", "a"), LaneRef("road2", "a"), weight=7)
+    network.connect_lanes(LaneRef("road1", "a"), LaneRef("road3", "a"))
+    version = network.connection_version(LaneRef("road1", "a"))
+
+    # THEN the weights are in the same order as the connections
+    assert network.connection_weights(LaneRef("road1", "a")) == (7, 1)
+
+    # WHEN I change a weight
+    network.set_connection_weight(LaneRef("road1", "a"), LaneRef("road3", "a"), 3)
+
+    # THEN it is updated, and the lane's version changes
+    assert network.connection_weights(LaneRef("road1", "a")) == (7, 3)
+    assert network.connection_version(LaneRef("road1", "a")) != version
+
+    # AND I can't set the weight of lanes that aren't connected
+    with pytest.raises(ValueError):
+        network.set_connection_weight(LaneRef("road2", "a"), LaneRef("road3", "a"), 1)
+
+
+def test_wait_dependents():
+    # GIVEN a T-junction
+    network = simple_t_junction_network()
+
+    # THEN vehicles on a priority lane, or on a lane feeding one, affect the
+    # lanes that give way to it
+    main_road = LaneRef("main_road_1", "a")
+    assert set(network.wait_dependents(main_road)) == {
+        lane_ref
+        for lane_ref in network.all_lanes()
+        if set(network.priority_lanes(lane_ref))
+        & {main_road, *network.connected_lanes(main_road)}
+    }
+    assert network.wait_dependents(main_road)
+    assert not network.wait_dependents(LaneRef("main_road_2", "a"))
+
+    # WHEN a lane's priority lanes are overridden
+    network.set_priority_lanes(LaneRef("tee", "c"), [LaneRef("main_road_2", "a")])
+
+    # THEN the dependents follow
+    assert network.wait_dependents(LaneRef("main_road_2", "a")) == (
+        LaneRef("tee", "c"),
+    )
+
+
 def test_feeder_lanes():
     # GIVEN a network
     network = Network()
@@ -215,3 +265,19 @@ def test_custom_speed_limit_for_junction():
     assert network.speed_limit(LaneRef("road1", "b")) == pytest.approx(15)
     assert network.speed_limit(LaneRef("road2", "a")) == pytest.approx(5)
     assert network.speed_limit(LaneRef("road2", "b")) == pytest.approx(5)
+
+
+def test_lane_index():
+    # GIVEN a network with a road and an arc
+    network = Network()
+    network.add_junction(RoadFactory.build())
+    network.add_junction(ArcFactory.build())
+
+    # THEN every lane has a dense index in the order it was added
+    assert network.lane_count() == 4
+    assert [network.lane_index(lane) for lane in network.all_lanes()] == [0, 1, 2, 3]
+    assert network.lane_index(LaneRef("arc1", "a")) == 2
+
+    # ... AND unknown lanes are an error
+    with pytest.raises(KeyError):
+        network.lane_index(LaneRef("blah", "a"))
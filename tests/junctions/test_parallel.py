@@ -0,0 +1,94 @@
+import pytest
+from junctions.network import LaneRef
+from junctions.parallel import PartitionedStepper, partition_network
+from junctions.rng import counter_uniform
+from junctions.state.vehicle_positions import VehiclePositions
+from junctions.stepper import Stepper
+
+from tests.junctions.test_priority_wait import simple_t_junction_network
+
+
+def test_counter_uniform_is_deterministic():
+    # GIVEN the same seed and keys THEN the same number comes out
+    assert counter_uniform(1, 2, 3) == counter_uniform(1, 2, 3)
+
+    # AND different keys give different numbers, all in [0, 1)
+    values = [counter_uniform(1, key, 2**100 + key) for key in range(1000)]
+    assert len(set(values)) == 1000
+    assert all(0 <= value < 1 for value in values)
+
+
+def test_partition_covers_all_junctions():
+    # GIVEN a network
+    network = simple_t_junction_network()
+
+    # WHEN it is partitioned
+    partitions = partition_network(network, 2)
+
+    # THEN every junction is in exactly one region
+    assert len(partitions) == 2
+    assert sorted(sum(partitions, [])) == sorted(network.junction_labels())
+
+
+@pytest.mark.parametrize("parts", [2, 3])
+def test_partitioned_stepper_matches_stepper(parts):
+    # GIVEN a network with vehicles on every entry lane
+    network = simple_t_junction_network()
+    vehicles = VehiclePositions()
+    for lane_ref in (
+        LaneRef("main_road_1", "a"),
+        LaneRef("main_road_2", "b"),
+        LaneRef("side_road", "b"),
+    ):
+        for position in range(0, 100, 7):
+            vehicles.create_vehicle(lane_ref, float(position))
+
+    # WHEN it is stepped in a single process and in partitions with the same seed
+    single = vehicles.copy()
+    stepper = Stepper(network, single, seed=42)
+    with PartitionedStepper(network, vehicles, parts, seed=42) as parallel:
+        for _ in range(200):
+            stepper.step(0.1)
+            parallel.step(0.1)
+        result = parallel.collect()
+
+    # THEN the vehicles end up in the same places
+    expected = {
+        id: (lane_ref, position)
+        for lane_ref, data in single.group_by_lane()
+        for id, position in zip(data["id"], data["position"])
+    }
+    actual = {
+        id: (lane_ref, position)
+        for lane_ref, data in result.group_by_lane()
+        for id, position in zip(data["id"], data["position"])
+    }
+    assert actual == expected
+
+
+def test_partitioned_stepper_priority_lane_in_other_region():
+    # GIVEN a t-junction where turning into the side road has to give way to
+    # vehicles anywhere on the main road beyond the junction, which is in
+    # another region (and doesn't feed any other lane)
+    network = simple_t_junction_network()
+    network.set_priority_lanes(LaneRef("tee", "c"), [LaneRef("main_road_2", "a")])
+    vehicles = VehiclePositions()
+    for position in range(0, 100, 7):
+        vehicles.create_vehicle(LaneRef("main_road_1", "a"), float(position))
+    partitions = [["main_road_1", "tee"], ["main_road_2", "side_road"]]
+
+    # WHEN it is stepped in a single process and in partitions
+    single = vehicles.copy()
+    stepper = Stepper(network, single, seed=7)
+    with PartitionedStepper(network, vehicles, partitions, seed=7) as parallel:
+        for _ in range(100):
+            stepper.step(0.1)
+            parallel.step(0.1)
+        result = parallel.collect()
+
+    # THEN the vehicles end up in the same places, as the wait flag is set
+    # once vehicles are on the main road in the other region
+    for lane_ref in network.all_lanes():
+        assert result.positions_by_lane[lane_ref].tolist() == pytest.approx(
+            single.positions_by_lane[lane_ref].tolist()
+        )
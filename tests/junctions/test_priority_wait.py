@@ -148,3 +148,18 @@ def test_vehicle_on_feeder_lane():
     assert not wait_flags[LaneRef("tee", "a")]
     assert not wait_flags[LaneRef("tee", "b")]
     assert not wait_flags[LaneRef("tee", "c")]
+
+
+def test_priority_wait_follows_network_changes():
+    # GIVEN a T-junction with a vehicle on the side road, and the wait flags
+    # worked out once
+    network = simple_t_junction_network()
+    vehicles = VehiclePositions()
+    vehicles.create_vehicle(LaneRef("side_road", "b"), position=50)
+    assert not priority_wait(network, vehicles)[LaneRef("tee", "c")]
+
+    # WHEN the side road is made a priority lane of tee lane c
+    network.set_priority_lanes(LaneRef("tee", "c"), [LaneRef("side_road", "b")])
+
+    # THEN the vehicle on it makes that lane wait
+    assert priority_wait(network, vehicles)[LaneRef("tee", "c")]
@@ -0,0 +1,95 @@
+import time
+from time import perf_counter
+
+import pytest
+from junctions.network import LaneRef, Network
+from junctions.profiling import HISTOGRAM_BINS, PhaseStats, StepperStats
+from junctions.state.vehicle_positions import VehiclePositions
+from junctions.stepper import Stepper
+from junctions.types import Road
+
+
+def test_phase_stats_record():
+    # GIVEN phase stats
+    stats = PhaseStats("foo")
+
+    # WHEN I record some durations
+    stats.record(1e-7)
+    stats.record(2e-3)
+    stats.record(4e-3)
+    stats.record(100.0)
+
+    # THEN the totals are accumulated
+    assert stats.calls == 4
+    assert stats.total_time == pytest.approx(100.006, rel=1e-6)
+    assert stats.max_time == pytest.approx(100.0)
+
+    # ... AND each duration is counted in the histogram
+    assert stats.histogram.sum() == 4
+    assert stats.histogram[0] == 1
+    assert stats.histogram[HISTOGRAM_BINS - 1] == 1
+    edges = PhaseStats.histogram_bin_edges()
+    for duration in (2e-3, 4e-3):
+        bin_index = (edges <= duration).nonzero()[0][-1]
+        assert stats.histogram[bin_index] >= 1
+
+
+def test_stepper_without_stats():
+    # GIVEN a stepper created without stats
+    network = Network()
+    network.add_junction(Road((0, 0), 0, 100, 5))
+    stepper = Stepper(network, VehiclePositions())
+
+    # THEN there are no stats
+    stepper.step(0.1)
+    assert stepper.stats is None
+
+
+def test_stepper_records_phases():
+    # GIVEN a stepper with stats enabled
+    network = Network()
+    network.add_junction(Road((0, 0), 0, 100, 5))
+    vehicles = VehiclePositions()
+    vehicles.create_vehicle(LaneRef("road1", "a"), 0.0)
+    stats = StepperStats()
+    stepper = Stepper(network, vehicles, stats=stats)
+
+    # ... and a hook listening to the timings
+    hooked = []
+    stats.add_hook(lambda phase, start, duration: hooked.append(phase))
+
+    # WHEN I step a few times
+    for _ in range(3):
+        stepper.step(0.1)
+
+    # THEN every phase was timed on every step
+    assert stepper.stats is stats
+    for phase in StepperStats.PHASES:
+        assert stats[phase].calls == 3
+        assert stats[phase].total_time > 0
+    assert stats.total_time == pytest.approx(
+        sum(phase.total_time for phase in stats.phases())
+    )
+
+    # ... AND the hook saw every phase in order
+    assert hooked == list(StepperStats.PHASES) * 3
+
+    # WHEN I reset the stats
+    stats.reset()
+
+    # THEN they are cleared
+    assert all(phase.calls == 0 for phase in stats.phases())
+
+
+def test_hook_time_not_charged_to_next_phase():
+    # GIVEN stats with a slow hook
+    stats = StepperStats()
+    stats.add_hook(lambda phase, start, duration: time.sleep(0.05))
+
+    # WHEN I time two quick phases one after the other
+    t = stats.lap("priority_wait", perf_counter())
+    stats.lap("move_vehicles", t)
+
+    # THEN neither includes the time spent in the hook
+    assert stats["priority_wait"].total_time < 0.01
+    assert stats["move_vehicles"].total_time < 0.01
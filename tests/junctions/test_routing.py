@@ -0,0 +1,84 @@
+import numpy as np
+from junctions.network import LaneRef, Network
+from junctions.routing import ARRIVED, NO_ROUTE, Routes, RoutingTable
+from junctions.state.vehicle_positions import VehiclePositions
+from junctions.stepper import Stepper
+from junctions.types import Road
+
+from tests.junctions.test_priority_wait import simple_t_junction_network
+
+
+def test_routing_table_next_hops():
+    # GIVEN a t-junction network
+    network = simple_t_junction_network()
+
+    # WHEN I build a routing table to the side road
+    side_road = LaneRef("side_road", "a")
+    table = RoutingTable(network, [side_road])
+    destination = table.destination_index(side_road)
+
+    def next_hop(lane_ref):
+        return table.next_lanes(
+            np.array([network.lane_index(lane_ref)]), np.array([destination])
+        )[0]
+
+    # THEN vehicles on the main road turn into the side road
+    assert next_hop(LaneRef("main_road_1", "a")) == network.lane_index(
+        LaneRef("tee", "c")
+    )
+    assert next_hop(LaneRef("tee", "c")) == network.lane_index(side_road)
+    assert next_hop(side_road) == ARRIVED
+    # and there's no way back to the side road from the far end of the main road
+    assert next_hop(LaneRef("main_road_2", "a")) == NO_ROUTE
+
+
+def test_routing_prefers_quickest_route():
+    # GIVEN two routes from a to d, one short but slow
+    network = Network()
+    network.add_junction(Road((0, 0), 0, 10, 5), label="a", speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 10, 5), label="slow", speed_limit=1)
+    network.add_junction(Road((0, 0), 0, 50, 5), label="fast", speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 10, 5), label="d", speed_limit=10)
+    for middle in ("slow", "fast"):
+        network.connect_lanes(LaneRef("a", "a"), LaneRef(middle, "a"))
+        network.connect_lanes(LaneRef(middle, "a"), LaneRef("d", "a"))
+
+    # WHEN I route to d (by default, the lanes with nowhere to go)
+    table = RoutingTable(network)
+
+    # THEN the quickest route is taken
+    row = table.next_hops[table.destination_index(LaneRef("d", "a"))]
+    assert row[network.lane_index(LaneRef("a", "a"))] == network.lane_index(
+        LaneRef("fast", "a")
+    )
+
+
+def test_vehicles_follow_routes():
+    # GIVEN vehicles on the main road, one headed for the side road and one
+    # for the end of the main road
+    network = simple_t_junction_network()
+    routes = Routes(
+        RoutingTable(network, [LaneRef("side_road", "a"), LaneRef("main_road_2", "a")])
+    )
+    vehicles = VehiclePositions()
+    to_side = vehicles.create_vehicle(LaneRef("main_road_1", "a"), 95.0)
+    to_main = vehicles.create_vehicle(LaneRef("main_road_1", "a"), 80.0)
+    routes.set_destination(to_side, LaneRef("side_road", "a"))
+    routes.set_destination(to_main, LaneRef("main_road_2", "a"))
+
+    # WHEN stepped until they have driven through the junction
+    stepper = Stepper(network, vehicles, routes=routes)
+    for _ in range(150):
+        stepper.step(0.1)
+
+    # THEN each is on the way to its destination
+    assert vehicles[to_side]["lane_ref"] == LaneRef("side_road", "a")
+    assert vehicles[to_main]["lane_ref"] == LaneRef("main_road_2", "a")
+
+    # AND WHEN they reach the end of their destination lanes
+    for _ in range(300):
+        stepper.step(0.1)
+
+    # THEN they leave the network
+    assert routes.destination(to_side) is None
+    assert routes.destination(to_main) is None
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from junctions.sketch import QuantileSketch
+
+
+def test_quantiles_within_relative_accuracy():
+    # GIVEN a sketch of a skewed distribution
+    values = np.random.default_rng(0).lognormal(3, 1, 100_000)
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    sketch.add(values)
+
+    # THEN its quantiles are within the relative accuracy of the exact ones
+    assert sketch.count == values.shape[0]
+    for q in (0, 0.5, 0.95, 0.99, 1):
+        exact = np.quantile(values, q, method="lower")
+        assert sketch.quantile(q) == pytest.approx(exact, rel=0.0101)
+
+
+def test_merge_matches_adding_everything():
+    # GIVEN values split between two sketches, including zeros
+    values = np.concatenate(
+        (np.zeros(10), np.random.default_rng(1).exponential(20, 1000))
+    )
+    first = QuantileSketch()
+    first.add(values[::2])
+    second = QuantileSketch()
+    second.add(values[1::2])
+    everything = QuantileSketch()
+    everything.add(values)
+
+    # WHEN I merge them
+    first.merge(second)
+
+    # THEN the quantiles are the same as a sketch of every value
+    assert first.count == everything.count
+    for q in (0, 0.005, 0.5, 0.95, 0.99):
+        assert first.quantile(q) == everything.quantile(q)
+    assert first.quantile(0) == 0
+
+
+def test_bucket_count_is_bounded():
+    # GIVEN a sketch with few buckets, and values over a wide range
+    sketch = QuantileSketch(relative_accuracy=0.01, max_buckets=100)
+    values = np.geomspace(1e-3, 1e6, 10_000)
+
+    # WHEN I add them
+    sketch.add(values)
+
+    # THEN high quantiles are still accurate
+    assert sketch.quantile(0.99) == pytest.approx(
+        np.quantile(values, 0.99, method="lower"), rel=0.0101
+    )
+    assert np.isnan(QuantileSketch().quantile(0.5))
+
+
+def test_merge_needs_same_accuracy():
+    with pytest.raises(ValueError):
+        QuantileSketch(0.01).merge(QuantileSketch(0.02))
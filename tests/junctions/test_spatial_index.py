@@ -0,0 +1,100 @@
+import math
+
+import numpy as np
+import pytest
+from junctions.network import LaneRef, Network
+from junctions.spatial_index import LaneSpatialIndex
+from junctions.state.vehicle_positions import VehiclePositions
+from junctions.types import Road, Tee
+from numpy.testing import assert_allclose
+
+
+def two_roads_network():
+    network = Network()
+    # runs west-east along y = 0, b lane at y = 5
+    network.add_junction(Road((0, 0), math.pi / 2, 100, 5), "near")
+    # far away
+    network.add_junction(Road((1000, 1000), 0, 100, 5), "far")
+    return network
+
+
+def test_lanes_in_rect():
+    # GIVEN an index over two roads far apart
+    index = LaneSpatialIndex(two_roads_network())
+
+    # THEN I can find the lanes in a region
+    assert index.lanes_in_rect((10, -1, 20, 1)) == [LaneRef("near", "a")]
+    assert index.lanes_in_rect((10, -1, 20, 6)) == [
+        LaneRef("near", "a"),
+        LaneRef("near", "b"),
+    ]
+    assert set(index.lanes_in_rect((990, 990, 1010, 1010))) == {
+        LaneRef("far", "a"),
+        LaneRef("far", "b"),
+    }
+    assert index.lanes_in_rect((500, 500, 600, 600)) == []
+    assert len(index.lanes_in_rect((-1e6, -1e6, 1e6, 1e6))) == 4
+
+
+def test_nearest_lane():
+    # GIVEN an index over a T-junction
+    network = Network()
+    network.add_junction(Tee((0, 0), 0, 20, 5))
+    index = LaneSpatialIndex(network, cell_size=5)
+
+    # WHEN I look for the lane nearest to a point on the main road
+    found = index.nearest_lane(-0.5, 3, max_distance=2)
+
+    # THEN it is the a-lane
+    assert found is not None
+    assert found.lane_ref == LaneRef("tee1", "a")
+    assert found.position == pytest.approx(3)
+    assert found.distance == pytest.approx(0.5)
+
+    # ... and a point on an arc finds the arc lane
+    arc = network.lane(LaneRef("tee1", "c"))
+    point = arc.interpolate(arc.length / 2).point
+    found = index.nearest_lane(point.x, point.y, max_distance=1)
+    assert found is not None
+    assert found.lane_ref == LaneRef("tee1", "c")
+    assert found.position == pytest.approx(arc.length / 2, abs=0.1)
+
+    # ... but nothing is found far away
+    assert index.nearest_lane(100, 100, max_distance=5) is None
+
+
+def test_vehicle_points_follow_lane():
+    network = Network()
+    network.add_junction(Tee((0, 0), 0, 20, 5))
+    index = LaneSpatialIndex(network, segment_length=0.5)
+
+    lane = network.lane(LaneRef("tee1", "d"))
+    positions = np.linspace(0, lane.length, 7)
+    points = index.vehicle_points(LaneRef("tee1", "d"), positions)
+
+    expected = [tuple(lane.interpolate(float(p)).point) for p in positions]
+    assert_allclose(points, expected, atol=0.05)
+
+
+def test_vehicles_in_rect_and_picking():
+    # GIVEN some vehicles along a road
+    network = two_roads_network()
+    index = LaneSpatialIndex(network)
+    vehicles = VehiclePositions()
+    ids = [vehicles.create_vehicle(LaneRef("near", "a"), p) for p in (5, 25, 45)]
+    far_id = vehicles.create_vehicle(LaneRef("far", "a"), 50)
+
+    # WHEN I query a viewport over part of the road
+    found = list(index.vehicles_in_rect(vehicles, (0, -10, 30, 10)))
+
+    # THEN only the vehicles in view are returned
+    assert len(found) == 1
+    lane_ref, found_ids, found_positions = found[0]
+    assert lane_ref == LaneRef("near", "a")
+    assert list(found_ids) == ids[:2]
+    assert_allclose(found_positions, [5, 25])
+
+    # ... AND I can pick a vehicle by location
+    assert index.vehicle_at(vehicles, 24, 0.5, radius=2) == ids[1]
+    assert index.vehicle_at(vehicles, 1000, 1050, radius=2) == far_id
+    assert index.vehicle_at(vehicles, 35, 0, radius=2) is None
@@ -1,13 +1,19 @@
+import uuid
 from unittest.mock import patch
 
+import numpy as np
 import pytest
+from junctions.demand import Demand, DemandSource
+from junctions.journal import StepJournal
 from junctions.network import LaneRef, Network
+from junctions.rng import RandomStreams
 from junctions.state.vehicle_positions import VehiclePositions
 from junctions.state.wait_flags import WaitFlags
 from junctions.stepper import Stepper
 from junctions.types import Road
 
 from tests.junctions.factories import RoadFactory
+from tests.junctions.test_priority_wait import simple_t_junction_network
 
 
 def test_simple_step():
@@ -187,3 +193,397 @@ def test_stop_on_wait_flag():
             "lane_ref": LaneRef("road2", "a"),
             "position": pytest.approx(2.0),
         }
+
+
+def test_max_safe_dt_lane_end():
+    # GIVEN a vehicle 20m from the end of a road
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 100, 5))
+    vehicles = VehiclePositions()
+    vehicles.create_vehicle(LaneRef("road1", "a"), 80)
+
+    # THEN the safe time step is the time to reach the end
+    stepper = Stepper(network, vehicles)
+    assert stepper.max_safe_dt() == pytest.approx(2.0)
+
+
+def test_max_safe_dt_nothing_happening():
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 100, 5))
+    stepper = Stepper(network, VehiclePositions())
+    assert stepper.max_safe_dt() == float("inf")
+
+
+def test_max_safe_dt_closing_gap():
+    # GIVEN a vehicle waiting at the end of a lane and one approaching behind
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 100, 5))
+    vehicles = VehiclePositions()
+    vehicles.create_vehicle(LaneRef("road1", "a"), 100)
+    vehicles.create_vehicle(LaneRef("road1", "a"), 85)
+
+    # THEN the safe time step is the time to close up to the separation limit
+    stepper = Stepper(network, vehicles)
+    assert stepper.max_safe_dt() == pytest.approx(1.0, abs=1e-3)
+
+
+def test_advance_adaptive():
+    # GIVEN two connected roads and a vehicle on the first
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 100, 5), label="first_road")
+    network.add_junction(Road((0, 100), 0, 100, 5), label="second_road")
+    network.connect_lanes(LaneRef("first_road", "a"), LaneRef("second_road", "a"))
+    vehicles = VehiclePositions()
+    v1 = vehicles.create_vehicle(LaneRef("first_road", "a"), 0.0)
+    stepper = Stepper(network, vehicles)
+
+    # WHEN I advance with large steps allowed
+    steps = stepper.advance(15, max_dt=100)
+
+    # THEN only a couple of steps are needed, landing on the lane end
+    assert steps == 2
+    assert vehicles[v1] == {
+        "lane_ref": LaneRef("second_road", "a"),
+        "position": pytest.approx(50),
+    }
+
+    # ... AND the steps are limited by max_dt
+    assert stepper.advance(10, max_dt=1) == 10
+
+
+def test_advance_keeps_separation():
+    # GIVEN a queue forming behind a wait flag
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 100, 5), "road1")
+    network.add_junction(Road((0, 100), 0, 100, 5), "road2")
+    network.connect_lanes(LaneRef("road1", "a"), LaneRef("road2", "a"))
+    vehicles = VehiclePositions()
+    for position in (90, 50, 0):
+        vehicles.create_vehicle(LaneRef("road1", "a"), position)
+
+    mock_wait_flags = WaitFlags()
+    mock_wait_flags[LaneRef("road2", "a")] = True
+    with patch("junctions.stepper.priority_wait", return_value=mock_wait_flags):
+        # WHEN I advance in large steps
+        stepper = Stepper(network, vehicles)
+        steps = stepper.advance(30, max_dt=10)
+
+    # THEN the vehicles queue at the separation limit without overshooting
+    assert steps < 30
+    assert vehicles.positions_by_lane[LaneRef("road1", "a")] == pytest.approx(
+        [90, 95, 100], abs=0.01
+    )
+
+
+def test_advance_matches_fixed_steps_car_following():
+    # GIVEN a vehicle held by the separation limit behind a moving vehicle
+    results = []
+    for adaptive in (True, False):
+        network = Network()
+        network.add_junction(Road((0, 0), 0, 1000, 5), "road1")
+        vehicles = VehiclePositions()
+        for position in (0, 4):
+            vehicles.create_vehicle(LaneRef("road1", "a"), position)
+        stepper = Stepper(network, vehicles)
+
+        # WHEN I advance adaptively, or in small fixed steps
+        if adaptive:
+            stepper.advance(5.0, max_dt=1.0)
+        else:
+            for _ in range(500):
+                stepper.step(0.01)
+        results.append(vehicles.positions_by_lane[LaneRef("road1", "a")].tolist())
+
+    # THEN the follower sets off as soon as the gap opens up either way
+    assert results[0] == pytest.approx(results[1], abs=0.2)
+
+
+def test_threaded_step_matches_single_thread():
+    # GIVEN a network of connected roads, with plenty of vehicles on each
+    network = Network(default_speed_limit=5)
+    for i in range(8):
+        network.add_junction(Road((0, 100 * i), 0, 100, 5), label=f"road{i}")
+    for i in range(7):
+        network.connect_lanes(LaneRef(f"road{i}", "a"), LaneRef(f"road{i + 1}", "a"))
+        network.connect_lanes(LaneRef(f"road{i + 1}", "b"), LaneRef(f"road{i}", "b"))
+
+    vehicles = VehiclePositions()
+    for lane_ref in network.all_lanes():
+        for position in range(0, 100, 3):
+            vehicles.create_vehicle(lane_ref, float(position))
+
+    # WHEN it is stepped with and without a thread pool
+    single = vehicles.copy()
+    single_stepper = Stepper(network, single, seed=1)
+    threaded_stepper = Stepper(network, vehicles, seed=1, threads=4)
+    for _ in range(100):
+        single_stepper.step(0.1)
+        threaded_stepper.step(0.1)
+    threaded_stepper.close()
+
+    # THEN the results are the same
+    for lane_ref in network.all_lanes():
+        assert list(vehicles.ids_by_lane[lane_ref]) == list(
+            single.ids_by_lane[lane_ref]
+        )
+        assert list(vehicles.positions_by_lane[lane_ref]) == list(
+            single.positions_by_lane[lane_ref]
+        )
+
+
+def test_lookahead_stops_at_queue_on_next_lane():
+    # GIVEN two connected roads
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 100, 5), label="road1")
+    network.add_junction(Road((0, 100), 0, 100, 5), label="road2")
+    network.connect_lanes(LaneRef("road1", "a"), LaneRef("road2", "a"))
+
+    # ... with a vehicle at the very start of the second road, and one
+    # approaching the end of the first
+    vehicles = VehiclePositions()
+    tail = vehicles.create_vehicle(LaneRef("road2", "a"), 1.0)
+    lead = vehicles.create_vehicle(LaneRef("road1", "a"), 90.0)
+
+    # WHEN stepped with lookahead, with the tail vehicle held in place
+    stepper = Stepper(network, vehicles, lookahead=True)
+    for _ in range(20):
+        stepper.step(0.1)
+        vehicles.switch_lane(tail, LaneRef("road2", "a"), 1.0)
+
+    # THEN the lead vehicle stops short of the end of its lane, rather than
+    # moving onto the next lane on top of the tail vehicle
+    assert vehicles[lead]["lane_ref"] == LaneRef("road1", "a")
+    assert 100 - vehicles[lead]["position"] + 1.0 >= 4.0
+    assert 100 - vehicles[lead]["position"] + 1.0 < 5.0
+
+
+# Seeds for which the first 0, 1, 2 and 3 of the vehicles choose the open
+# branch, before one chooses the blocked one
+@pytest.mark.parametrize("seed, passed", [(0, 0), (5, 1), (2, 2), (10, 3)])
+def test_lookahead_uses_next_lane_of_each_lead(seed, passed):
+    # GIVEN a road that splits in two, with a vehicle held at the very start
+    # of one branch
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 100, 5), label="road1")
+    network.add_junction(Road((0, 100), 0, 100, 5), label="road2")
+    network.add_junction(Road((100, 100), 0, 100, 5), label="road3")
+    network.connect_lanes(LaneRef("road1", "a"), LaneRef("road2", "a"))
+    network.connect_lanes(LaneRef("road1", "a"), LaneRef("road3", "a"))
+
+    # ... and a line of vehicles on the road before it, with fixed IDs so
+    # their seeded lane choices are too
+    vehicles = VehiclePositions()
+    tail = vehicles.create_vehicle(LaneRef("road2", "a"), 1.0, id=uuid.UUID(int=100))
+    for i, position in enumerate((95.0, 80.0, 65.0, 50.0)):
+        vehicles.create_vehicle(
+            LaneRef("road1", "a"), position, id=uuid.UUID(int=i + 1)
+        )
+
+    # WHEN stepped with lookahead
+    stepper = Stepper(network, vehicles, seed=seed, lookahead=True)
+    for _ in range(100):
+        stepper.step(0.1)
+        vehicles.switch_lane(tail, LaneRef("road2", "a"), 1.0)
+
+    # THEN vehicles going to the open branch move on as each becomes the
+    # lead, and the first going to the blocked one stops before the end
+    assert list(vehicles.ids_by_lane[LaneRef("road2", "a")]) == [tail]
+    assert len(vehicles.ids_by_lane[LaneRef("road3", "a")]) == passed
+    road1 = vehicles.positions_by_lane[LaneRef("road1", "a")]
+    assert len(road1) == 4 - passed
+    assert 100 - road1[-1] + 1.0 >= 4.0
+
+
+@pytest.mark.parametrize("lookahead", [False, True])
+def test_free_flow_matches_stepping(lookahead):
+    # GIVEN a chain of roads, with a mix of bunched up and spread out
+    # vehicles on them
+    network = Network(default_speed_limit=5)
+    for i in range(6):
+        network.add_junction(Road((0, 100 * i), 0, 100, 5), label=f"road{i}")
+    for i in range(5):
+        network.connect_lanes(LaneRef(f"road{i}", "a"), LaneRef(f"road{i + 1}", "a"))
+        network.connect_lanes(LaneRef(f"road{i + 1}", "b"), LaneRef(f"road{i}", "b"))
+
+    vehicles = VehiclePositions()
+    for i, lane_ref in enumerate(network.all_lanes()):
+        spacing = 3.0 if i % 3 == 0 else 12.0
+        for j in range(4):
+            vehicles.create_vehicle(lane_ref, 10.0 + j * spacing)
+
+    # WHEN it is stepped with and without free flow
+    stepped = vehicles.copy()
+    stepper = Stepper(network, stepped, seed=1, lookahead=lookahead)
+    free_flow_stepper = Stepper(
+        network, vehicles, seed=1, lookahead=lookahead, free_flow=True
+    )
+    free_flow_lanes = 0
+    for _ in range(300):
+        stepper.step(0.1)
+        free_flow_stepper.step(0.1)
+        free_flow_lanes = max(
+            free_flow_lanes,
+            sum(vehicles.is_free_flow(lane) for lane in network.all_lanes()),
+        )
+
+    # THEN lanes were put in free flow, and the vehicles end up the same
+    assert free_flow_lanes > 0
+    for lane_ref in network.all_lanes():
+        assert list(vehicles.ids_by_lane[lane_ref]) == list(
+            stepped.ids_by_lane[lane_ref]
+        )
+        assert vehicles.positions_by_lane[lane_ref] == pytest.approx(
+            stepped.positions_by_lane[lane_ref], abs=1e-3
+        )
+
+
+def test_journal_tracks_changes():
+    # GIVEN a t-junction with demand, and a stepper keeping a journal
+    network = simple_t_junction_network()
+    vehicles = VehiclePositions()
+    demand = Demand(
+        [
+            DemandSource(LaneRef("main_road_1", "a"), 0.5),
+            DemandSource(LaneRef("side_road", "b"), 0.5),
+        ],
+        rng=np.random.default_rng(1),
+    )
+    journal = StepJournal()
+    stepper = Stepper(network, vehicles, demand=demand, seed=1, journal=journal)
+
+    # WHEN I step, keeping track of the vehicles and wait flags using only
+    # the journal
+    lanes: dict = {}
+    flags = np.zeros(network.lane_count(), dtype=bool)
+    transitions = flips = 0
+    for _ in range(400):
+        stepper.step(0.1)
+        for vehicle_id in journal.spawned:
+            lanes[vehicle_id] = None
+        for vehicle_id, to_lane in zip(journal.transition_ids, journal.transition_to):
+            lanes[vehicle_id] = to_lane
+        for vehicle_id in journal.removed:
+            del lanes[vehicle_id]
+        flags[journal.flipped_lanes] = journal.flipped_to
+        transitions += len(journal.transition_ids)
+        flips += len(journal.flipped_lanes)
+
+    # THEN they match the stepper
+    assert transitions > 0 and flips > 0
+    assert stepper.wait_flags is not None
+    assert flags.tolist() == stepper.wait_flags.flags.tolist()
+    assert set(lanes) == {
+        vehicle_id for _, data in vehicles.group_by_lane() for vehicle_id in data["id"]
+    }
+    for vehicle_id, lane_index in lanes.items():
+        if lane_index is not None:
+            lane_ref = vehicles[vehicle_id]["lane_ref"]
+            assert network.lane_index(lane_ref) == lane_index
+
+
+def test_run_yields_frames():
+    # GIVEN a road with a vehicle on it
+    network = Network(default_speed_limit=10)
+    network.add_junction(Road((0, 0), 0, 100, 5), label="road")
+    vehicles = VehiclePositions()
+    vehicle_id = vehicles.create_vehicle(LaneRef("road", "a"), 0.0)
+    stepper = Stepper(network, vehicles)
+
+    # WHEN I run it, taking a frame every 5 steps
+    frames = []
+    for frame in stepper.run(duration=2, dt=0.1, every=5):
+        ((lane_ref, positions, ids),) = frame.lanes()
+        frames.append((frame.time, frame.step, lane_ref, float(positions[0])))
+        assert ids[0] == vehicle_id
+        assert not positions.flags.writeable
+        assert not frame.positions(lane_ref).flags.writeable
+        assert not frame.ids(lane_ref).flags.writeable
+        assert frame.wait_flags.shape == (network.lane_count(),)
+
+    # THEN there is a frame every half second
+    assert [(t, step) for t, step, _, _ in frames] == pytest.approx(
+        [(0.5, 5), (1.0, 10), (1.5, 15), (2.0, 20)]
+    )
+    assert [position for _, _, _, position in frames] == pytest.approx([5, 10, 15, 20])
+
+
+@pytest.mark.parametrize("every", [0, -1])
+def test_run_rejects_every_less_than_one(every):
+    # GIVEN a stepper
+    network = Network()
+    network.add_junction(Road((0, 0), 0, 100, 5), label="road")
+    stepper = Stepper(network, VehiclePositions())
+
+    # WHEN I run it with frames less than a step apart THEN it raises
+    with pytest.raises(ValueError):
+        next(stepper.run(duration=1, dt=0.1, every=every))
+
+
+def test_rng_makes_unseeded_lane_choices_repeatable():
+    # GIVEN a T-junction with vehicles heading into it
+    network = simple_t_junction_network()
+    vehicles = VehiclePositions()
+    for position in (10.0, 30.0, 50.0, 70.0, 90.0):
+        vehicles.create_vehicle(LaneRef("main_road_1", "a"), position)
+        vehicles.create_vehicle(LaneRef("side_road", "b"), position)
+
+    # WHEN it is run twice with generators seeded the same way
+    lanes = []
+    for _ in range(2):
+        run = vehicles.copy()
+        stepper = Stepper(network, run, rng=np.random.default_rng(5))
+        for _ in range(100):
+            stepper.step(0.1)
+        lanes.append(
+            {
+                lane_ref: list(run.ids_by_lane[lane_ref])
+                for lane_ref in network.all_lanes()
+            }
+        )
+
+    # THEN the vehicles end up on the same lanes
+    assert lanes[0] == lanes[1]
+
+
+def test_streams_give_common_lane_choices():
+    # GIVEN two variants of a t-junction, one without any priority rules,
+    # and the same random streams for each
+    choices = []
+    for priorities in (True, False):
+        network = simple_t_junction_network()
+        if not priorities:
+            for lane_ref in network.all_lanes():
+                network.set_priority_lanes(lane_ref, ())
+        streams = RandomStreams(11)
+        demand = Demand(
+            [
+                DemandSource(LaneRef("main_road_1", "a"), 0.3),
+                DemandSource(LaneRef("side_road", "b"), 0.3),
+            ],
+            streams=streams,
+        )
+        journal = StepJournal()
+        stepper = Stepper(
+            network, VehiclePositions(), demand=demand, streams=streams, journal=journal
+        )
+
+        # WHEN I step, noting which lane each vehicle turns onto from the
+        # main road
+        main_road = network.lane_index(LaneRef("main_road_1", "a"))
+        chosen = {}
+        for _ in range(1000):
+            stepper.step(0.1)
+            for vehicle_id, from_lane, to_lane in zip(
+                journal.transition_ids, journal.transition_from, journal.transition_to
+            ):
+                if from_lane == main_road:
+                    chosen[vehicle_id] = to_lane
+        choices.append(chosen)
+
+    # THEN the same vehicles turned the same way in both
+    common = choices[0].keys() & choices[1].keys()
+    assert len(common) > 5
+    assert len(set(choices[0].values())) == 2
+    assert all(
+        choices[0][vehicle_id] == choices[1][vehicle_id] for vehicle_id in common
+    )
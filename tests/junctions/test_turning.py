@@ -0,0 +1,73 @@
+import uuid
+
+import numpy as np
+import pytest
+from junctions.network import LaneRef
+from junctions.turning import AliasTable, LaneChooser, TurningTables
+
+from tests.junctions.test_priority_wait import simple_t_junction_network
+
+
+def test_alias_table_distribution():
+    # GIVEN an alias table for some weights
+    table = AliasTable([7, 3, 0, 10])
+
+    # WHEN sampled many times
+    rng = np.random.default_rng(1)
+    samples = table.sample(rng.random(200_000))
+
+    # THEN the frequencies match the weights
+    frequencies = np.bincount(samples, minlength=4) / samples.shape[0]
+    assert frequencies == pytest.approx([0.35, 0.15, 0, 0.5], abs=0.005)
+
+
+def test_alias_table_single_sample_matches_vector():
+    table = AliasTable([1, 2, 3])
+    u = np.linspace(0, 0.999, 1000)
+    assert [table.sample_one(x) for x in u] == table.sample(u).tolist()
+
+
+def test_alias_table_needs_positive_weights():
+    with pytest.raises(ValueError):
+        AliasTable([0, 0])
+
+
+def test_turning_tables_rebuilt_on_weight_change():
+    # GIVEN turning tables for a network
+    network = simple_t_junction_network()
+    turning = TurningTables(network)
+    main_road = LaneRef("main_road_1", "a")
+    side_road = LaneRef("side_road", "b")
+    main_table = turning.table(main_road)
+    side_table = turning.table(side_road)
+
+    # WHEN one lane's weights change
+    network.set_connection_weight(main_road, LaneRef("tee", "c"), 3)
+
+    # THEN only that lane's table is rebuilt
+    assert turning.table(main_road) is not main_table
+    assert turning.table(side_road) is side_table
+
+    # AND choices follow the new weights (straight on 1 : 3 turning)
+    choices = [turning.choose(main_road, u) for u in np.linspace(0, 0.999, 1000)]
+    assert choices.count(LaneRef("tee", "c")) == pytest.approx(750, abs=5)
+
+
+def test_lane_chooser_seeded_choices_repeat():
+    # GIVEN two lane choosers with the same seed
+    network = simple_t_junction_network()
+    choosers = [LaneChooser(network, seed=3) for _ in range(2)]
+    lane_ref = LaneRef("main_road_1", "a")
+
+    # WHEN they choose for the same vehicles
+    choices = [
+        [chooser.choose(lane_ref, uuid.UUID(int=i)) for i in range(50)]
+        for chooser in choosers
+    ]
+
+    # THEN they choose the same lanes, using more than one of them
+    assert choices[0] == choices[1]
+    assert len(set(choices[0])) > 1
+
+    # ... and there is no choice at the end of the network
+    assert choosers[0].choose(LaneRef("main_road_2", "a"), uuid.UUID(int=1)) is None
@@ -7,8 +7,13 @@ import pyglet
 import pytest
 from imageio import imwrite
 from imageio.v3 import imread
-from junctions.network import Network
-from viewer.network_renderer import NetworkRenderer
+from junctions.network import LaneRef, Network
+from junctions.state.wait_flags import WaitFlags
+from viewer.network_renderer import (
+    DEFAULT_LANE_COLOR,
+    WAIT_LANE_COLOR,
+    NetworkRenderer,
+)
 
 from tests.junctions.factories import ArcFactory, RoadFactory
 
@@ -82,3 +87,22 @@ def test_render_road_arc(reference_render: ReferenceRender, _fuzz):
 
     # THEN the network is as expected
     reference_render.assert_screenshots_match()
+
+
+@pytest.mark.skipif(SKIP_RENDERING_TESTS, reason="SKIP_RENDERING_TESTS env set")
+def test_update_wait_flags(pyglet_win):
+    # GIVEN a road rendered with the wait flag set on lane a
+    network = Network()
+    network.add_junction(RoadFactory.build(), "road")
+    wait_flags = WaitFlags(network)
+    wait_flags[LaneRef("road", "a")] = True
+    renderer = NetworkRenderer(network, wait_flags)
+
+    # WHEN the flag moves to lane b
+    wait_flags[LaneRef("road", "a")] = False
+    wait_flags[LaneRef("road", "b")] = True
+    renderer.update_wait_flags(wait_flags)
+
+    # THEN the lanes are recoloured
+    assert renderer._lane_shapes[0][0].color == DEFAULT_LANE_COLOR
+    assert renderer._lane_shapes[1][0].color == WAIT_LANE_COLOR